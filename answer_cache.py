@@ -0,0 +1,181 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from sqlite_cache import transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS follow_up_answers (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    roadmap_hash TEXT NOT NULL,
+    question_key TEXT NOT NULL,
+    question     TEXT NOT NULL,
+    answer       TEXT NOT NULL,
+    embedding    BLOB,
+    created_at   REAL NOT NULL,
+    accessed_at  REAL NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (roadmap_hash, question_key)
+);
+CREATE INDEX IF NOT EXISTS idx_follow_up_answers_lru ON follow_up_answers (accessed_at);
+"""
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases a question and drops punctuation and extra whitespace ("How long?" == "how long")."""
+    return " ".join(_PUNCTUATION.sub(" ", (question or "").lower()).split())
+
+
+class FollowUpAnswerCache:
+    """
+    Caches follow-up answers by (roadmap content hash, question).
+
+    A lookup first tries the exact normalized question, which needs no embedding call. If the
+    roadmap already has cached answers, the question is embedded and compared with the questions
+    asked about the same roadmap; the closest one is a hit when its cosine similarity reaches
+    `threshold`. Questions are only ever matched against the same roadmap, so a handful of
+    vectors are compared per lookup and no index is kept.
+
+    Entries live in SQLite, so they survive restarts and are shared by worker processes.
+    Entries older than `ttl` or beyond `max_entries` (least recently used first) are evicted.
+
+    Args:
+        path (str): SQLite file backing the cache.
+        embed (Callable[[str], list]): Function returning the embedding vector of a question, or
+                                       None to match exact (normalized) questions only.
+        threshold (float): Minimum cosine similarity (0..1) for a paraphrase hit.
+        ttl (float): Seconds an answer is served.
+        max_entries (int): Maximum number of cached answers.
+    """
+
+    # Most recent questions per roadmap compared against a paraphrase
+    MAX_CANDIDATES = 200
+
+    def __init__(self, path: str, embed: Optional[Callable[[str], list]] = None, threshold: float = 0.93,
+                 ttl: float = 7 * 24 * 3600, max_entries: int = 20000):
+        self.path = path
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # Best similarity of recent paraphrase lookups and whether it was accepted, for threshold tuning
+        self._recent_scores = deque(maxlen=200)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def _vector(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embed(question), dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _hit(self, row_id: int, answer: str) -> str:
+        self._conn().execute(
+            "UPDATE follow_up_answers SET accessed_at = ?, hits = hits + 1 WHERE id = ?", (time.time(), row_id)
+        )
+        return answer
+
+    def lookup(self, roadmap_hash: str, question: str) -> Tuple[Optional[str], float]:
+        """
+        Finds a cached answer to the question about the roadmap.
+
+        Returns:
+            Tuple[Optional[str], float]: The cached answer (or None on a miss) and the similarity
+            of the closest cached question (1.0 for an exact match, 0.0 if none was compared).
+        """
+        self._count("lookups")
+        conn = self._conn()
+        oldest = time.time() - self.ttl
+        row = conn.execute(
+            "SELECT id, answer FROM follow_up_answers WHERE roadmap_hash = ? AND question_key = ? AND created_at >= ?",
+            (roadmap_hash, normalize_question(question), oldest),
+        ).fetchone()
+        if row is not None:
+            self._count("exact_hits")
+            return self._hit(*row), 1.0
+
+        if self.embed is None:
+            self._count("misses")
+            return None, 0.0
+        rows = conn.execute(
+            "SELECT id, answer, embedding FROM follow_up_answers "
+            "WHERE roadmap_hash = ? AND created_at >= ? AND embedding IS NOT NULL "
+            "ORDER BY accessed_at DESC LIMIT ?",
+            (roadmap_hash, oldest, self.MAX_CANDIDATES),
+        ).fetchall()
+        if not rows:
+            # Nothing asked about this roadmap yet, so there is no point embedding the question
+            self._count("misses")
+            return None, 0.0
+
+        vector = self._vector(question)
+        matrix = np.stack([np.frombuffer(blob, dtype="float32") for _, _, blob in rows])
+        scores = matrix @ vector
+        best_index = int(np.argmax(scores))
+        best = float(scores[best_index])
+        accepted = best >= self.threshold
+        with self._lock:
+            self._recent_scores.append((round(best, 4), accepted))
+        if accepted:
+            self._count("semantic_hits")
+            row_id, answer, _ = rows[best_index]
+            return self._hit(row_id, answer), best
+        self._count("misses")
+        return None, best
+
+    def store(self, roadmap_hash: str, question: str, answer: str):
+        """Caches an answer and evicts expired or least recently used entries."""
+        vector = None
+        if self.embed is not None:
+            try:
+                vector = self._vector(question).tobytes()
+            except Exception as e:
+                # Still useful for exact repeats of the question
+                print(f"🔴 Could not embed follow-up question for the answer cache: {e}")
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO follow_up_answers "
+                "(roadmap_hash, question_key, question, answer, embedding, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (roadmap_hash, normalize_question(question), question, answer, vector, now, now),
+            )
+            evicted = conn.execute(
+                "DELETE FROM follow_up_answers WHERE created_at < ? OR id IN "
+                "(SELECT id FROM follow_up_answers ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl, self.max_entries),
+            ).rowcount
+        self._count("stores")
+        self._count("evictions", evicted)
+
+    def stats(self) -> Dict:
+        """Returns hit/miss counters, the hit rate and recent best similarity scores."""
+        with self._lock:
+            stats = dict(self._stats)
+            recent = list(self._recent_scores)
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        stats["recent_similarities"] = [{"similarity": score, "hit": hit} for score, hit in recent[-50:]]
+        return stats
@@ -1,9 +1,9 @@
 import streamlit as st
-import re
 import os # Import os to check for prompts directory
 
 # Import agents
-from roadmap_agent import generate_roadmap
+from roadmap_agent import ROADMAP_MODES, stream_roadmap
+from roadmap_parser import Section, format_special_body, parse_roadmap
 from course_search import search_courses
 from course_ranker_agent import rank_courses
 from follow_up_agent import answer_follow_up_question
@@ -280,6 +280,30 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+def render_section_fields(section: Section):
+    """Render the labelled components (topics, time, tools, ...) of a learning section."""
+    for label, value in section.fields.items():
+        if value:
+            st.markdown(f"**{label}:** {value}")
+
+
+def render_special_section(section: Section):
+    """Render career guidance or the total time estimate directly, with basic markdown formatting."""
+    st.markdown(f'<div class="special-section"><h3>{section.heading}</h3><div class="section-content">', unsafe_allow_html=True)
+    # Apply basic markdown to the content (bolding, lists)
+    st.markdown(format_special_body(section.body), unsafe_allow_html=True)
+    st.markdown('</div></div>', unsafe_allow_html=True)
+
+
+def render_section_preview(section: Section):
+    """Render a section while the roadmap is still streaming (no widgets, so no duplicate keys)."""
+    if section.kind != "section":
+        render_special_section(section)
+    else:
+        st.markdown(f"#### {section.heading}")
+        render_section_fields(section)
+
+
 def render_sample_tree():
     """Render an example interactive tree using ECharts."""
     tree_data = {
@@ -353,8 +377,8 @@ user_goal = st.text_area("💬 What do you want to learn?", placeholder="e.g. I
 st.markdown("#### Select Roadmap Style")
 st.session_state.mode = st.radio(
     "Choose Path Type:",
-    ["Beginner → Expert", "Job-Ready in 90 Days"],
-    index=0 if st.session_state.mode == "Beginner → Expert" else 1,
+    list(ROADMAP_MODES),
+    index=ROADMAP_MODES.index(st.session_state.mode) if st.session_state.mode in ROADMAP_MODES else 0,
     key="mode_radio",
 )
 
@@ -379,9 +403,31 @@ if st.button("🎯 Generate Roadmap", use_container_width=True):
     if user_goal.strip() == "":
         st.warning("Please enter a valid goal.")
     else:
-        with st.spinner("🛠️ Crafting your custom roadmap with Gemini..."):
-            goal_with_mode = f"{user_goal} ({st.session_state.mode})"
-            st.session_state.roadmap = generate_roadmap(goal_with_mode)
+        # Stream the roadmap: each section is shown as soon as Gemini has finished writing it
+        status = st.empty()
+        status.info("🛠️ Crafting your custom roadmap with Gemini...")
+        preview = st.empty()
+        draft = st.empty()
+        streamed_sections = []
+        partial = ""  # Text of the section currently being written
+        for event in stream_roadmap(user_goal, st.session_state.mode):
+            if event["type"] == "token":
+                partial += event["text"]
+                draft.markdown(partial)
+            elif event["type"] == "section":
+                streamed_sections.append(event["section"])
+                partial = partial.split(event["section"].raw, 1)[-1].lstrip()
+                draft.markdown(partial)
+                with preview.container():
+                    for section in streamed_sections:
+                        render_section_preview(section)
+            else:
+                st.session_state.roadmap = event["roadmap"]
+        # The full interactive roadmap is rendered below; drop the streaming preview
+        status.empty()
+        preview.empty()
+        draft.empty()
+        if st.session_state.roadmap:
             st.session_state.goal_updated = False
             st.session_state.completed_sections = 0
             # Reset course display and ranking on new roadmap generation
@@ -403,130 +449,32 @@ if st.session_state.roadmap:
             st.session_state.show_ranked_courses = st.toggle("✨ Rank courses with AI", value=st.session_state.show_ranked_courses, key="rank_courses_toggle")
 
 
-# --- Helper function to parse roadmap section content ---
-def parse_roadmap_section_content(content: str) -> dict:
-    """
-    Parses the raw content of a roadmap section into structured components.
-    Assumes content follows the format:
-    **Topics to Cover:** ...
-    **Estimated Time:** ...
-    **Key Tools/Technologies:** ...
-    **Mini-Projects/Exercises:** ...
-    **Resources/Learning Strategies:** ...
-    """
-    parsed_data = {
-        "Topics to Cover": "",
-        "Estimated Time": "",
-        "Key Tools/Technologies": "",
-        "Mini-Projects/Exercises": "",
-        "Resources/Learning Strategies": ""
-    }
-
-    # Define the markers based on your prompt's bolded labels
-    markers = {
-        "Topics to Cover": "**Topics to Cover:**",
-        "Estimated Time": "**Estimated Time:**",
-        "Key Tools/Technologies": "**Key Tools/Technologies:**",
-        "Mini-Projects/Exercises": "**Mini-Projects/Exercises:**",
-        "Resources/Learning Strategies": "**Resources/Learning Strategies:**"
-    }
-
-    # Create a single string with content and markers for easier splitting
-    temp_content = content
-    for key, marker in markers.items():
-        temp_content = temp_content.replace(marker, f"---SPLIT_{key.replace(' ', '_').upper()}---")
-
-    # Split by the custom markers
-    parts = re.split(r'---SPLIT_([A-Z_]+)---', temp_content)
-
-    # The first part is usually before the first marker, which we ignore
-    # Iterate through parts, looking for our markers and then assigning the subsequent text
-    current_key_name = None
-    for i, part in enumerate(parts):
-        if i % 2 == 1: # This is a marker (e.g., "TOPICS_TO_COVER")
-            # Convert marker back to original key name
-            current_key_name = part.replace('_', ' ').title()
-            if current_key_name not in parsed_data: # Handle unexpected markers
-                current_key_name = None
-        elif current_key_name: # This is the content following a marker
-            parsed_data[current_key_name] = part.strip()
-            current_key_name = None # Reset for the next marker
-
-    return parsed_data
-
-
 if st.session_state.roadmap:
     roadmap_str = str(st.session_state.roadmap)
     st.markdown("## 🧭 Your Personalized Roadmap", unsafe_allow_html=True)
 
-    # Split the roadmap into sections based on potential headings and career guidance
-    # The regex tries to capture Level X: ... or **Career Guidance & Next Steps:**
-    # It also captures the Total Estimated Time as a separate section if it's at the end
-    sections_raw = re.split(r'\n{2,}(?=(?:Level|Phase|Module)\s*\d+[:\-]|\*{2}Career Guidance & Next Steps\*{2}|Total Estimated Time for Roadmap:)', roadmap_str.strip())
+    # Split the roadmap into Level/Phase/Module sections, career guidance and the total time estimate
+    # Parsed once per roadmap; reruns (every widget click) reuse the memoized result
+    sections = parse_roadmap(roadmap_str).sections
 
-    total_sections = sum(
-        1
-        for s in sections_raw
-        if not re.search(r"Career Guidance & Next Steps|Total Estimated Time for Roadmap:", s)
-    )
+    total_sections = sum(1 for s in sections if s.kind == "section")
     progress_pct = int(
         (st.session_state.completed_sections / total_sections) * 100
     ) if total_sections else 0
     st.progress(progress_pct / 100, text=f"{progress_pct}% complete")
     
     # Process each section
-    for idx, section_text in enumerate(sections_raw):
-        section_text = section_text.strip()
-        if not section_text:
-            continue
-
-        # Extract the heading for the expander or direct display
-        heading_match = re.match(r'^(.*?)(?:\n|$)', section_text)
-        display_heading = "Roadmap Section"
-        if heading_match:
-            display_heading = heading_match.group(1).strip()
-            # Clean up the display heading (remove markdown bolding, emojis for the expander title)
-            display_heading = re.sub(r'[\*#\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002702-\U000027B0\U000024C2-\U0001F251]', '', display_heading, flags=re.UNICODE).strip()
-            # Remove "Estimated Time: (X-Y weeks)" from the expander title if present
-            display_heading = re.sub(r'Estimated Time:.*', '', display_heading).strip()
-            display_heading = re.sub(r'Total Time Estimate:.*', '', display_heading).strip()
-
-        # Check if it's the Career Guidance section or Total Time Estimate section
-        is_career_guidance = "Career Guidance & Next Steps" in display_heading
-        is_total_time = "Total Estimated Time for Roadmap:" in section_text
-        
-        if is_career_guidance or is_total_time:
-            # For career guidance and total time, display directly without an expander,
-            # but still apply basic markdown formatting
-            st.markdown(f'<div class="special-section"><h3>{display_heading}</h3><div class="section-content">', unsafe_allow_html=True)
-            # Get content after the heading
-            content_to_display = section_text.replace(heading_match.group(0), '', 1).strip() if heading_match else section_text
-            # Apply basic markdown to the content (bolding, lists)
-            content_to_display = re.sub(r'\*\*\*(.*?)\*\*\*', r'<strong>\1</strong>', content_to_display)
-            content_to_display = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', content_to_display)
-            content_to_display = re.sub(r'^\s*([*-])\s*(.*)', r'- \2', content_to_display, flags=re.MULTILINE)
-            st.markdown(content_to_display, unsafe_allow_html=True)
-            st.markdown('</div></div>', unsafe_allow_html=True)
+    for idx, section in enumerate(sections):
+        if section.kind != "section":
+            # For career guidance and total time, display directly without an expander
+            render_special_section(section)
         else:
             # For regular learning sections, use an expander
-            with st.expander(display_heading, expanded=False): # Start collapsed for less clutter
+            with st.expander(section.heading, expanded=False): # Start collapsed for less clutter
                 st.markdown('<div class="section-content">', unsafe_allow_html=True)
-                
-                # Get the actual content part by removing the heading line
-                content_for_parsing = section_text.replace(heading_match.group(0), '', 1).strip() if heading_match else section_text
-                parsed_section = parse_roadmap_section_content(content_for_parsing)
 
                 # Display each parsed component with clear labels
-                if parsed_section["Topics to Cover"]:
-                    st.markdown(f"**Topics to Cover:** {parsed_section['Topics to Cover']}")
-                if parsed_section["Estimated Time"]:
-                    st.markdown(f"**Estimated Time:** {parsed_section['Estimated Time']}")
-                if parsed_section["Key Tools/Technologies"]:
-                    st.markdown(f"**Key Tools/Technologies:** {parsed_section['Key Tools/Technologies']}")
-                if parsed_section["Mini-Projects/Exercises"]:
-                    st.markdown(f"**Mini-Projects/Exercises:** {parsed_section['Mini-Projects/Exercises']}")
-                if parsed_section["Resources/Learning Strategies"]:
-                    st.markdown(f"**Resources/Learning Strategies:** {parsed_section['Resources/Learning Strategies']}")
+                render_section_fields(section)
 
                 if st.button("Mark Complete ✅", key=f"complete_{idx}"):
                     st.session_state.completed_sections += 1
@@ -0,0 +1,87 @@
+"""
+Measures the per-request overhead of answering a follow-up question, excluding network time.
+
+"before" builds the Gemini client, the prompt template and the chain for every question, as
+answer_follow_up_question used to; "after" reuses the process-wide chain. The model call itself
+is replaced by an instant fake, and the answer cache is bypassed, so only local work is timed:
+client/chain setup, context retrieval ("local" mode) and prompt formatting.
+
+    python benchmarks/bench_follow_up_overhead.py
+    python benchmarks/bench_follow_up_overhead.py --requests 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Clients are constructed but never called, so any key will do
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+from langchain.prompts import PromptTemplate
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+import follow_up_agent
+
+ROADMAP = "\n\n".join(
+    [f"**Level {i}: Topic {i}** (Estimated Time: 2-3 weeks)\n"
+     f"**Topics to Cover:** concept {i}a, concept {i}b, concept {i}c\n"
+     f"**Key Tools/Technologies:** tool {i}\n"
+     f"**Mini-Projects/Exercises:** project {i}" for i in range(1, 9)]
+    + ["**Career Guidance & Next Steps**\n- Junior developer roles\n- Build a portfolio",
+       "Total Estimated Time for Roadmap: 16-24 weeks"]
+)
+QUESTIONS = ["How long does Level 3 take?", "What tools do I need for docker?", "What jobs can I get?",
+             "Which projects should I build first?"]
+
+
+def _build_per_request():
+    """What every question used to pay for before the chain was shared."""
+    llm = ChatGoogleGenerativeAI(model="gemini-pro", temperature=0.3, google_api_key=os.environ["GOOGLE_API_KEY"])
+    prompt = PromptTemplate.from_template(follow_up_agent.QA_PROMPT_TEMPLATE)
+    return prompt | llm
+
+
+def _time(fn, requests: int) -> list:
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        fn(QUESTIONS[i % len(QUESTIONS)])
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    instant_chain = follow_up_agent.QA_CHAIN_PROMPT | FakeListChatModel(responses=["An answer."])
+    follow_up_agent._qa_chain = instant_chain
+
+    def answer(question: str):
+        return follow_up_agent.answer_follow_up_question(ROADMAP, "Backend developer", question,
+                                                         retrieval_mode="local", use_cache=False)
+
+    def before(question: str):
+        _build_per_request()
+        return answer(question)
+
+    answer(QUESTIONS[0])  # Warm up imports and the per-roadmap chunk cache
+    results = {"before": _time(before, args.requests), "after": _time(answer, args.requests)}
+    setup = _time(lambda _: _build_per_request(), args.requests)
+
+    print(f"setup per request (client + template + chain): median {statistics.median(setup):.0f} µs")
+    print(f"{'':>8} {'median (µs)':>12} {'p95 (µs)':>10}")
+    for name, timings in results.items():
+        p95 = statistics.quantiles(timings, n=20)[-1]
+        print(f"{name:>8} {statistics.median(timings):>12.0f} {p95:>10.0f}")
+    speedup = statistics.median(results["before"]) / statistics.median(results["after"])
+    print(f"overhead reduction: {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
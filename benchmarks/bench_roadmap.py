@@ -0,0 +1,134 @@
+"""
+Compares end-to-end roadmap latency of the single-call and parallel (skeleton + concurrent
+section expansion) strategies for 5-, 8- and 12-section roadmaps.
+
+By default the LLM is simulated with a fixed time-to-first-token and output rate, so results
+are reproducible and need no API key. Pass --live to call Gemini instead.
+
+    python benchmarks/bench_roadmap.py
+    python benchmarks/bench_roadmap.py --sections 5 8 12 --runs 3 --ttft 0.5 --tps 80
+    python benchmarks/bench_roadmap.py --live --runs 1
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Any, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class SimulatedChatModel(BaseChatModel):
+    """
+    Chat model that answers the roadmap prompts with filler text, taking as long as a real model
+    would: `ttft` seconds before the first token, then `tps` tokens per second.
+    """
+
+    sections: int = 8
+    ttft: float = 0.5
+    tps: float = 80.0
+    tokens_per_section: int = 350
+    career_tokens: int = 250
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated"
+
+    def _reply(self, prompt: str) -> str:
+        if "Return ONLY the outline" in prompt:
+            outline = {"sections": [{"title": f"Topic {i}", "estimated_time": "2-3 weeks"}
+                                    for i in range(1, self.sections + 1)],
+                       "total_time": f"{self.sections * 2}-{self.sections * 3} weeks"}
+            return json.dumps(outline)
+        if "Write ONLY section" in prompt:
+            return self._section_body()
+        if "Write ONLY the career guidance" in prompt:
+            return " ".join(["- advice"] * self.career_tokens)
+        # The single-call roadmap prompt
+        parts = [f"**Level {i}: Topic {i}** (Estimated Time: 2-3 weeks)\n{self._section_body()}"
+                 for i in range(1, self.sections + 1)]
+        parts.append("**Career Guidance & Next Steps**\n" + " ".join(["- advice"] * self.career_tokens))
+        parts.append(f"Total Estimated Time for Roadmap: {self.sections * 2}-{self.sections * 3} weeks")
+        return "\n\n".join(parts)
+
+    def _section_body(self) -> str:
+        per_label = self.tokens_per_section // 5
+        labels = ("Topics to Cover", "Estimated Time", "Key Tools/Technologies",
+                  "Mini-Projects/Exercises", "Resources/Learning Strategies")
+        return "\n".join(f"**{label}:** " + " ".join(["item"] * per_label) for label in labels)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self._reply(messages[-1].content)
+        time.sleep(self.ttft + len(text.split()) / self.tps)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # Sleep until each token's due time, so per-sleep overhead does not accumulate
+        start = time.perf_counter() + self.ttft
+        for i, token in enumerate(re.findall(r"\S+\s*", self._reply(messages[-1].content)), start=1):
+            delay = start + i / self.tps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def _measure(goal: str, strategy: str):
+    """Returns (seconds to the first complete section, seconds to the full roadmap, sections)."""
+    start = time.perf_counter()
+    first_section = None
+    sections = 0
+    for event in roadmap_agent.stream_roadmap(goal, use_cache=False, strategy=strategy):
+        if event["type"] == "section":
+            sections += 1
+            if first_section is None:
+                first_section = time.perf_counter() - start
+    return first_section or 0.0, time.perf_counter() - start, sections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, nargs="+", default=[5, 8, 12])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--goal", default="Become a backend developer in Python")
+    parser.add_argument("--live", action="store_true", help="Call Gemini instead of the simulated model.")
+    parser.add_argument("--ttft", type=float, default=0.5, help="Simulated seconds to first token.")
+    parser.add_argument("--tps", type=float, default=80.0, help="Simulated output tokens per second.")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="Concurrent section expansions (default: ROADMAP_EXPAND_CONCURRENCY).")
+    args = parser.parse_args()
+
+    if args.concurrency:
+        roadmap_agent.ROADMAP_EXPAND_CONCURRENCY = args.concurrency
+
+    print(f"{'sections':>8} {'strategy':>9} {'first section (s)':>18} {'total (s)':>10} {'speedup':>8}")
+    for n_sections in args.sections:
+        if args.live:
+            goal = f"{args.goal} (a roadmap of exactly {n_sections} levels)"
+        else:
+            goal = args.goal
+            roadmap_agent.llm = SimulatedChatModel(sections=n_sections, ttft=args.ttft, tps=args.tps)
+        totals = {}
+        for strategy in ("single", "parallel"):
+            runs = [_measure(goal, strategy) for _ in range(args.runs)]
+            first = statistics.median(r[0] for r in runs)
+            totals[strategy] = statistics.median(r[1] for r in runs)
+            speedup = totals["single"] / totals[strategy]
+            print(f"{n_sections:>8} {strategy:>9} {first:>18.2f} {totals[strategy]:>10.2f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    if "--live" not in sys.argv:
+        # The simulated model replaces Gemini, but the agent module still builds its clients on import
+        os.environ.setdefault("GOOGLE_API_KEY", "simulated")
+    import roadmap_agent
+
+    main()
@@ -0,0 +1,270 @@
+"""
+Load test for the API server: keeps N requests in flight against one uvicorn worker and reports
+sustained throughput and latency percentiles.
+
+By default the script starts its own single-worker server in which Gemini is replaced by a
+simulated model that answers after `--latency` seconds (asyncio.sleep for ainvoke, time.sleep
+for invoke), so the numbers show the server's concurrency, not the model's speed. The same
+server also exposes /bench/sync_follow_up, the old threadpool-bound `def` handler, for comparison.
+
+Responses are counted as "ok" (answered by the model), "degraded" (200 from a local fallback,
+marked with the X-Degraded header) or "rejected" (429/503/504 from the upstream limits); only ok
+responses count towards req/s and the latency percentiles. With the default limits
+(GEMINI_CHAT_CONCURRENCY=32, UPSTREAM_QUEUE_LIMIT=64) most of 500 in-flight requests are
+rejected or degraded by design; --gemini-concurrency raises the simulated server's limit to
+measure the server's own concurrency.
+
+    python benchmarks/load_test.py                                  # 500 in flight, async endpoints
+    python benchmarks/load_test.py --gemini-concurrency 1000        # without the Gemini limit in the way
+    python benchmarks/load_test.py --concurrency 1000 --duration 30
+    python benchmarks/load_test.py --endpoints follow_up sync_follow_up
+    python benchmarks/load_test.py --url http://localhost:8000 --endpoints follow_up   # an existing server
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROADMAP = "\n\n".join(
+    [f"**Level {i}: Topic {i}** (Estimated Time: 2-3 weeks)\n**Topics to Cover:** concept {i}a, concept {i}b\n"
+     f"**Key Tools/Technologies:** tool {i}" for i in range(1, 7)]
+    + ["**Career Guidance & Next Steps**\n- Junior developer roles", "Total Estimated Time for Roadmap: 12-18 weeks"]
+)
+COURSES = [{"title": f"Course {i}", "link": f"https://example.com/course-{i}", "snippet": "An online course."}
+           for i in range(5)]
+
+
+def _payload(endpoint: str, n: int):
+    """Returns (method, path, json body) of the n-th request; questions and goals vary so nothing is coalesced."""
+    if endpoint in ("follow_up", "sync_follow_up"):
+        path = "/api/follow_up" if endpoint == "follow_up" else "/bench/sync_follow_up"
+        return "POST", path, {"roadmap": ROADMAP, "goal": "Backend developer", "retrieval_mode": "local",
+                              "question": f"What should I learn in Level {n % 6 + 1}? ({n})"}
+    if endpoint == "generate_roadmap":
+        return "POST", "/api/generate_roadmap", {"goal": f"Backend developer #{n}", "strategy": "single"}
+    if endpoint == "rank_courses":
+        return "POST", "/api/rank_courses", {"goal": f"Backend developer #{n}", "courses": COURSES, "top_k": 0}
+    raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+
+# --- Simulated server -------------------------------------------------------------------------
+
+def serve(port: int, latency: float, gemini_concurrency: Optional[int] = None):
+    """Runs the API with every Gemini client replaced by the simulated model (one worker)."""
+    os.environ.setdefault("GOOGLE_API_KEY", "simulated")
+    if gemini_concurrency is not None:
+        os.environ["GEMINI_CHAT_CONCURRENCY"] = str(gemini_concurrency)
+    os.environ["ROADMAP_CACHE_ENABLED"] = "false"
+    os.environ["ROADMAP_CATALOG_ENABLED"] = "false"
+    os.environ["FOLLOW_UP_ANSWER_CACHE_ENABLED"] = "false"
+
+    import uvicorn
+    from fastapi import HTTPException
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, BaseMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class SlowChatModel(BaseChatModel):
+        """Answers every prompt after `latency` seconds, like a remote model would."""
+
+        latency: float = 1.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "simulated"
+
+        @staticmethod
+        def _reply(messages: List[BaseMessage]) -> ChatResult:
+            prompt = messages[-1].content
+            if "ranked_courses" in prompt:
+                text = '{"ranked_courses": [{"title": "Course 0", "link": "https://example.com/course-0", ' \
+                       '"reason": "Good fit.", "score": 90}]}'
+            else:
+                text = "**Level 1: Basics** (Estimated Time: 2 weeks)\n**Topics to Cover:** basics"
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+        def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                      run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            time.sleep(self.latency)
+            return self._reply(messages)
+
+        async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                             run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            await asyncio.sleep(self.latency)
+            return self._reply(messages)
+
+    import course_ranker_agent
+    import follow_up_agent
+    import roadmap_agent
+    import main
+    from roadmap_retriever import RETRIEVAL_MODES
+
+    model = SlowChatModel(latency=latency)
+    roadmap_agent.llm = model
+    course_ranker_agent.llm_ranker = model
+    follow_up_agent._qa_chain = follow_up_agent.QA_CHAIN_PROMPT | model
+
+    @main.app.post("/bench/sync_follow_up")
+    def sync_follow_up(req: main.FollowUpRequest):
+        # The handler as it was before the API went async: a blocking call on the anyio threadpool
+        if req.retrieval_mode is not None and req.retrieval_mode not in RETRIEVAL_MODES:
+            raise HTTPException(status_code=400)
+        return {"answer": follow_up_agent.answer_follow_up_question(req.roadmap, req.goal, req.question,
+                                                                    req.retrieval_mode)}
+
+    uvicorn.run(main.app, host="127.0.0.1", port=port, workers=1, log_level="warning",
+                backlog=4096, timeout_keep_alive=30)
+
+
+# --- Load generator ---------------------------------------------------------------------------
+
+class _Connection:
+    """
+    Minimal keep-alive HTTP/1.1 client connection. The load generator must stay much cheaper than
+    the server it measures; a full-featured client spends more CPU per request than the server.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, bool]:
+        """Returns the response status and whether the server marked it as degraded (X-Degraded)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        try:
+            head = await self.reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            headers = {k.lower(): v for k, v in (line.split(": ", 1) for line in lines[1:] if ": " in line)}
+            await self.reader.readexactly(int(headers.get("content-length", 0)))
+        except Exception:
+            self.close()
+            raise
+        return int(lines[0].split()[1]), headers.get("x-degraded") == "true"
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def _wait_ready(host: str, port: int, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = _Connection(host, port)
+        try:
+            await connection.request("GET", "/api/stats")
+            return
+        except Exception:
+            await asyncio.sleep(0.2)
+        finally:
+            connection.close()
+    raise RuntimeError(f"Server at {host}:{port} did not become ready")
+
+
+async def run_load(url: str, endpoint: str, concurrency: int, duration: float) -> dict:
+    """Keeps `concurrency` requests in flight for `duration` seconds and returns throughput and latency stats."""
+    parsed = urlsplit(url)
+    host, port = parsed.hostname, parsed.port or 80
+    await _wait_ready(host, port)
+
+    latencies, counter = [], 0
+    outcomes = {"degraded": 0, "rejected": 0, "errors": 0}
+    stop_at = time.monotonic() + duration
+
+    async def worker():
+        nonlocal counter
+        connection = _Connection(host, port)
+        while time.monotonic() < stop_at:
+            counter += 1
+            method, path, body = _payload(endpoint, counter)
+            start = time.perf_counter()
+            try:
+                status, degraded = await connection.request(method, path, body)
+            except Exception:
+                outcomes["errors"] += 1
+                await asyncio.sleep(0.1)  # Don't spin on a refused connection
+                continue
+            if status in (429, 503, 504):
+                outcomes["rejected"] += 1
+            elif status != 200:
+                outcomes["errors"] += 1
+            elif degraded:
+                outcomes["degraded"] += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+        connection.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+    return {
+        "endpoint": endpoint,
+        "ok": len(latencies),
+        **outcomes,
+        "throughput": len(latencies) / elapsed,
+        "p50": quantiles[49],
+        "p99": quantiles[98],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=500, help="Requests kept in flight.")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per endpoint.")
+    parser.add_argument("--latency", type=float, default=1.0, help="Simulated model latency in seconds.")
+    parser.add_argument("--endpoints", nargs="+", default=["follow_up", "generate_roadmap", "rank_courses"],
+                        choices=["follow_up", "generate_roadmap", "rank_courses", "sync_follow_up"])
+    parser.add_argument("--url", help="Load an already running server instead of the simulated one.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--gemini-concurrency", type=int,
+                        help="GEMINI_CHAT_CONCURRENCY of the simulated server (default: the server's default).")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.latency, args.gemini_concurrency)
+        return
+
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        command = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(args.port),
+                   "--latency", str(args.latency)]
+        if args.gemini_concurrency is not None:
+            command += ["--gemini-concurrency", str(args.gemini_concurrency)]
+        server = subprocess.Popen(command, cwd=ROOT)
+    try:
+        print(f"{args.concurrency} requests in flight for {args.duration:.0f}s per endpoint"
+              + (f", simulated model latency {args.latency}s" if server else ""))
+        print(f"{'endpoint':>18} {'ok':>7} {'degraded':>9} {'rejected':>9} {'errors':>7} {'ok/s':>8} "
+              f"{'p50 (s)':>8} {'p99 (s)':>8}")
+        for endpoint in args.endpoints:
+            result = asyncio.run(run_load(url, endpoint, args.concurrency, args.duration))
+            print(f"{result['endpoint']:>18} {result['ok']:>7} {result['degraded']:>9} {result['rejected']:>9} "
+                  f"{result['errors']:>7} {result['throughput']:>8.1f} {result['p50']:>8.2f} {result['p99']:>8.2f}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
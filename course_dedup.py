@@ -0,0 +1,255 @@
+import hashlib
+import random
+import re
+import threading
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Path prefixes that identify a single course per platform. The segment right after the
+# prefix is the course slug; everything after it (lectures, reviews, enrollment pages) is
+# dropped. A prefix may span several segments, with "*" matching any one segment (e.g. edX's
+# subject in /learn/<subject>/<slug>); longer prefixes are listed before the shorter ones they
+# extend. `trailing_slash` matches the form each site itself links to.
+_COURSE_PATHS = {
+    "udemy.com": {"host": "www.udemy.com", "prefixes": ("course",), "trailing_slash": True},
+    "coursera.org": {"host": "www.coursera.org",
+                     "prefixes": ("learn", "specializations", "professional-certificates", "projects", "degrees"),
+                     "trailing_slash": False},
+    "edx.org": {"host": "www.edx.org",
+                "prefixes": ("course", "learn/*", "professional-certificate", "certificates/*", "xseries", "masters"),
+                "trailing_slash": False},
+    "linkedin.com": {"host": "www.linkedin.com",
+                     "prefixes": ("learning/paths", "learning/topics", "learning/instructors", "learning"),
+                     "trailing_slash": False},
+    "pluralsight.com": {"host": "www.pluralsight.com", "prefixes": ("courses", "paths"), "trailing_slash": False},
+    "datacamp.com": {"host": "www.datacamp.com", "prefixes": ("courses", "tracks"), "trailing_slash": False},
+    "skillshare.com": {"host": "www.skillshare.com", "prefixes": ("classes",), "trailing_slash": False},
+}
+
+# Query parameters that never change which page is shown.
+_TRACKING_PARAMS = {
+    "couponcode", "referralcode", "ranmid", "raneaid", "ransiteid", "lsnpubid", "gclid", "fbclid",
+    "irclickid", "irgwc", "aff_code", "affcode", "trk", "src", "ref", "siteid", "locale", "lang", "hl",
+}
+# Query parameters kept on otherwise unknown sites (e.g. YouTube's video and playlist ids).
+_KEEP_PARAMS = {"v", "list"}
+
+_LOCALE_SEGMENT = re.compile(r"^[a-z]{2}(?:[-_][a-z]{2,4})?$")
+# Platform names appended to titles by search engines, e.g. "Python Bootcamp | Udemy"
+_TITLE_SUFFIX = re.compile(r"\s*[|\-–:]\s*(udemy|coursera|edx|pluralsight|datacamp|linkedin( learning)?|"
+                           r"skillshare|freecodecamp|khan academy|youtube)\s*$", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^a-z0-9+#]+")
+
+MIN_SNIPPET_CHARS = 40
+NUM_PERM = 64
+LSH_BANDS = 16
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1)  # Fixed seed: signatures must agree across processes and restarts
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+_stats_lock = threading.Lock()
+_stats = {"batches": 0, "input": 0, "dropped": 0}
+
+
+def _platform_rule(host: str):
+    for domain, rule in _COURSE_PATHS.items():
+        if host == domain or host.endswith("." + domain):
+            return rule
+    return None
+
+
+def _course_path(segments: List[str], prefixes: Tuple[str, ...]):
+    """Returns the segments of the first prefix found in `segments` plus the course slug, or None."""
+    for prefix in prefixes:
+        pattern = prefix.split("/")
+        for at in range(len(segments) - len(pattern)):
+            if all(p in ("*", s) for p, s in zip(pattern, segments[at:])):
+                return segments[at:at + len(pattern) + 1]
+    return None
+
+
+def canonicalize_url(link: str) -> str:
+    """
+    Returns a canonical form of a course URL so that copies of the same course compare equal.
+
+    Tracking/coupon/locale query parameters, fragments and locale path prefixes are removed;
+    for known platforms the path is cut down to the course itself (e.g. any
+    'https://udemy.com/course/x/learn/lecture/1?couponCode=Y' becomes
+    'https://www.udemy.com/course/x/'). A missing link (None or "") becomes "".
+    """
+    if not link:
+        return ""
+    try:
+        parts = urlsplit(link.strip())
+    except ValueError:
+        return link
+    host = (parts.hostname or "").lower()
+    if not host:
+        return link
+    if host.startswith("m."):
+        host = host[2:]
+    bare_host = host[4:] if host.startswith("www.") else host
+    segments = [s for s in parts.path.split("/") if s]
+
+    rule = _platform_rule(bare_host)
+    if rule is not None:
+        course = _course_path([s.lower() for s in segments], rule["prefixes"])
+        if course is not None:
+            path = "/" + "/".join(course) + ("/" if rule["trailing_slash"] else "")
+            return urlunsplit(("https", rule["host"], path, "", ""))
+        if len(segments) > 1 and _LOCALE_SEGMENT.match(segments[0].lower()):
+            segments = segments[1:]
+        host = rule["host"]
+        query = ""
+    else:
+        query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                           if k.lower() in _KEEP_PARAMS
+                           or not (k.lower().startswith("utm_") or k.lower() in _TRACKING_PARAMS)])
+        host = bare_host
+
+    path = "/" + "/".join(segments) if segments else "/"
+    return urlunsplit(("https", host, path, query, ""))
+
+
+def _shingles(text: str, size: int) -> set:
+    """Character n-grams of the normalized text (whole text if shorter than `size`)."""
+    text = _NON_WORD.sub(" ", text.lower()).strip()
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _minhash(shingles: set) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+              for s in shingles]
+    if not hashes:
+        return ()
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """MinHash estimate of the Jaccard similarity of two shingle sets."""
+    if not sig_a or not sig_b:
+        return 0.0
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _lsh_candidates(signatures: List[Tuple[int, ...]]) -> set:
+    """Index pairs that share at least one LSH band and are therefore worth comparing."""
+    rows = NUM_PERM // LSH_BANDS
+    buckets: Dict[Tuple, List[int]] = {}
+    for idx, sig in enumerate(signatures):
+        if not sig:
+            continue
+        for band in range(LSH_BANDS):
+            buckets.setdefault((band, sig[band * rows:(band + 1) * rows]), []).append(idx)
+    pairs = set()
+    for members in buckets.values():
+        for i in range(len(members)):
+            for j in range(i + 1, len(members)):
+                pairs.add((members[i], members[j]))
+    return pairs
+
+
+def _host(link: str) -> str:
+    try:
+        return (urlsplit(link).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def dedupe_courses(courses: List[Dict], title_threshold: float = 0.8,
+                   snippet_threshold: float = 0.9) -> Tuple[List[Dict], int]:
+    """
+    Collapses duplicate courses before they are sent to the ranker.
+
+    Courses are first grouped by canonical URL (courses without a link are never merged this
+    way), then near-duplicates are found with MinHash/LSH: two courses collapse when their titles
+    (platform suffix removed) are at least `title_threshold` Jaccard-similar and they are on the
+    same site, or when their snippets are at least `snippet_threshold` similar. Equal titles on
+    different platforms ("Python for Beginners" on Udemy and on Coursera) are different courses.
+    The earliest course of each group is kept, so the search engine's order is preserved.
+
+    Args:
+        courses (List[Dict]): Course dicts with 'title', 'link' and 'snippet'.
+        title_threshold (float): Minimum title similarity (0..1) for two courses to collapse.
+        snippet_threshold (float): Minimum snippet similarity (0..1) for two courses to collapse.
+
+    Returns:
+        Tuple[List[Dict], int]: The unique courses (with canonical links) and how many were dropped.
+    """
+    unique: List[Dict] = []
+    seen_links = set()
+    for course in courses:
+        link = canonicalize_url(course.get("link") or "")
+        if link:
+            if link in seen_links:
+                continue
+            seen_links.add(link)
+        unique.append({**course, "link": link})
+
+    hosts = [_host(c["link"]) for c in unique]
+    title_sigs = [_minhash(_shingles(_TITLE_SUFFIX.sub("", c.get("title", "")), 4)) for c in unique]
+    # Very short snippets ("Learn Java") say too little to tell two courses apart
+    snippet_sigs = [_minhash(_shingles(c.get("snippet", ""), 5)) if len(c.get("snippet", "")) >= MIN_SNIPPET_CHARS else ()
+                    for c in unique]
+
+    # Union-find over near-duplicate pairs; the root is always the earliest course.
+    parent = list(range(len(unique)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for sigs, threshold, same_site in ((title_sigs, title_threshold, True), (snippet_sigs, snippet_threshold, False)):
+        for i, j in _lsh_candidates(sigs):
+            if same_site and not (hosts[i] and hosts[i] == hosts[j]):
+                continue
+            if _similarity(sigs[i], sigs[j]) >= threshold:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    kept = [course for idx, course in enumerate(unique) if find(idx) == idx]
+    dropped = len(courses) - len(kept)
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["input"] += len(courses)
+        _stats["dropped"] += dropped
+    return kept, dropped
+
+
+def dedupe_stats() -> Dict[str, int]:
+    """Returns how many courses this process has deduplicated and dropped so far."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+if __name__ == "__main__":
+    # Quick self-check of URL canonicalization and deduping
+    assert canonicalize_url("https://udemy.com/course/x/learn/lecture/1?couponCode=Y") == "https://www.udemy.com/course/x/"
+    assert canonicalize_url("https://www.edx.org/learn/python/harvard-university-cs50-s-introduction-to-programming"
+                            "-with-python?index=product") == \
+        "https://www.edx.org/learn/python/harvard-university-cs50-s-introduction-to-programming-with-python"
+    assert canonicalize_url("https://www.linkedin.com/learning/paths/become-a-python-developer") == \
+        "https://www.linkedin.com/learning/paths/become-a-python-developer"
+    assert canonicalize_url("https://www.linkedin.com/learning/python-essential-training/welcome") == \
+        "https://www.linkedin.com/learning/python-essential-training"
+
+    same_subject = [
+        {"title": "CS50's Introduction to Programming with Python",
+         "link": "https://www.edx.org/learn/python/harvard-university-cs50-s-introduction-to-programming-with-python",
+         "snippet": "An introduction to programming using Python, from Harvard."},
+        {"title": "Python Basics for Data Science",
+         "link": "https://www.edx.org/learn/python/ibm-python-basics-for-data-science",
+         "snippet": "Learn Python basics for data analysis, from IBM."},
+        {"title": "Become a Python Developer", "link": "https://www.linkedin.com/learning/paths/become-a-python-developer",
+         "snippet": "Learning path for Python developers."},
+        {"title": "Become a Java Developer", "link": "https://www.linkedin.com/learning/paths/become-a-java-developer",
+         "snippet": "Learning path for Java developers."},
+    ]
+    unique, dropped = dedupe_courses(same_subject)
+    assert dropped == 0, unique
+    print("course_dedup self-check passed.")
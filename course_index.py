@@ -0,0 +1,262 @@
+import math
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from course_dedup import canonicalize_url
+from sqlite_cache import default_cache_path, transaction
+
+# Known course platforms, matched against the end of the link's host name.
+PLATFORMS = {
+    "udemy.com": "Udemy",
+    "coursera.org": "Coursera",
+    "edx.org": "edX",
+    "freecodecamp.org": "freeCodeCamp",
+    "pluralsight.com": "Pluralsight",
+    "linkedin.com": "LinkedIn Learning",
+    "datacamp.com": "DataCamp",
+    "khanacademy.org": "Khan Academy",
+    "skillshare.com": "Skillshare",
+    "youtube.com": "YouTube",
+}
+
+# Words that carry no signal in course titles/snippets or in search topics.
+STOPWORDS = frozenset("""
+a an and are as at be by for from how in into is it of on or the to with your you
+course courses online class classes learn learning tutorial tutorials
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+[+#]*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cases `text` and splits it into search terms, keeping 'c++'/'c#' style tokens intact."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def platform_for(link: str) -> Tuple[str, str]:
+    """Returns (platform, domain) for a course link. Both strings are interned."""
+    host = (urlsplit(link).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    platform = "Other"
+    for domain, name in PLATFORMS.items():
+        if host == domain or host.endswith("." + domain):
+            platform = name
+            break
+    return sys.intern(platform), sys.intern(host)
+
+
+class CourseRecord:
+    """One catalogued course. Slots keep per-record overhead low for multi-million course catalogs."""
+
+    __slots__ = ("title", "link", "snippet", "platform", "domain")
+
+    def __init__(self, title: str, link: str, snippet: str, platform: str, domain: str):
+        self.title = title
+        self.link = link
+        self.snippet = snippet
+        self.platform = platform
+        self.domain = domain
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"title": self.title, "link": self.link, "snippet": self.snippet}
+
+
+class _Postings:
+    """Array-backed postings list for one term: parallel doc ids and term frequencies."""
+
+    __slots__ = ("doc_ids", "tfs")
+
+    def __init__(self):
+        self.doc_ids = array("I")
+        self.tfs = array("H")
+
+
+class CourseIndex:
+    """
+    Local course catalog with a BM25 inverted index over title and snippet and platform facets.
+
+    Every course is persisted to SQLite, so the catalog survives restarts and is shared by all
+    worker processes: each process picks up rows written by the others on its next search.
+
+    Args:
+        path (str): SQLite file backing the catalog.
+        k1 (float): BM25 term-frequency saturation.
+        b (float): BM25 length normalization.
+        title_weight (int): How many times title terms are counted relative to snippet terms.
+    """
+
+    SYNC_INTERVAL = 30.0  # Seconds between checks for courses added by other processes
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, title_weight: int = 2):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.title_weight = title_weight
+        self._records: List[CourseRecord] = []
+        self._by_link: Dict[str, int] = {}
+        self._postings: Dict[str, _Postings] = {}
+        self._platform_docs: Dict[str, array] = {}
+        self._doc_len = array("H")
+        self._total_len = 0
+        self._last_row_id = 0
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS course_catalog ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, link TEXT NOT NULL UNIQUE, title TEXT NOT NULL, "
+            "snippet TEXT NOT NULL, added_at REAL NOT NULL)"
+        )
+        self._sync()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _index(self, title: str, link: str, snippet: str):
+        """Adds one course to the in-memory index. Caller holds the lock."""
+        if link in self._by_link:
+            return
+        doc_id = len(self._records)
+        platform, domain = platform_for(link)
+        self._records.append(CourseRecord(title, link, snippet, platform, domain))
+        self._by_link[link] = doc_id
+
+        terms = Counter(tokenize(title) * self.title_weight + tokenize(snippet))
+        length = min(sum(terms.values()), 65535)
+        self._doc_len.append(length)
+        self._total_len += length
+        for term, tf in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[sys.intern(term)] = _Postings()
+            postings.doc_ids.append(doc_id)
+            postings.tfs.append(min(tf, 65535))
+        self._platform_docs.setdefault(platform, array("I")).append(doc_id)
+
+    def _sync(self):
+        """Loads catalog rows written since the last sync (by this or another process)."""
+        rows = self._conn().execute(
+            "SELECT id, title, link, snippet FROM course_catalog WHERE id > ? ORDER BY id",
+            (self._last_row_id,),
+        ).fetchall()
+        with self._lock:
+            for row_id, title, link, snippet in rows:
+                self._index(title, link, snippet)
+                self._last_row_id = max(self._last_row_id, row_id)
+            self._last_sync = time.monotonic()
+
+    def add(self, courses: Iterable[Dict]) -> int:
+        """
+        Harvests courses (dicts with 'title', 'link', 'snippet') into the catalog. Links are
+        canonicalized first, so tracking-parameter variants of a course are stored once.
+
+        Returns:
+            int: Number of courses that were not catalogued before.
+        """
+        new = [{**c, "link": canonicalize_url(c["link"])} for c in courses if c.get("link") and c.get("title")]
+        new = [c for c in new if c["link"] not in self._by_link]
+        if not new:
+            return 0
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO course_catalog (link, title, snippet, added_at) VALUES (?, ?, ?, ?)",
+                [(c["link"], c["title"], c.get("snippet", ""), now) for c in new],
+            )
+        with self._lock:
+            before = len(self._records)
+            for c in new:
+                self._index(c["title"], c["link"], c.get("snippet", ""))
+            return len(self._records) - before
+
+    def search(self, query: str, k: int = 10, platform: Optional[str] = None) -> List[Tuple[float, CourseRecord]]:
+        """
+        Ranks catalogued courses against `query` with BM25.
+
+        Args:
+            query (str): Free-text topic.
+            k (int): Maximum number of results.
+            platform (str): Optional platform facet filter (e.g. "Coursera").
+
+        Returns:
+            List[Tuple[float, CourseRecord]]: (score, record) pairs, best first. Scores are
+            normalized to 0..1 by the query's total IDF weight, so 1.0 means every query term
+            matched about as strongly as in a typical document and thresholds are comparable
+            across queries.
+        """
+        if time.monotonic() - self._last_sync > self.SYNC_INTERVAL:
+            self._sync()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            n_docs = len(self._records)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            allowed = None
+            if platform:
+                allowed = set(self._platform_docs.get(platform, ()))
+
+            scores: Dict[int, float] = {}
+            max_score = 0.0
+            k1, b = self.k1, self.b
+            doc_len = self._doc_len
+            for term in terms:
+                postings = self._postings.get(term)
+                df = len(postings.doc_ids) if postings else 0
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                max_score += idf
+                if postings is None:
+                    continue
+                for doc_id, tf in zip(postings.doc_ids, postings.tfs):
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = k1 * (1 - b + b * doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(min(score / max_score, 1.0), self._records[doc_id]) for doc_id, score in best]
+
+    def facets(self) -> Dict[str, int]:
+        """Returns the number of catalogued courses per platform."""
+        with self._lock:
+            return {platform: len(docs) for platform, docs in self._platform_docs.items()}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"courses": len(self._records), "terms": len(self._postings), "platforms": self.facets()}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_course_index() -> CourseIndex:
+    """Returns the process-wide course index, loading the catalog from disk on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = os.getenv("COURSE_CATALOG_PATH") or default_cache_path("course_catalog.sqlite3")
+                _index = CourseIndex(path)
+    return _index
@@ -1,10 +1,18 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field
-from typing import List, Dict
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from typing import Dict, Iterator, List
+
+from course_dedup import canonicalize_url, dedupe_courses
+import metrics
+from local_ranker import prerank_courses, rank_courses_locally
+from resilience import ServiceUnavailable, gemini_chat, mark_degraded
+from sqlite_cache import SQLiteCache, default_cache_path, cache_key
 
 load_dotenv()
 
@@ -13,10 +21,18 @@ class RankedCourse(BaseModel):
     title: str = Field(description="Title of the course.")
     link: str = Field(description="Direct URL link to the course.")
     reason: str = Field(description="A brief reason why this course is recommended for the user's goal and topic, especially for beginners in India.")
+    score: int = Field(description="How well the course fits the user's goal and topic, on an absolute scale from 0 (poor fit) to 100 (ideal fit).")
 
 class RankedCoursesList(BaseModel):
     ranked_courses: List[RankedCourse] = Field(description="A list of ranked courses, from most to least recommended.")
 
+class TopicRanking(BaseModel):
+    topic: str = Field(description="The topic exactly as given in the request.")
+    ranked_courses: List[RankedCourse] = Field(description="The topic's courses, from most to least recommended.")
+
+class BatchRankedCourses(BaseModel):
+    topics: List[TopicRanking] = Field(description="One ranking per topic.")
+
 llm_ranker = ChatGoogleGenerativeAI(
     model="gemini-1.5-flash",
     temperature=0.4, # Lower temperature for more factual and less creative ranking
@@ -39,53 +55,560 @@ Here is a list of courses found:
 
 Please rank these courses from most recommended to least recommended for a complete beginner in India, specifically considering their overall learning goal and the current topic.
 Provide a brief reason for each recommendation. Prioritize courses that seem comprehensive, beginner-friendly, and relevant.
+Also give each course a 'score' from 0 to 100. Score every course on its own merits on an absolute scale,
+not relative to the other courses in this list, so scores stay comparable between different lists.
 
 Return the response as a JSON object with a single key 'ranked_courses' which is a list of objects.
-Each object in the 'ranked_courses' list should have 'title', 'link', and 'reason' keys.
+Each object in the 'ranked_courses' list should have 'title', 'link', 'reason' and 'score' keys.
+Copy each 'link' exactly as given above.
 The 'reason' should explain why it's suitable, especially for a beginner in India.
 Do NOT include any additional text outside the JSON.
 
 {format_instructions}
 """
 
+# Ranking modes:
+#   "llm"   - Gemini ranks the candidates, after the local pre-ranker has pruned them to top_k
+#   "local" - local scoring only; never calls the LLM (degraded operation)
+RANKING_MODES = ("llm", "local")
+RANKER_MODE = os.getenv("RANKER_MODE", "llm")
+RANKER_TOP_K = int(os.getenv("RANKER_TOP_K", 8))  # 0 sends every candidate to the LLM
+
+# Per-course ranking memo keyed by (goal, topic, canonical course URL). Only courses not seen
+# before for a goal/topic go to the LLM; the rest are merged in from here by score.
+ranking_cache = SQLiteCache(
+    default_cache_path(),
+    namespace="course_rankings",
+    ttl=float(os.getenv("RANKING_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.getenv("RANKING_CACHE_MAX_ENTRIES", 50000)),
+)
+
+# Candidates the LLM left out of its ranking, remembered only briefly: a left-out course is not
+# re-sent on every request, but gets another chance soon instead of staying hidden for a week.
+omitted_cache = SQLiteCache(
+    default_cache_path(),
+    namespace="course_ranking_omissions",
+    ttl=float(os.getenv("RANKING_OMISSION_TTL", 3600)),
+    max_entries=int(os.getenv("RANKING_CACHE_MAX_ENTRIES", 50000)),
+)
+
 ranker_prompt = PromptTemplate(
     template=ranker_prompt_template,
     input_variables=["user_goal", "current_topic", "courses_list"],
     partial_variables={"format_instructions": parser.get_format_instructions()},
 )
 
-def rank_courses(user_goal: str, current_topic: str, courses: List[Dict]) -> List[Dict]:
+# Prompt for ranking several topics of one goal in a single call
+batch_parser = JsonOutputParser(pydantic_object=BatchRankedCourses)
+
+batch_ranker_prompt_template = """
+You are an AI assistant specialized in recommending online courses.
+Your task is to review online courses for several topics within a user's learning goal.
+The user's overall goal is: {user_goal}
+
+For each topic below you are given a list of courses found for that topic:
+{topics_list}
+
+For EACH topic separately, rank its courses from most recommended to least recommended for a complete beginner in India, specifically considering their overall learning goal and that topic.
+Provide a brief reason for each recommendation. Prioritize courses that seem comprehensive, beginner-friendly, and relevant.
+Also give each course a 'score' from 0 to 100. Score every course on its own merits on an absolute scale,
+not relative to the other courses in its list, so scores stay comparable between different lists.
+
+Return the response as a JSON object with a single key 'topics' which is a list with one object per topic.
+Each object should have a 'topic' key (copied exactly as given above) and a 'ranked_courses' list of objects
+with 'title', 'link', 'reason' and 'score' keys. Copy each 'link' exactly as given above.
+Do NOT include any additional text outside the JSON.
+
+{format_instructions}
+"""
+
+batch_ranker_prompt = PromptTemplate(
+    template=batch_ranker_prompt_template,
+    input_variables=["user_goal", "topics_list"],
+    partial_variables={"format_instructions": batch_parser.get_format_instructions()},
+)
+
+# Batch ranking packs all topics into one call while the prompt fits this many (estimated)
+# tokens, and otherwise ranks topics with concurrent per-topic calls.
+RANK_BATCH_TOKEN_BUDGET = int(os.getenv("RANK_BATCH_TOKEN_BUDGET", 6000))
+RANK_BATCH_CONCURRENCY = int(os.getenv("RANK_BATCH_CONCURRENCY", 8))
+
+# Records prompt/LLM/parse latency, tokens and errors of the ranking chains (see metrics)
+_METRICS_CONFIG = metrics.langchain_config("ranker")
+
+def _memo_key(user_goal: str, current_topic: str, link: str) -> str:
+    return cache_key(user_goal, current_topic, canonicalize_url(link))
+
+
+def _format_courses(courses: List[Dict]) -> str:
+    """Formats courses into a readable string for the LLM."""
+    return "\n".join([
+        f"- Title: {c.get('title', 'N/A')}\n  Link: {c.get('link', 'N/A')}\n  Snippet: {c.get('snippet', 'N/A')}"
+        for c in courses
+    ])
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def _prepare_candidates(user_goal: str, current_topic: str, courses: List[Dict], dedupe: bool,
+                        top_k: int) -> List[Dict]:
+    """Dedupes and pre-ranks the candidates that may be sent to the LLM. Courses without a link are dropped."""
+    courses = [c for c in courses if c.get("link")]
+    if dedupe:
+        courses, dropped = dedupe_courses(courses)
+        if dropped:
+            print(f"Dropped {dropped} duplicate course(s) before ranking.")
+    top_k = RANKER_TOP_K if top_k is None else top_k
+    if top_k:
+        courses = prerank_courses(user_goal, current_topic, courses, top_k)
+    return courses
+
+
+def _split_cached(user_goal: str, current_topic: str, candidates: List[Dict], use_cache: bool):
+    """Returns (memo entries already known for the candidates, candidates still to rank)."""
+    entries = {}
+    if use_cache:
+        keys = [_memo_key(user_goal, current_topic, c.get("link", "")) for c in candidates]
+        entries = ranking_cache.get_many(keys)
+        entries.update(omitted_cache.get_many(key for key in keys if key not in entries))
+    uncached = [c for c in candidates if _memo_key(user_goal, current_topic, c.get("link", "")) not in entries]
+    return entries, uncached
+
+
+def _match_ranked(user_goal: str, current_topic: str, candidates: List[Dict], item: Dict):
+    """
+    Matches one course from the LLM's output back to the candidate it was given (by canonical
+    link, then by title) and returns (memo key, memo entry), or None for an invented course.
+    """
+    item_link = canonicalize_url(str(item.get("link", "")))
+    item_title = " ".join(str(item.get("title", "")).lower().split())
+    course = next((c for c in candidates if canonicalize_url(c.get("link", "")) == item_link), None) \
+        or next((c for c in candidates if " ".join(c.get("title", "").lower().split()) == item_title), None)
+    if course is None or not course.get("link"):
+        return None
+    try:
+        score = int(item.get("score", 0))
+    except (TypeError, ValueError):
+        score = 0
+    return _memo_key(user_goal, current_topic, course["link"]), {
+        "title": course.get("title", item.get("title", "")),
+        "link": course["link"],
+        "reason": item.get("reason", ""),
+        "score": max(0, min(score, 100)),
+    }
+
+
+def _memo_entries(user_goal: str, current_topic: str, candidates: List[Dict],
+                  ranked: List[Dict]) -> Dict[str, Dict]:
+    """
+    Matches the LLM's ranked courses back to the candidates it was given and returns memo
+    entries keyed by memo key. Candidates the LLM left out get score -1, so they are not
+    recommended; _memoize keeps those only for RANKING_OMISSION_TTL. Courses without a link
+    cannot be keyed and are skipped.
+    """
+    entries = {}
+    for item in ranked:
+        match = _match_ranked(user_goal, current_topic, candidates, item)
+        if match is not None:
+            entries.setdefault(*match)
+    for course in candidates:
+        link = course.get("link")
+        if link:
+            entries.setdefault(_memo_key(user_goal, current_topic, link),
+                               {"title": course.get("title", ""), "link": link, "reason": "", "score": -1})
+    return entries
+
+
+def _memoize(entries: Dict[str, Dict]):
+    """Stores memo entries: ranked courses in the ranking memo, left-out ones (score -1) in the omission memo."""
+    ranking_cache.set_many({key: entry for key, entry in entries.items() if entry["score"] >= 0})
+    omitted_cache.set_many({key: entry for key, entry in entries.items() if entry["score"] < 0})
+
+
+def _merge_ranked(user_goal: str, current_topic: str, candidates: List[Dict], entries: Dict[str, Dict]) -> List[Dict]:
+    """Orders the memo entries of `candidates` by score (ties keep candidate order), dropping left-out courses."""
+    ranked = []
+    for position, course in enumerate(candidates):
+        entry = entries.get(_memo_key(user_goal, current_topic, course.get("link", "")))
+        if entry is not None and entry["score"] >= 0:
+            ranked.append((-entry["score"], position, entry))
+    ranked.sort(key=lambda item: item[:2])
+    return [entry for _, _, entry in ranked]
+
+
+def rank_courses(user_goal: str, current_topic: str, courses: List[Dict], dedupe: bool = True,
+                 mode: str = None, top_k: int = None, use_cache: bool = True) -> List[Dict]:
     """
     Ranks a list of courses based on user goal and current topic using Gemini.
 
+    Duplicate courses (same canonical URL, or near-identical titles/snippets) are collapsed
+    first, and a cheap local pre-ranker keeps only the `top_k` most promising candidates,
+    so the prompt stays short. Per-course scores and reasons are memoized by goal, topic and
+    canonical URL: only courses not ranked before for this goal/topic are sent to the LLM,
+    and the results are merged with the memoized ones by score.
+
     Args:
         user_goal (str): The user's overall learning goal.
         current_topic (str): The specific topic for which courses are being searched.
         courses (List[Dict]): A list of course dictionaries, each containing 'title', 'link', and 'snippet'.
+        dedupe (bool): Whether to collapse duplicate courses before ranking.
+        mode (str): "llm" or "local" (see RANKING_MODES). Defaults to the RANKER_MODE setting.
+        top_k (int): How many candidates the LLM sees. Defaults to RANKER_TOP_K; 0 disables pruning.
+        use_cache (bool): Whether to read and update the per-course ranking memo.
 
     Returns:
-        List[Dict]: A list of ranked course dictionaries, including 'title', 'link', and 'reason'.
+        List[Dict]: A list of ranked course dictionaries, including 'title', 'link', 'reason' and 'score'.
                     Returns an empty list if ranking fails.
     """
+    mode = mode or RANKER_MODE
+    if mode not in RANKING_MODES:
+        raise ValueError(f"Unknown ranking mode '{mode}'. Expected one of {RANKING_MODES}.")
     if not courses:
         return []
 
-    # Format courses into a readable string for the LLM
-    courses_formatted = "\n".join([
-        f"- Title: {c.get('title', 'N/A')}\n  Link: {c.get('link', 'N/A')}\n  Snippet: {c.get('snippet', 'N/A')}"
-        for c in courses
-    ])
+    if mode == "local":
+        if dedupe:
+            courses, _ = dedupe_courses(courses)
+        return rank_courses_locally(user_goal, current_topic, courses)
+
+    candidates = _prepare_candidates(user_goal, current_topic, courses, dedupe, top_k)
+    entries, uncached = _split_cached(user_goal, current_topic, candidates, use_cache)
+    if not uncached:
+        return _merge_ranked(user_goal, current_topic, candidates, entries)
 
     chain = ranker_prompt | llm_ranker | parser
 
     try:
-        response = chain.invoke({
+        response = gemini_chat.call(chain.invoke, {
             "user_goal": user_goal,
             "current_topic": current_topic,
-            "courses_list": courses_formatted
-        })
-        return response.get('ranked_courses', [])
+            "courses_list": _format_courses(uncached)
+        }, config=_METRICS_CONFIG)
+    except ServiceUnavailable as e:
+        print(f"🔴 {e} Ranking courses locally.")
+        mark_degraded()
+        return rank_courses_locally(user_goal, current_topic, candidates)
     except Exception as e:
         print(f"🔴 Error ranking courses: {e}")
-        return []
+        # Still return whatever was ranked before for this goal/topic
+        return _merge_ranked(user_goal, current_topic, candidates, entries)
+
+    return _finish_ranking(user_goal, current_topic, candidates, entries, uncached,
+                           response.get('ranked_courses', []), use_cache)
+
+
+def _finish_ranking(user_goal: str, current_topic: str, candidates: List[Dict], entries: Dict[str, Dict],
+                    uncached: List[Dict], ranked: List[Dict], use_cache: bool) -> List[Dict]:
+    """Memoizes the LLM's ranking of the uncached candidates and merges it with the memoized entries."""
+    new_entries = _memo_entries(user_goal, current_topic, uncached, ranked)
+    if use_cache:
+        _memoize(new_entries)
+    entries.update(new_entries)
+    return _merge_ranked(user_goal, current_topic, candidates, entries)
+
+
+async def async_rank_courses(user_goal: str, current_topic: str, courses: List[Dict], dedupe: bool = True,
+                             mode: str = None, top_k: int = None, use_cache: bool = True) -> List[Dict]:
+    """
+    Async variant of rank_courses: the LLM call is awaited with ainvoke, so FastAPI handlers can
+    await it without occupying a threadpool worker. Same arguments, memo and return value.
+    """
+    mode = mode or RANKER_MODE
+    if mode not in RANKING_MODES:
+        raise ValueError(f"Unknown ranking mode '{mode}'. Expected one of {RANKING_MODES}.")
+    if not courses or mode == "local":
+        # Nothing to await: local ranking never calls the LLM
+        return rank_courses(user_goal, current_topic, courses, dedupe=dedupe, mode=mode)
+
+    candidates = _prepare_candidates(user_goal, current_topic, courses, dedupe, top_k)
+    # The ranking memo is SQLite; reads and writes run on a worker thread, off the event loop
+    entries, uncached = await asyncio.to_thread(_split_cached, user_goal, current_topic, candidates, use_cache)
+    if not uncached:
+        return _merge_ranked(user_goal, current_topic, candidates, entries)
+
+    try:
+        response = await gemini_chat.acall((ranker_prompt | llm_ranker | parser).ainvoke, {
+            "user_goal": user_goal,
+            "current_topic": current_topic,
+            "courses_list": _format_courses(uncached)
+        }, config=_METRICS_CONFIG)
+    except ServiceUnavailable as e:
+        print(f"🔴 {e} Ranking courses locally.")
+        mark_degraded()
+        return rank_courses_locally(user_goal, current_topic, candidates)
+    except Exception as e:
+        print(f"🔴 Error ranking courses: {e}")
+        return _merge_ranked(user_goal, current_topic, candidates, entries)
+
+    return await asyncio.to_thread(_finish_ranking, user_goal, current_topic, candidates, entries, uncached,
+                                   response.get('ranked_courses', []), use_cache)
+
+
+def stream_rank_courses(user_goal: str, current_topic: str, courses: List[Dict], dedupe: bool = True,
+                        mode: str = None, top_k: int = None, use_cache: bool = True) -> Iterator[Dict]:
+    """
+    Streaming variant of rank_courses: yields each ranked course as soon as it is known.
+
+    The LLM output is parsed incrementally; a course is yielded once the model has moved on to
+    the next one (or finished), so the top recommendation arrives long before the full list.
+    Memoized courses are interleaved by score: every cached course scoring at least as high as
+    the next streamed course is yielded before it.
+
+    Args:
+        Same as rank_courses.
+
+    Yields:
+        Dict: Ranked course dictionaries with 'title', 'link', 'reason' and 'score', best first.
+    """
+    mode = mode or RANKER_MODE
+    if mode not in RANKING_MODES:
+        raise ValueError(f"Unknown ranking mode '{mode}'. Expected one of {RANKING_MODES}.")
+    if not courses:
+        return
+
+    if mode == "local":
+        if dedupe:
+            courses, _ = dedupe_courses(courses)
+        yield from rank_courses_locally(user_goal, current_topic, courses)
+        return
+
+    candidates = _prepare_candidates(user_goal, current_topic, courses, dedupe, top_k)
+    entries, uncached = _split_cached(user_goal, current_topic, candidates, use_cache)
+    # Cached courses still to be yielded, best first
+    pending = _merge_ranked(user_goal, current_topic, candidates, entries)
+    if not uncached:
+        yield from pending
+        return
+
+    chain = ranker_prompt | llm_ranker | parser
+    emitted = 0
+    ranked_items: List[Dict] = []
+    new_entries: Dict[str, Dict] = {}
+
+    def complete(items):
+        for item in items:
+            match = _match_ranked(user_goal, current_topic, uncached, item)
+            if match is None or match[0] in new_entries:
+                continue
+            key, entry = match
+            new_entries[key] = entry
+            while pending and pending[0]["score"] >= entry["score"]:
+                yield pending.pop(0)
+            yield entry
+
+    try:
+        for partial in gemini_chat.stream(lambda: chain.stream({
+            "user_goal": user_goal,
+            "current_topic": current_topic,
+            "courses_list": _format_courses(uncached)
+        }, config=_METRICS_CONFIG)):
+            ranked_items = (partial or {}).get("ranked_courses") or []
+            # Every item except the last one is complete once a later one has started
+            if len(ranked_items) - 1 > emitted:
+                yield from complete(ranked_items[emitted:len(ranked_items) - 1])
+                emitted = len(ranked_items) - 1
+        yield from complete(ranked_items[emitted:])
+    except ServiceUnavailable as e:
+        # Raised before the stream starts, so nothing has been yielded yet
+        print(f"🔴 {e} Ranking courses locally.")
+        mark_degraded()
+        yield from rank_courses_locally(user_goal, current_topic, candidates)
+        return
+    except Exception as e:
+        print(f"🔴 Error streaming course ranking: {e}")
+        yield from pending
+        return # Don't memoize a partial ranking: unseen courses would look left out
+    yield from pending
+
+    if use_cache:
+        _memoize(_memo_entries(user_goal, current_topic, uncached, list(new_entries.values())))
+
+
+def rank_courses_batch(user_goal: str, topics: Dict[str, List[Dict]], dedupe: bool = True, mode: str = None,
+                       top_k: int = None, use_cache: bool = True, token_budget: int = None) -> Dict[str, List[Dict]]:
+    """
+    Ranks the courses of several topics of one goal (e.g. every roadmap section) together.
+
+    Each topic is deduped, pre-ranked and checked against the ranking memo exactly like
+    rank_courses. The remaining courses are then ranked either in ONE packed LLM call with a
+    per-topic result schema, when the packed prompt fits `token_budget`, or with concurrent
+    per-topic calls through the chain's batch API. Topics the packed answer leaves out are
+    retried with per-topic calls.
+
+    Args:
+        user_goal (str): The user's overall learning goal.
+        topics (Dict[str, List[Dict]]): Candidate courses per topic.
+        dedupe, mode, top_k, use_cache: Same as rank_courses.
+        token_budget (int): Maximum estimated prompt tokens for the packed call.
+                            Defaults to RANK_BATCH_TOKEN_BUDGET; 0 always uses per-topic calls.
+
+    Returns:
+        Dict[str, List[Dict]]: Ranked courses per topic, same shape as rank_courses' result.
+    """
+    mode = mode or RANKER_MODE
+    if mode not in RANKING_MODES:
+        raise ValueError(f"Unknown ranking mode '{mode}'. Expected one of {RANKING_MODES}.")
+    if mode == "local":
+        return {topic: rank_courses(user_goal, topic, courses, dedupe=dedupe, mode="local")
+                for topic, courses in topics.items()}
+
+    candidates, entries, uncached = _prepare_batch(user_goal, topics, dedupe, top_k, use_cache)
+
+    ranked_by_topic: Dict[str, List[Dict]] = {}
+    unavailable = set()
+    if uncached:
+        topics_list = _packed_topics_list(user_goal, uncached, token_budget)
+        if topics_list is not None:
+            try:
+                response = gemini_chat.call((batch_ranker_prompt | llm_ranker | batch_parser).invoke,
+                                            {"user_goal": user_goal, "topics_list": topics_list},
+                                            config=_METRICS_CONFIG)
+                ranked_by_topic.update(_unpack_topics(response, uncached))
+            except ServiceUnavailable as e:
+                print(f"🔴 {e} Ranking courses locally.")
+                mark_degraded()
+                unavailable.update(uncached)
+            except Exception as e:
+                print(f"🔴 Error ranking courses in a packed batch call, falling back to per-topic calls: {e}")
+
+        remaining = [topic for topic in uncached if topic not in ranked_by_topic and topic not in unavailable]
+        if remaining:
+            responses = _guarded_ranker_chain().batch(
+                [{"user_goal": user_goal, "current_topic": topic, "courses_list": _format_courses(uncached[topic])}
+                 for topic in remaining],
+                config=metrics.langchain_config("ranker", max_concurrency=RANK_BATCH_CONCURRENCY),
+                return_exceptions=True,
+            )
+            ranked_by_topic.update(_collect_topic_responses(remaining, responses, unavailable))
+
+    return _finish_batch(user_goal, topics, candidates, entries, uncached, ranked_by_topic, use_cache, unavailable)
+
+
+def _guarded_ranker_chain() -> RunnableLambda:
+    """The per-topic ranking chain with every call (sync or async) going through the Gemini limits."""
+    chain = ranker_prompt | llm_ranker | parser
+
+    def invoke(inputs: Dict, config: RunnableConfig) -> Dict:
+        return gemini_chat.call(chain.invoke, inputs, config=config)
+
+    async def ainvoke(inputs: Dict, config: RunnableConfig) -> Dict:
+        return await gemini_chat.acall(chain.ainvoke, inputs, config=config)
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+
+def _prepare_batch(user_goal: str, topics: Dict[str, List[Dict]], dedupe: bool, top_k: int, use_cache: bool):
+    """Returns the candidates, memoized entries and still-to-rank courses of every topic."""
+    candidates, entries, uncached = {}, {}, {}
+    for topic, courses in topics.items():
+        candidates[topic] = _prepare_candidates(user_goal, topic, courses, dedupe, top_k) if courses else []
+        entries[topic], pending = _split_cached(user_goal, topic, candidates[topic], use_cache)
+        if pending:
+            uncached[topic] = pending
+    return candidates, entries, uncached
+
+
+def _packed_topics_list(user_goal: str, uncached: Dict[str, List[Dict]], token_budget: int = None):
+    """Returns the packed topics list for one batch call, or None when per-topic calls should be used."""
+    budget = RANK_BATCH_TOKEN_BUDGET if token_budget is None else token_budget
+    topics_list = "\n\n".join(f"### Topic: {topic}\n{_format_courses(courses)}" for topic, courses in uncached.items())
+    packed_prompt = batch_ranker_prompt.format(user_goal=user_goal, topics_list=topics_list)
+    if len(uncached) > 1 and _estimate_tokens(packed_prompt) <= budget:
+        return topics_list
+    return None
+
+
+def _unpack_topics(response: Dict, uncached: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+    """Maps the packed answer's topics back to the requested topics (case/whitespace-insensitive)."""
+    ranked_by_topic = {}
+    normalized = {" ".join(t.lower().split()): t for t in uncached}
+    for item in response.get("topics", []):
+        topic = normalized.get(" ".join(str(item.get("topic", "")).lower().split()))
+        if topic is not None:
+            ranked_by_topic[topic] = item.get("ranked_courses", [])
+    return ranked_by_topic
+
+
+def _collect_topic_responses(remaining: List[str], responses: list, unavailable: set) -> Dict[str, List[Dict]]:
+    ranked_by_topic = {}
+    for topic, response in zip(remaining, responses):
+        if isinstance(response, ServiceUnavailable):
+            unavailable.add(topic)
+            continue
+        if isinstance(response, Exception):
+            print(f"🔴 Error ranking courses for '{topic}': {response}")
+            continue
+        ranked_by_topic[topic] = response.get("ranked_courses", [])
+    return ranked_by_topic
+
+
+def _finish_batch(user_goal: str, topics: Dict[str, List[Dict]], candidates: Dict, entries: Dict, uncached: Dict,
+                  ranked_by_topic: Dict[str, List[Dict]], use_cache: bool, unavailable: set) -> Dict[str, List[Dict]]:
+    results = {}
+    for topic in topics:
+        if topic in unavailable:
+            # Gemini was not called for this topic (overloaded or circuit open): rank locally, don't memoize
+            mark_degraded()
+            results[topic] = rank_courses_locally(user_goal, topic, candidates[topic])
+            continue
+        if topic in ranked_by_topic:
+            new_entries = _memo_entries(user_goal, topic, uncached[topic], ranked_by_topic[topic])
+            if use_cache:
+                _memoize(new_entries)
+            entries[topic].update(new_entries)
+        results[topic] = _merge_ranked(user_goal, topic, candidates[topic], entries[topic])
+    return results
+
+
+async def async_rank_courses_batch(user_goal: str, topics: Dict[str, List[Dict]], dedupe: bool = True,
+                                   mode: str = None, top_k: int = None, use_cache: bool = True,
+                                   token_budget: int = None) -> Dict[str, List[Dict]]:
+    """
+    Async variant of rank_courses_batch: the packed call and the per-topic fallback calls are
+    awaited (ainvoke/abatch). Same arguments, memo and return value.
+    """
+    mode = mode or RANKER_MODE
+    if mode not in RANKING_MODES:
+        raise ValueError(f"Unknown ranking mode '{mode}'. Expected one of {RANKING_MODES}.")
+    if mode == "local":
+        return rank_courses_batch(user_goal, topics, dedupe=dedupe, mode="local")
+
+    candidates, entries, uncached = await asyncio.to_thread(_prepare_batch, user_goal, topics, dedupe, top_k, use_cache)
+
+    ranked_by_topic: Dict[str, List[Dict]] = {}
+    unavailable = set()
+    if uncached:
+        topics_list = _packed_topics_list(user_goal, uncached, token_budget)
+        if topics_list is not None:
+            try:
+                response = await gemini_chat.acall((batch_ranker_prompt | llm_ranker | batch_parser).ainvoke,
+                                                   {"user_goal": user_goal, "topics_list": topics_list},
+                                                   config=_METRICS_CONFIG)
+                ranked_by_topic.update(_unpack_topics(response, uncached))
+            except ServiceUnavailable as e:
+                print(f"🔴 {e} Ranking courses locally.")
+                mark_degraded()
+                unavailable.update(uncached)
+            except Exception as e:
+                print(f"🔴 Error ranking courses in a packed batch call, falling back to per-topic calls: {e}")
+
+        remaining = [topic for topic in uncached if topic not in ranked_by_topic and topic not in unavailable]
+        if remaining:
+            responses = await _guarded_ranker_chain().abatch(
+                [{"user_goal": user_goal, "current_topic": topic, "courses_list": _format_courses(uncached[topic])}
+                 for topic in remaining],
+                config=metrics.langchain_config("ranker", max_concurrency=RANK_BATCH_CONCURRENCY),
+                return_exceptions=True,
+            )
+            ranked_by_topic.update(_collect_topic_responses(remaining, responses, unavailable))
+
+    return await asyncio.to_thread(_finish_batch, user_goal, topics, candidates, entries, uncached, ranked_by_topic,
+                                   use_cache, unavailable)
+
 
+def ranking_cache_stats() -> Dict:
+    """Returns hit/miss counters and the entry count of the per-course ranking memo."""
+    return ranking_cache.stats()
@@ -1,23 +1,117 @@
+import asyncio
 import os
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+from course_index import get_course_index
+import metrics
+from rate_limiter import TokenBucket
+from resilience import DeadlineExceeded, ServiceUnavailable, mark_degraded, remaining_time, serper
+from sqlite_cache import SQLiteCache, default_cache_path, cache_key, FRESH, STALE
+
 # Load environment variables from .env file
 load_dotenv()
 
-def search_courses(topic: str, num_results=10): # Increased default num_results for global search
-    """
-    Searches for online courses related to a given topic using Serper.dev's Google Search API.
+# Serper results are cached on disk so repeated goals don't cost quota or latency.
+# The cache file is shared by every worker process.
+SEARCH_CACHE_ENABLED = os.getenv("SERPER_CACHE_ENABLED", "true").lower() != "false"
+search_cache = SQLiteCache(
+    default_cache_path(),
+    namespace="serper_search",
+    ttl=float(os.getenv("SERPER_CACHE_TTL", 24 * 3600)),              # Serve as fresh for a day
+    stale_ttl=float(os.getenv("SERPER_CACHE_STALE_TTL", 7 * 24 * 3600)),  # Then serve stale while refreshing
+    max_entries=int(os.getenv("SERPER_CACHE_MAX_ENTRIES", 5000)),
+)
 
-    Args:
-        topic (str): The topic for which to search courses (e.g., "Python basics").
-        num_results (int): The maximum number of search results to retrieve.
+# Search modes:
+#   "online"      - on-disk cache, then Serper (default)
+#   "local_first" - answer from the local course index when it has enough strong hits, else go online
+#   "local"       - local course index only; never calls Serper
+SEARCH_MODES = ("online", "local_first", "local")
+COURSE_SEARCH_MODE = os.getenv("COURSE_SEARCH_MODE", "online")
+LOCAL_INDEX_MIN_HITS = int(os.getenv("LOCAL_INDEX_MIN_HITS", 5))
+LOCAL_INDEX_MIN_SCORE = float(os.getenv("LOCAL_INDEX_MIN_SCORE", 0.6))
 
-    Returns:
-        list[dict]: A list of dictionaries, where each dictionary represents a course
-                    and contains 'title', 'link', and 'snippet'.
-                    Returns an empty list if an error occurs or no results are found.
+SERPER_SEARCH_URL = "https://google.serper.dev/search"
+
+# HTTP client settings. Connections are pooled and kept alive across searches, and a hung
+# upstream can never block a worker for longer than the timeouts below (per attempt).
+SERPER_CONNECT_TIMEOUT = float(os.getenv("SERPER_CONNECT_TIMEOUT", 3.05))
+SERPER_READ_TIMEOUT = float(os.getenv("SERPER_READ_TIMEOUT", 10))
+SERPER_MAX_RETRIES = int(os.getenv("SERPER_MAX_RETRIES", 3))
+SERPER_BACKOFF_BASE = float(os.getenv("SERPER_BACKOFF_BASE", 0.5))  # Seconds; doubled on every retry
+SERPER_BACKOFF_MAX = float(os.getenv("SERPER_BACKOFF_MAX", 8))
+SERPER_POOL_SIZE = int(os.getenv("SERPER_POOL_SIZE", 20))
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Client-side rate limit shared by every search in this process (including retries),
+# so batch fan-out stays under Serper's per-second quota.
+SERPER_RATE_LIMIT = float(os.getenv("SERPER_RATE_LIMIT", 5))     # Requests per second; 0 disables
+SERPER_RATE_BURST = float(os.getenv("SERPER_RATE_BURST", 10))
+SERPER_BATCH_CONCURRENCY = int(os.getenv("SERPER_BATCH_CONCURRENCY", 8))
+rate_limiter = TokenBucket(SERPER_RATE_LIMIT, SERPER_RATE_BURST)
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()  # One pooled client per event loop
+
+
+def _get_session() -> requests.Session:
+    """Returns the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Retries are handled by _fetch_courses so sync and async share one policy
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SERPER_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Returns the pooled async client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SERPER_READ_TIMEOUT, connect=SERPER_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=SERPER_POOL_SIZE, max_keepalive_connections=SERPER_POOL_SIZE),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_http_clients():
+    """Closes the async client of the running event loop. Call this on application shutdown."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _retry_delay(attempt: int, retry_after: str = None) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based): exponential backoff with full
+    jitter, or the server's Retry-After value when it sends one.
     """
+    if retry_after:
+        try:
+            return min(float(retry_after), SERPER_BACKOFF_MAX)
+        except ValueError:
+            pass # HTTP-date form; fall back to our own backoff
+    return random.uniform(0, min(SERPER_BACKOFF_MAX, SERPER_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _build_request(topic: str, num_results: int):
     headers = {
         "X-API-KEY": os.getenv("SERPER_API_KEY"), # Ensure SERPER_API_KEY is set in your .env
         "Content-Type": "application/json"
@@ -29,31 +123,338 @@ def search_courses(topic: str, num_results=10): # Increased default num_results
         "q": f"{topic} course site:udemy.com OR site:coursera.org OR site:edx.org OR site:freecodecamp.org OR site:pluralsight.com OR site:linkedin.com/learning OR site:datacamp.com OR site:khanacademy.org",
         "num": num_results
     }
+    return headers, data
 
+
+def _parse_results(payload: dict) -> list:
+    results = payload.get("organic", []) # Extract organic search results
+
+    # Format results into a consistent dictionary structure
+    return [{
+        "title": r["title"],
+        "link": r["link"],
+        "snippet": r.get("snippet", "") # Use .get to avoid KeyError if snippet is missing
+    } for r in results]
+
+
+def _harvest(results: list) -> list:
+    """Adds freshly fetched results to the local course catalog, so later searches can be served offline."""
     try:
-        response = requests.post("https://google.serper.dev/search", headers=headers, json=data)
+        get_course_index().add(results)
+    except Exception as e:
+        print(f"Could not add search results to the local course index: {e}")
+    return results
+
+
+def _search_local(topic: str, num_results: int, min_hits: int) -> list:
+    """
+    Returns the local index's results for `topic` if at least `min_hits` of them score above
+    LOCAL_INDEX_MIN_SCORE, otherwise None.
+    """
+    hits = [record for score, record in get_course_index().search(topic, k=num_results)
+            if score >= LOCAL_INDEX_MIN_SCORE]
+    if len(hits) < min_hits:
+        return None
+    return [record.to_dict() for record in hits]
+
+
+def _time_left() -> Optional[float]:
+    """Seconds left before the request's deadline (None outside a request); raises DeadlineExceeded once it passed."""
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded("Serper was not called: the request deadline has passed.")
+    return remaining
+
+
+def _sleep_before_retry(delay: float):
+    """Sleeps before a retry, unless the retry could not start before the request's deadline."""
+    remaining = _time_left()
+    if remaining is not None and delay >= remaining:
+        raise DeadlineExceeded("Serper was not retried: the request deadline would pass first.")
+    time.sleep(delay)
+
+
+def _fetch_courses(topic: str, num_results: int) -> list:
+    """
+    Performs the actual Serper.dev request, retrying on 429/5xx and connection errors.
+    Raises on any final failure so that errors are never cached. Within a request, no rate
+    limit wait, attempt or retry delay runs past the request's deadline (DeadlineExceeded).
+    """
+    headers, data = _build_request(topic, num_results)
+    session = _get_session()
+    for attempt in range(SERPER_MAX_RETRIES + 1):
+        if not rate_limiter.acquire(timeout=_time_left()):
+            raise DeadlineExceeded("Serper was not called: the rate limit would delay it past the request deadline.")
+        remaining = _time_left()
+        read_timeout = SERPER_READ_TIMEOUT if remaining is None else min(SERPER_READ_TIMEOUT, remaining)
+        try:
+            with metrics.stage("course_search", "http_search"):
+                response = session.post(SERPER_SEARCH_URL, headers=headers, json=data,
+                                        timeout=(SERPER_CONNECT_TIMEOUT, read_timeout))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if read_timeout < SERPER_READ_TIMEOUT and remaining_time() <= 0:
+                # Cut short by the caller's deadline, not a failure of Serper
+                raise DeadlineExceeded("Serper did not answer within the request deadline.") from None
+            if attempt == SERPER_MAX_RETRIES:
+                raise
+            _sleep_before_retry(_retry_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUS_CODES and attempt < SERPER_MAX_RETRIES:
+            _sleep_before_retry(_retry_delay(attempt, response.headers.get("Retry-After")))
+            continue
         response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        
-        results = response.json().get("organic", []) # Extract organic search results
-        
-        # Format results into a consistent dictionary structure
-        formatted_results = [{
-            "title": r["title"],
-            "link": r["link"],
-            "snippet": r.get("snippet", "") # Use .get to avoid KeyError if snippet is missing
-        } for r in results]
-        
-        return formatted_results
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Error during API request to Serper.dev: {e}")
-        # Optionally, log the full response for more details: print(response.text)
-        return []
-    except KeyError:
-        print("Error parsing Serper.dev response: 'organic' key not found or unexpected structure.")
-        # print(response.json()) # Uncomment to see the problematic JSON response
+        return _harvest(_parse_results(response.json()))
+
+
+async def _afetch_courses(topic: str, num_results: int) -> list:
+    """Async counterpart of _fetch_courses, using the pooled httpx client."""
+    headers, data = _build_request(topic, num_results)
+    client = _get_async_client()
+    for attempt in range(SERPER_MAX_RETRIES + 1):
+        await rate_limiter.aacquire()
+        try:
+            with metrics.stage("course_search", "http_search"):
+                response = await client.post(SERPER_SEARCH_URL, headers=headers, json=data)
+        except httpx.TransportError:
+            if attempt == SERPER_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+            continue
+        if response.status_code in RETRY_STATUS_CODES and attempt < SERPER_MAX_RETRIES:
+            await asyncio.sleep(_retry_delay(attempt, response.headers.get("Retry-After")))
+            continue
+        response.raise_for_status()
+        # Harvesting writes to the local index's SQLite file
+        return await asyncio.to_thread(_harvest, _parse_results(response.json()))
+
+
+def _search_cache_key(topic: str, num_results: int) -> str:
+    return cache_key(topic, num_results)
+
+
+def _revalidate(topic: str, num_results: int, key: str):
+    """Refreshes a stale cache entry. Runs on a background thread; failures keep the stale entry."""
+    try:
+        search_cache.set(key, serper.call(_fetch_courses, topic, num_results))
+    except Exception as e:
+        print(f"Background refresh of course search for '{topic}' failed: {e}")
+        metrics.record_error("course_search", e)
+
+
+async def _arevalidate(topic: str, num_results: int, key: str):
+    """Async counterpart of _revalidate, scheduled as a task on the running loop."""
+    try:
+        results = await serper.acall(_afetch_courses, topic, num_results)
+        await asyncio.to_thread(search_cache.set, key, results)
+    except Exception as e:
+        print(f"Background refresh of course search for '{topic}' failed: {e}")
+        metrics.record_error("course_search", e)
+
+
+_background_tasks = set()  # Keeps refresh tasks referenced until they finish
+
+
+def _check_mode(mode: str) -> str:
+    mode = mode or COURSE_SEARCH_MODE
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown course search mode '{mode}'. Expected one of {SEARCH_MODES}.")
+    return mode
+
+
+def _search_offline(topic: str, num_results: int, mode: str):
+    """Handles the local tiers of a search. Returns results, or None if the caller should go online."""
+    if mode == "local":
+        return _search_local(topic, num_results, min_hits=0)
+    if mode == "local_first":
+        return _search_local(topic, num_results, min_hits=min(num_results, LOCAL_INDEX_MIN_HITS))
+    return None
+
+
+def _search_cached(topic: str, num_results: int, mode: str) -> Tuple[Optional[list], str, bool]:
+    """
+    The offline part of a search: local tiers, then the search cache. Returns (results, or None if
+    the caller must fetch them; the cache key; whether the caller should refresh a stale entry).
+    """
+    key = _search_cache_key(topic, num_results)
+    local_results = _search_offline(topic, num_results, _check_mode(mode))
+    if local_results is not None:
+        return local_results, key, False
+    if SEARCH_CACHE_ENABLED:
+        cached, state = search_cache.lookup(key)
+        if state in (FRESH, STALE):
+            return cached, key, state == STALE and search_cache.claim_refresh(key)
+    return None, key, False
+
+
+def _search(topic: str, num_results: int, mode: str = None) -> list:
+    """Cache-aware search that raises on failure. Shared by the single and batch APIs."""
+    results, key, refresh = _search_cached(topic, num_results, mode)
+    if refresh:
+        threading.Thread(target=_revalidate, args=(topic, num_results, key), daemon=True).start()
+    if results is not None:
+        return results
+
+    try:
+        formatted_results = serper.call(_fetch_courses, topic, num_results)
+    except ServiceUnavailable as e:
+        print(f"{e} Searching the local course index instead.")
+        mark_degraded()
+        return _search_local(topic, num_results, min_hits=0)
+    if SEARCH_CACHE_ENABLED and formatted_results:
+        search_cache.set(key, formatted_results)
+    return formatted_results
+
+
+async def _asearch(topic: str, num_results: int, mode: str = None) -> list:
+    """Async counterpart of _search. SQLite work (cache, local index) runs on worker threads."""
+    results, key, refresh = await asyncio.to_thread(_search_cached, topic, num_results, mode)
+    if refresh:
+        task = asyncio.get_running_loop().create_task(_arevalidate(topic, num_results, key))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    if results is not None:
+        return results
+
+    try:
+        formatted_results = await serper.acall(_afetch_courses, topic, num_results)
+    except ServiceUnavailable as e:
+        print(f"{e} Searching the local course index instead.")
+        mark_degraded()
+        return await asyncio.to_thread(_search_local, topic, num_results, 0)
+    if SEARCH_CACHE_ENABLED and formatted_results:
+        await asyncio.to_thread(search_cache.set, key, formatted_results)
+    return formatted_results
+
+
+def _describe_error(e: Exception) -> str:
+    if isinstance(e, (requests.exceptions.RequestException, httpx.HTTPError)):
+        return f"Error during API request to Serper.dev: {e}"
+    if isinstance(e, KeyError):
+        return "Error parsing Serper.dev response: 'organic' key not found or unexpected structure."
+    return f"An unexpected error occurred during course search: {e}"
+
+
+def search_courses(topic: str, num_results=10, mode: str = None): # Increased default num_results for global search
+    """
+    Searches for online courses related to a given topic using Serper.dev's Google Search API.
+
+    Results are cached on disk by normalized topic and `num_results`. Stale entries are
+    returned immediately and refreshed in the background. Every fetched result is also
+    harvested into the local course index, which the "local_first" and "local" modes
+    search before (or instead of) calling Serper.
+
+    Args:
+        topic (str): The topic for which to search courses (e.g., "Python basics").
+        num_results (int): The maximum number of search results to retrieve.
+        mode (str): One of SEARCH_MODES. Defaults to the COURSE_SEARCH_MODE setting.
+
+    Returns:
+        list[dict]: A list of dictionaries, where each dictionary represents a course
+                    and contains 'title', 'link', and 'snippet'.
+                    Returns an empty list if an error occurs or no results are found.
+    """
+    _check_mode(mode)
+    try:
+        return _search(topic, num_results, mode)
+    except Exception as e:
+        metrics.record_error("course_search", e)
+        print(_describe_error(e))
         return []
+
+
+async def async_search_courses(topic: str, num_results=10, mode: str = None):
+    """
+    Async variant of search_courses built on a pooled httpx client, so FastAPI handlers can
+    await searches without occupying a threadpool worker. Shares the same on-disk cache.
+
+    Args:
+        topic (str): The topic for which to search courses (e.g., "Python basics").
+        num_results (int): The maximum number of search results to retrieve.
+        mode (str): One of SEARCH_MODES. Defaults to the COURSE_SEARCH_MODE setting.
+
+    Returns:
+        list[dict]: Courses with 'title', 'link', and 'snippet'. Returns an empty list on errors.
+    """
+    _check_mode(mode)
+    try:
+        return await _asearch(topic, num_results, mode)
     except Exception as e:
-        print(f"An unexpected error occurred during course search: {e}")
+        metrics.record_error("course_search", e)
+        print(_describe_error(e))
         return []
 
+
+def _batch_result(topic: str, results: list = None, error: Exception = None) -> dict:
+    if error is not None:
+        metrics.record_error("course_search", error)
+        print(f"Course search for '{topic}' failed: {_describe_error(error)}")
+        return {"topic": topic, "results": [], "error": _describe_error(error)}
+    return {"topic": topic, "results": results, "error": None}
+
+
+def search_courses_batch(topics: List[str], num_results=10, max_concurrency: int = None,
+                         mode: str = None) -> List[dict]:
+    """
+    Searches courses for several topics at once (e.g., every section of a roadmap).
+
+    Searches fan out over a thread pool of at most `max_concurrency` workers, while the shared
+    token bucket keeps the overall request rate under Serper's limit. Duplicate topics are only
+    searched once.
+
+    Args:
+        topics (List[str]): Topics to search for.
+        num_results (int): The maximum number of search results per topic.
+        max_concurrency (int): Maximum searches in flight. Defaults to SERPER_BATCH_CONCURRENCY.
+        mode (str): One of SEARCH_MODES. Defaults to the COURSE_SEARCH_MODE setting.
+
+    Returns:
+        List[dict]: One entry per input topic, in input order, with keys 'topic', 'results'
+                    (list of courses) and 'error' (None, or a message if that topic failed).
+    """
+    _check_mode(mode)
+    unique_topics = list(dict.fromkeys(topics))
+    if not unique_topics:
+        return []
+    workers = min(max_concurrency or SERPER_BATCH_CONCURRENCY, len(unique_topics))
+
+    def run(topic):
+        try:
+            return _batch_result(topic, _search(topic, num_results, mode))
+        except Exception as e:
+            return _batch_result(topic, error=e)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        by_topic = dict(zip(unique_topics, executor.map(run, unique_topics)))
+    return [by_topic[topic] for topic in topics]
+
+
+async def async_search_courses_batch(topics: List[str], num_results=10, max_concurrency: int = None,
+                                     mode: str = None) -> List[dict]:
+    """
+    Async variant of search_courses_batch. Same arguments and return value; concurrency is
+    bounded with a semaphore instead of a thread pool.
+    """
+    _check_mode(mode)
+    unique_topics = list(dict.fromkeys(topics))
+    semaphore = asyncio.Semaphore(max_concurrency or SERPER_BATCH_CONCURRENCY)
+
+    async def run(topic):
+        async with semaphore:
+            try:
+                return _batch_result(topic, await _asearch(topic, num_results, mode))
+            except Exception as e:
+                return _batch_result(topic, error=e)
+
+    results = await asyncio.gather(*(run(topic) for topic in unique_topics))
+    by_topic = dict(zip(unique_topics, results))
+    return [by_topic[topic] for topic in topics]
+
+
+def search_cache_stats() -> dict:
+    """Returns hit/miss counters and the entry count of the course search cache."""
+    return search_cache.stats()
+
+
+def course_index_stats() -> dict:
+    """Returns the size and platform facets of the local course index."""
+    return get_course_index().stats()
@@ -0,0 +1,156 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+import metrics
+from sqlite_cache import transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model      TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    text_hash  TEXT NOT NULL,
+    vector     BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (model, kind, text_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_age ON embeddings (created_at);
+"""
+
+# SQLite's default limit on bound parameters per statement is 999
+_SELECT_BATCH = 500
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model with a persistent cache keyed by (model, text hash).
+
+    Only texts that were never embedded with the model are sent to the wrapped model, in
+    batches of `batch_size`; everything else is read from SQLite. Documents and queries are
+    cached separately because some models (including Gemini's) embed them differently.
+    When the cache exceeds `max_entries`, the oldest vectors are deleted first.
+
+    Args:
+        embeddings (Embeddings): The embedding model to wrap.
+        model (str): Model name, part of the cache key so switching models never mixes vectors.
+        path (str): SQLite file backing the cache.
+        batch_size (int): Maximum texts per request to the wrapped model.
+        max_entries (int): Maximum number of cached vectors.
+        upstream (Upstream): Optional concurrency limit/circuit breaker (see resilience) every
+                             request to the wrapped model goes through; cache hits never wait for it.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, path: str, batch_size: int = 100,
+                 max_entries: int = 200000, upstream=None):
+        self.embeddings = embeddings
+        self.upstream = upstream
+        self.model = model
+        self.path = path
+        self.batch_size = batch_size
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "api_calls": 0, "evictions": 0}
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def _lookup(self, kind: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        conn = self._conn()
+        for start in range(0, len(hashes), _SELECT_BATCH):
+            batch = hashes[start:start + _SELECT_BATCH]
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND kind = ? "
+                f"AND text_hash IN ({','.join('?' * len(batch))})",
+                [self.model, kind, *batch],
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def _store(self, kind: str, vectors: Dict[str, List[float]]):
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, kind, text_hash, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(self.model, kind, text_hash, array("f", vector).tobytes(), now)
+                 for text_hash, vector in vectors.items()],
+            )
+            (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY created_at LIMIT ?)",
+                    (overflow,),
+                )
+        if overflow > 0:
+            self._count("evictions", overflow)
+
+    def _embed(self, kind: str, texts: List[str]) -> List[List[float]]:
+        hashes = [_hash(text) for text in texts]
+        unique = list(dict.fromkeys(hashes))
+        vectors = self._lookup(kind, unique)
+        self._count("hits", sum(1 for h in hashes if h in vectors))
+
+        # Each distinct missing text is embedded once, in batches
+        missing = [h for h in unique if h not in vectors]
+        if missing:
+            self._count("misses", sum(1 for h in hashes if h not in vectors))
+            text_for = dict(zip(hashes, texts))
+            new = {}
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                if kind == "query":
+                    embedded = [self._call(self.embeddings.embed_query, text_for[h]) for h in batch]
+                else:
+                    embedded = self._call(self.embeddings.embed_documents, [text_for[h] for h in batch])
+                self._count("api_calls", 1 if kind == "document" else len(batch))
+                # Round-trip through float32, so a text embeds identically whether cached or not
+                new.update((h, array("f", vector).tolist()) for h, vector in zip(batch, embedded))
+            try:
+                self._store(kind, new)
+            except sqlite3.Error as e:
+                print(f"🔴 Could not cache embeddings: {e}")
+                metrics.record_error("embedding_cache", e)
+            vectors.update(new)
+        return [vectors[h] for h in hashes]
+
+    def _call(self, fn, *args):
+        fn = metrics.timed("embedding_cache", "embedding", fn)
+        return fn(*args) if self.upstream is None else self.upstream.call(fn, *args)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("document", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text])[0]
+
+    def stats(self) -> Dict:
+        """Returns cache hits and misses (in texts), calls made to the wrapped model and the hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        stats["model"] = self.model
+        return stats
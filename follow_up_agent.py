@@ -1,95 +1,227 @@
+import asyncio
 import os
-import streamlit as st
-from langchain_community.vectorstores import FAISS
+import threading
+from typing import Dict
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import RetrievalQA
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.documents import Document
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
 
+import metrics
+from answer_cache import FollowUpAnswerCache
+from embedding_cache import CachedEmbeddings
+from resilience import ServiceUnavailable, gemini_chat, gemini_embeddings, mark_degraded
+from roadmap_parser import content_hash
+from roadmap_retriever import choose_mode, local_context, retrieve_context
+from sqlite_cache import CACHE_DIR, default_cache_path
+from vector_store_manager import VectorStoreManager
+
 load_dotenv()
 
-# --- Debugging: Verify API Key Loading ---
 google_api_key = os.getenv("GOOGLE_API_KEY")
 if not google_api_key:
     print("WARNING: GOOGLE_API_KEY not found in environment variables for follow_up_agent.py!")
-else:
-    print("DEBUG: GOOGLE_API_KEY loaded successfully in follow_up_agent.py")
-# --- End Debugging ---
 
-def answer_follow_up_question(roadmap_text: str, user_goal: str, question: str) -> str:
+# Chunk embeddings are cached by (model, chunk hash): a regenerated or edited roadmap only sends
+# the chunks that actually changed to the embedding API.
+EMBEDDING_MODEL = "models/embedding-001"
+embeddings = CachedEmbeddings(
+    GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=google_api_key),
+    model=EMBEDDING_MODEL,
+    path=default_cache_path("embeddings.sqlite3"),
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 100)),
+    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000)),
+    upstream=gemini_embeddings,
+)
+
+# Roadmap vector stores, keyed by a hash of the roadmap text and persisted to disk, so each
+# roadmap is embedded once no matter how many questions are asked or which process answers them.
+vector_stores = VectorStoreManager(
+    os.getenv("VECTOR_STORE_DIR") or os.path.join(CACHE_DIR, "vector_stores"),
+    embeddings,
+    max_bytes=int(os.getenv("VECTOR_STORE_MAX_BYTES", 64 * 1024 * 1024)),
+    max_disk_entries=int(os.getenv("VECTOR_STORE_MAX_DISK_ENTRIES", 1000)),
+)
+
+# Answers are cached by (roadmap hash, question); paraphrased questions about the same roadmap
+# are matched by embedding similarity. The goal and retrieval mode are not part of the key:
+# a roadmap already belongs to one goal, and every mode answers from the same roadmap.
+FOLLOW_UP_ANSWER_CACHE_ENABLED = os.getenv("FOLLOW_UP_ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+answer_cache = FollowUpAnswerCache(
+    default_cache_path("follow_up_answers.sqlite3"),
+    embed=embeddings.embed_query,
+    threshold=float(os.getenv("FOLLOW_UP_ANSWER_CACHE_THRESHOLD", 0.93)),
+    ttl=float(os.getenv("FOLLOW_UP_ANSWER_CACHE_TTL", 7 * 24 * 3600)),
+    max_entries=int(os.getenv("FOLLOW_UP_ANSWER_CACHE_MAX_ENTRIES", 20000)),
+)
+
+QA_PROMPT_TEMPLATE = """
+    You are an AI assistant specialized in providing guidance based on a learning roadmap.
+    Your task is to answer the user's follow-up question ONLY using the provided learning roadmap context.
+    If the answer cannot be found in the roadmap context, politely state that the information is not available in the roadmap.
+
+    User's original learning goal: {user_goal}
+    User's follow-up question: {question}
+
+    Roadmap Context:
+    {context}
+
+    Answer:
+    """
+QA_CHAIN_PROMPT = PromptTemplate.from_template(QA_PROMPT_TEMPLATE)
+# Records prompt/LLM latency, tokens and errors of the QA chain (see metrics)
+_METRICS_CONFIG = metrics.langchain_config("follow_up")
+
+# The LLM client and QA chain are built once per process, on the first question, and shared by
+# all threads (the chain holds no per-request state).
+_qa_chain = None
+_qa_chain_lock = threading.Lock()
+
+def _get_qa_chain():
+    """Returns the process-wide prompt | LLM chain, creating it on first use."""
+    global _qa_chain
+    if _qa_chain is None:
+        with _qa_chain_lock:
+            if _qa_chain is None:
+                llm = ChatGoogleGenerativeAI(model="gemini-pro", temperature=0.3, google_api_key=google_api_key)
+                _qa_chain = QA_CHAIN_PROMPT | llm
+    return _qa_chain
+
+def _dense_search(roadmap_text: str, question: str, k: int):
+    """Returns the k roadmap chunks most similar to the question, from the roadmap's FAISS index."""
+    # Split and embed the roadmap, unless its vector store is already in memory or on disk
+    vector_store = vector_stores.get(roadmap_text)
+    return [doc.page_content for doc in vector_store.similarity_search(question, k=k)]
+
+def answer_follow_up_question(roadmap_text: str, user_goal: str, question: str, retrieval_mode: str = None,
+                              use_cache: bool = True) -> str:
     """
     Answers a follow-up question based on the provided roadmap text.
 
+    Answers to the same (or a similar enough, see FOLLOW_UP_ANSWER_CACHE_THRESHOLD) question about
+    the same roadmap are served from the answer cache; cache errors never block answering.
+
     Args:
         roadmap_text (str): The full text of the generated roadmap.
         user_goal (str): The original learning goal of the user.
         question (str): The user's follow-up question.
+        retrieval_mode (str): How the roadmap context is selected: "stuff", "local", "dense" or
+                              "auto" (see roadmap_retriever). Defaults to FOLLOW_UP_RETRIEVAL_MODE.
+        use_cache (bool): Whether to look up and store the answer in the answer cache.
 
     Returns:
         str: The AI's answer to the question.
     """
     if not roadmap_text or not question:
         return "Please generate a roadmap and ask a valid question."
+    # Resolved up front so an unknown mode is reported to the caller instead of as a failed answer
+    retrieval_mode = choose_mode(roadmap_text, retrieval_mode)
 
-    # 1. Create a LangChain Document from the roadmap text
-    doc = Document(page_content=roadmap_text, metadata={"source": "roadmap"})
-
-    # 2. Split the document into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-        add_start_index=True,
-    )
-    chunks = text_splitter.split_documents([doc])
-
-    # 3. Create embeddings and a vector store
-    # FIX: Added leading underscore to '_docs' to prevent hashing error
-    @st.cache_resource(ttl="1h") 
-    def get_vector_store(_docs): # Changed 'docs' to '_docs'
-        embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=google_api_key)
-        vector_store = FAISS.from_documents(_docs, embeddings) # Use '_docs' here too
-        return vector_store
-
-    vector_store = get_vector_store(chunks) # Pass 'chunks' as before
-
-    # 4. Define the LLM
-    llm = ChatGoogleGenerativeAI(model="gemini-pro", temperature=0.3, google_api_key=google_api_key)
-
-    # 5. Create a RetrievalQA chain
-    template = """
-    You are an AI assistant specialized in providing guidance based on a learning roadmap.
-    Your task is to answer the user's follow-up question ONLY using the provided learning roadmap context.
-    If the answer cannot be found in the roadmap context, politely state that the information is not available in the roadmap.
+    use_cache = use_cache and FOLLOW_UP_ANSWER_CACHE_ENABLED
+    roadmap_hash = content_hash(roadmap_text)
+    if use_cache:
+        try:
+            cached, _ = answer_cache.lookup(roadmap_hash, question)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            print(f"🔴 Follow-up answer cache lookup failed: {e}")
+            metrics.record_error("answer_cache", e)
 
-    User's original learning goal: {user_goal}
-    User's follow-up question: {question}
+    # Only the context is per request; the chain is shared by every question
+    try:
+        context, _ = retrieve_context(roadmap_text, question, retrieval_mode, k=3, dense_search=_dense_search)
+        response = gemini_chat.call(_get_qa_chain().invoke,
+                                    {"user_goal": user_goal, "question": question, "context": context},
+                                    config=_METRICS_CONFIG)
+    except ServiceUnavailable as e:
+        print(f"🔴 {e} Answering with the matching roadmap sections.")
+        mark_degraded()
+        return _unavailable_answer(roadmap_text, question)
+    except Exception as e:
+        print(f"An error occurred while answering the follow-up question: {e}")
+        return "Sorry, I encountered an issue while processing your question. Please try again."
 
-    Roadmap Context:
-    {context}
+    if not response.content:
+        return "I couldn't find an answer to that question within the generated roadmap."
+    # Only real answers are cached; errors and empty responses are retried next time
+    if use_cache:
+        try:
+            answer_cache.store(roadmap_hash, question, response.content)
+        except Exception as e:
+            print(f"🔴 Could not cache follow-up answer: {e}")
+            metrics.record_error("answer_cache", e)
+    return response.content
 
-    Answer:
+def _unavailable_answer(roadmap_text: str, question: str) -> str:
+    """Degraded answer while Gemini is overloaded or unavailable: the roadmap sections the question is about."""
+    sections = "\n\n".join(local_context(roadmap_text, question, k=2))
+    return ("The assistant is busy right now, so here is the part of your roadmap that matches your question. "
+            "Please ask again in a moment for a full answer.\n\n" + sections)
+
+async def async_answer_follow_up_question(roadmap_text: str, user_goal: str, question: str,
+                                          retrieval_mode: str = None, use_cache: bool = True) -> str:
     """
-    QA_CHAIN_PROMPT = PromptTemplate.from_template(template)
+    Async variant of answer_follow_up_question: the LLM is called with ainvoke, so FastAPI
+    handlers can await it without occupying a threadpool worker. Same arguments, cache and
+    return value.
+
+    Work that may call the embedding API (answer cache, "dense" retrieval) runs on a worker thread.
+    """
+    if not roadmap_text or not question:
+        return "Please generate a roadmap and ask a valid question."
+    retrieval_mode = choose_mode(roadmap_text, retrieval_mode)
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm,
-        retriever=vector_store.as_retriever(search_kwargs={"k": 3}), # Retrieve top 3 relevant chunks
-        return_source_documents=False,
-        chain_type_kwargs={"prompt": QA_CHAIN_PROMPT}
-    )
+    use_cache = use_cache and FOLLOW_UP_ANSWER_CACHE_ENABLED
+    roadmap_hash = content_hash(roadmap_text)
+    if use_cache:
+        try:
+            cached, _ = await asyncio.to_thread(answer_cache.lookup, roadmap_hash, question)
+            if cached is not None:
+                return cached
+        except Exception as e:
+            print(f"🔴 Follow-up answer cache lookup failed: {e}")
+            metrics.record_error("answer_cache", e)
 
-    # 6. Invoke the chain to get the answer
     try:
-        response = qa_chain.invoke({"query": question, "user_goal": user_goal, "question": question})
-        return response.get("result", "I couldn't find an answer to that question within the generated roadmap.")
+        if retrieval_mode == "dense":
+            context, _ = await asyncio.to_thread(retrieve_context, roadmap_text, question, retrieval_mode,
+                                                 k=3, dense_search=_dense_search)
+        else:
+            context, _ = retrieve_context(roadmap_text, question, retrieval_mode, k=3)
+        response = await gemini_chat.acall(_get_qa_chain().ainvoke,
+                                           {"user_goal": user_goal, "question": question, "context": context},
+                                           config=_METRICS_CONFIG)
+    except ServiceUnavailable as e:
+        print(f"🔴 {e} Answering with the matching roadmap sections.")
+        mark_degraded()
+        return _unavailable_answer(roadmap_text, question)
     except Exception as e:
         print(f"An error occurred while answering the follow-up question: {e}")
         return "Sorry, I encountered an issue while processing your question. Please try again."
 
+    if not response.content:
+        return "I couldn't find an answer to that question within the generated roadmap."
+    if use_cache:
+        try:
+            await asyncio.to_thread(answer_cache.store, roadmap_hash, question, response.content)
+        except Exception as e:
+            print(f"🔴 Could not cache follow-up answer: {e}")
+            metrics.record_error("answer_cache", e)
+    return response.content
+
+def vector_store_stats() -> Dict:
+    """Returns memory/disk hit, build and eviction counters of the roadmap vector stores."""
+    return vector_stores.stats()
+
+def answer_cache_stats() -> Dict:
+    """Returns hit/miss counters, the hit rate and recent paraphrase similarities of the answer cache."""
+    return answer_cache.stats()
+
+def embedding_cache_stats() -> Dict:
+    """Returns hit/miss counters of the chunk embedding cache and how many embedding API calls were made."""
+    return embeddings.stats()
+
 if __name__ == '__main__':
     # This block is for testing the agent independently.
     # Set your GOOGLE_API_KEY environment variable for testing
@@ -0,0 +1,113 @@
+import re
+from typing import Dict, List, Tuple
+
+from course_index import platform_for, tokenize
+
+# Prior quality of each platform for a beginner audience (0..1). Unknown sites get "Other".
+PLATFORM_PRIORS = {
+    "Coursera": 0.9,
+    "edX": 0.85,
+    "freeCodeCamp": 0.85,
+    "Udemy": 0.8,
+    "Khan Academy": 0.8,
+    "DataCamp": 0.75,
+    "LinkedIn Learning": 0.7,
+    "Pluralsight": 0.7,
+    "Skillshare": 0.6,
+    "YouTube": 0.6,
+    "Other": 0.4,
+}
+
+_BEGINNER = re.compile(r"\b(beginners?|introduct\w*|intro|basics?|fundamentals?|from scratch|zero to|"
+                       r"no (prior )?experience|getting started|complete guide|bootcamp|101)\b", re.IGNORECASE)
+_FREE = re.compile(r"\b(free|audit|no cost|financial aid)\b", re.IGNORECASE)
+_ADVANCED = re.compile(r"\b(advanced|expert|masterclass for professionals|in[- ]depth internals)\b", re.IGNORECASE)
+
+# Weights of the scoring components; they sum to 1 so scores stay in 0..1.
+WEIGHTS = {"topic": 0.45, "goal": 0.2, "platform": 0.15, "beginner": 0.12, "free": 0.08}
+
+
+def _overlap(query_terms: set, doc_terms: set) -> float:
+    """Share of the query's terms that appear in the document."""
+    if not query_terms:
+        return 0.0
+    return len(query_terms & doc_terms) / len(query_terms)
+
+
+def score_course(user_goal: str, current_topic: str, course: Dict) -> Tuple[float, Dict[str, float]]:
+    """
+    Scores one course locally, without any LLM call.
+
+    The score mixes lexical overlap with the current topic and the overall goal, a per-platform
+    prior, and beginner/free signals from the title and snippet.
+
+    Returns:
+        Tuple[float, Dict[str, float]]: The overall score (0..1) and its individual components.
+    """
+    title = course.get("title", "")
+    text = f"{title} {course.get('snippet', '')}"
+    doc_terms = set(tokenize(text))
+    platform, _ = platform_for(course.get("link") or "")
+    beginner = 1.0 if _BEGINNER.search(text) else 0.0
+    if _ADVANCED.search(title):
+        beginner = -0.5
+    components = {
+        "topic": _overlap(set(tokenize(current_topic)), doc_terms),
+        "goal": _overlap(set(tokenize(user_goal)), doc_terms),
+        "platform": PLATFORM_PRIORS.get(platform, PLATFORM_PRIORS["Other"]),
+        "beginner": beginner,
+        "free": 1.0 if _FREE.search(text) else 0.0,
+    }
+    score = sum(WEIGHTS[name] * value for name, value in components.items())
+    return max(score, 0.0), components
+
+
+def prerank_courses(user_goal: str, current_topic: str, courses: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Keeps only the `top_k` most promising courses by local score, best first. Used to shrink
+    the candidate list before the LLM ranking call.
+    """
+    if top_k is None or len(courses) <= top_k:
+        return courses
+    scored = sorted(courses, key=lambda c: score_course(user_goal, current_topic, c)[0], reverse=True)
+    return scored[:top_k]
+
+
+def _reason(components: Dict[str, float], platform: str) -> str:
+    """Builds a short, human-readable reason from the strongest scoring signals."""
+    parts = []
+    if components["topic"] >= 0.5:
+        parts.append("closely matches the current topic")
+    elif components["goal"] >= 0.5:
+        parts.append("matches your overall goal")
+    if components["beginner"] > 0:
+        parts.append("is aimed at beginners")
+    if components["free"] > 0:
+        parts.append("can be taken for free")
+    if platform != "Other":
+        parts.append(f"is offered on {platform}")
+    if not parts:
+        return "Related to your search; ranked by local relevance."
+    return "This course " + ", ".join(parts[:-1]) + (" and " if len(parts) > 1 else "") + parts[-1] + "."
+
+
+def rank_courses_locally(user_goal: str, current_topic: str, courses: List[Dict]) -> List[Dict]:
+    """
+    Ranks courses entirely locally, for degraded operation when the LLM is unavailable or too slow.
+
+    Returns:
+        List[Dict]: Ranked course dictionaries with 'title', 'link', 'reason' and a 0-100 'score',
+                    like rank_courses. Local scores are not on the same scale as LLM scores.
+    """
+    ranked = []
+    for course in courses:
+        score, components = score_course(user_goal, current_topic, course)
+        platform, _ = platform_for(course.get("link") or "")
+        ranked.append((score, {
+            "title": course.get("title", "N/A"),
+            "link": course.get("link") or "",
+            "reason": _reason(components, platform),
+            "score": min(round(score * 100), 100),
+        }))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return [course for _, course in ranked]
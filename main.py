@@ -1,61 +1,407 @@
-from fastapi import FastAPI
+import asyncio
+import json
+import math
+import os
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict
 
-from roadmap_agent import generate_roadmap
-from course_search import search_courses
-from course_ranker_agent import rank_courses
-from follow_up_agent import answer_follow_up_question
+from roadmap_agent import async_generate_roadmap, stream_roadmap, roadmap_cache_stats, ROADMAP_STRATEGIES
+from roadmap_parser import content_hash, parse_roadmap
+from roadmap_catalog import ROADMAP_CATALOG_ENABLED, get_roadmap_catalog, roadmap_catalog_stats, start_catalog_refresher, stop_catalog_refresher
+from course_search import async_search_courses, async_search_courses_batch, search_cache_stats, course_index_stats, aclose_http_clients, SEARCH_MODES
+from course_ranker_agent import async_rank_courses, async_rank_courses_batch, stream_rank_courses, ranking_cache_stats, RANKING_MODES
+from course_dedup import dedupe_stats
+from follow_up_agent import async_answer_follow_up_question, answer_cache_stats, vector_store_stats, embedding_cache_stats
+from roadmap_retriever import RETRIEVAL_MODES
+from plan_pipeline import run_plan
+from roadmap_store import get_roadmap_store, roadmap_store_stats
+from resilience import DeadlineMiddleware, ServiceUnavailable, gemini_chat, upstream_stats
+from singleflight import SingleFlight, fingerprint
+import metrics
 
 app = FastAPI(title="PathPilot API")
+# Every request gets a deadline (REQUEST_TIMEOUT, or the client's X-Request-Timeout) that bounds
+# how long its upstream calls may wait for a slot and run
+app.add_middleware(DeadlineMiddleware)
+
+
+@app.exception_handler(ServiceUnavailable)
+async def service_unavailable_handler(request: Request, exc: ServiceUnavailable):
+    """Overload, open circuit breakers and passed deadlines become 429/503/504 with a Retry-After hint."""
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after is not None else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)}, headers=headers)
+
+# Identical requests that arrive while one is already being served share its upstream call.
+COALESCE_TIMEOUT = float(os.getenv("COALESCE_TIMEOUT", 120))
+roadmap_flight = SingleFlight("generate_roadmap", timeout=COALESCE_TIMEOUT)
+search_flight = SingleFlight("search_courses", timeout=COALESCE_TIMEOUT)
+rank_flight = SingleFlight("rank_courses", timeout=COALESCE_TIMEOUT)
+follow_up_flight = SingleFlight("follow_up", timeout=COALESCE_TIMEOUT)
+
+
+async def _acoalesced(flight: SingleFlight, key: str, fn):
+    try:
+        return await flight.ado(key, fn)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail="Timed out waiting for an identical in-flight request.")
+
+
+def _sse(event: str, data) -> str:
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    # X-Accel-Buffering stops nginx-style proxies from holding events back
+    return StreamingResponse(events, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 class GoalRequest(BaseModel):
     goal: str
     mode: str | None = "Beginner → Expert"
+    strategy: str | None = None  # "single" or "parallel"; defaults to ROADMAP_STRATEGY
+
+
+def _check_strategy(req: GoalRequest):
+    if req.strategy is not None and req.strategy not in ROADMAP_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"strategy must be one of {list(ROADMAP_STRATEGIES)}")
+
+
+class RoadmapSection(BaseModel):
+    index: int
+    heading: str
+    topics: str = ""
+    estimated_time: str = ""
+    tools: str = ""
+    projects: str = ""
+    resources: str = ""
+
+
+class StructuredRoadmap(BaseModel):
+    content_hash: str
+    intro: str = ""
+    sections: List[RoadmapSection]
+    career_guidance: str = ""
+    total_time: str = ""
 
 
 class RoadmapResponse(BaseModel):
-    sections: List[str]
+    roadmap_id: str  # Content hash; pass it to /api/follow_up instead of the roadmap text
+    sections: List[str]  # Raw text of each section, in order
+    roadmap: StructuredRoadmap
+    courses: Dict[str, List[Dict]] = {}  # Pre-ranked courses per topic, for catalogued goals
+    catalog_match: str | None = None  # "exact" or "near" when served from the roadmap catalog
+
+
+def _catalog_lookup(req: GoalRequest):
+    """Returns the pre-generated catalog entry for the request, or None. Catalog errors never fail a request."""
+    try:
+        return get_roadmap_catalog().lookup(req.goal, req.mode or "")
+    except Exception as e:
+        print(f"🔴 Roadmap catalog lookup failed: {e}")
+        return None
+
+
+def _remember_roadmap(roadmap: str, goal: str = "", mode: str = None) -> str:
+    """Stores a served roadmap so follow-ups can refer to it by id. Store errors never fail a request."""
+    try:
+        return get_roadmap_store().put(roadmap, goal, mode or "")
+    except Exception as e:
+        print(f"🔴 Could not store roadmap: {e}")
+        return content_hash(roadmap)
+
+
+def _etag(roadmap_id: str) -> str:
+    return f'"{roadmap_id}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names this ETag (weak or strong, or '*')."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _roadmap_body(roadmap_id: str, roadmap: str) -> Dict:
+    parsed = parse_roadmap(roadmap)
+    return {"roadmap_id": roadmap_id, "sections": [s.raw for s in parsed.sections], "roadmap": parsed.to_dict()}
 
 
 @app.post("/api/generate_roadmap", response_model=RoadmapResponse)
-def create_roadmap(req: GoalRequest):
-    """Generate a roadmap for the provided goal."""
-    roadmap = generate_roadmap(req.goal)
-    # split roadmap into sections by blank lines
-    sections = [s.strip() for s in roadmap.split("\n\n") if s.strip()]
-    return {"sections": sections}
+async def create_roadmap(req: GoalRequest, response: Response):
+    """
+    Generate a roadmap for the provided goal, as raw section texts and in structured form.
+    Popular goals are served instantly from the pre-generated catalog, with ranked courses.
+    The roadmap is stored under its `roadmap_id` (also sent as the ETag) for follow-up questions.
+    """
+    _check_strategy(req)
+    entry = await asyncio.to_thread(_catalog_lookup, req)
+    if entry is not None:
+        roadmap_id = await asyncio.to_thread(_remember_roadmap, entry["roadmap"], req.goal, req.mode)
+        response.headers["ETag"] = _etag(roadmap_id)
+        return {**_roadmap_body(roadmap_id, entry["roadmap"]), "courses": entry["courses"],
+                "catalog_match": entry["match"]}
+
+    roadmap = await _acoalesced(roadmap_flight, fingerprint(req.goal, req.mode, req.strategy),
+                                lambda: async_generate_roadmap(req.goal, req.mode, strategy=req.strategy))
+    roadmap_id = await asyncio.to_thread(_remember_roadmap, roadmap, req.goal, req.mode)
+    response.headers["ETag"] = _etag(roadmap_id)
+    return _roadmap_body(roadmap_id, roadmap)
+
+
+@app.get("/api/roadmaps/{roadmap_id}", response_model=RoadmapResponse)
+def get_roadmap(roadmap_id: str, request: Request, response: Response):
+    """
+    Return a stored roadmap by id. A roadmap never changes under its id, so clients revalidate
+    with If-None-Match (304 Not Modified) and may cache it indefinitely; an id that is no longer
+    stored answers 404 even then.
+    """
+    stored = get_roadmap_store().get(roadmap_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Unknown roadmap_id.")
+    etag = _etag(roadmap_id)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return _roadmap_body(roadmap_id, stored["roadmap"])
+
+
+@app.post("/api/generate_roadmap/stream")
+def create_roadmap_stream(req: GoalRequest):
+    """
+    Generate a roadmap and stream it as Server-Sent Events: "token" events carry generated text,
+    a "section" event is sent as soon as each section is complete, and a final "done" event
+    carries the full roadmap. Failures after the stream has started are sent as an "error" event.
+    """
+    _check_strategy(req)
+
+    entry = _catalog_lookup(req)
+    if entry is None:
+        # Fail fast with 429/503 instead of opening a stream that can only report an error
+        gemini_chat.check()
+
+    def events():
+        if entry is not None:
+            for section in parse_roadmap(entry["roadmap"]).sections:
+                yield _sse("section", section.to_dict())
+            yield _sse("done", {"roadmap": entry["roadmap"], "cached": True, "catalog_match": entry["match"],
+                                "roadmap_id": _remember_roadmap(entry["roadmap"], req.goal, req.mode)})
+            return
+        try:
+            for event in stream_roadmap(req.goal, req.mode, strategy=req.strategy):
+                if event["type"] == "token":
+                    yield _sse("token", {"text": event["text"]})
+                elif event["type"] == "section":
+                    yield _sse("section", event["section"].to_dict())
+                else:
+                    yield _sse("done", {"roadmap": event["roadmap"], "cached": event["cached"],
+                                        "roadmap_id": _remember_roadmap(event["roadmap"], req.goal, req.mode)})
+        except ServiceUnavailable as e:
+            yield _sse("error", {"detail": str(e)})
+        except Exception as e:
+            print(f"🔴 Roadmap stream failed: {e}")
+            yield _sse("error", {"detail": "Roadmap generation failed."})
+
+    return _sse_response(events())
+
+
+class PlanRequest(BaseModel):
+    goal: str
+    mode: str | None = "Beginner → Expert"
+    strategy: str | None = None     # "single" or "parallel"
+    search_mode: str | None = None  # "online", "local_first" or "local"
+    rank_mode: str | None = None    # "llm" or "local"
+    top_k: int | None = None
+    num_results: int = 10
+
+
+@app.post("/api/plan")
+async def plan_endpoint(req: PlanRequest):
+    """
+    Run the whole pipeline (roadmap, then course search and ranking for every section) in one
+    request and stream it as Server-Sent Events: a "section" event as soon as each section is
+    written, a "courses" event once that section's courses are searched and ranked, an "error"
+    event if the roadmap stage fails, and a final "done" event with the roadmap and stage timings.
+    """
+    if req.strategy is not None and req.strategy not in ROADMAP_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"strategy must be one of {list(ROADMAP_STRATEGIES)}")
+    if req.search_mode is not None and req.search_mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"search_mode must be one of {list(SEARCH_MODES)}")
+    if req.rank_mode is not None and req.rank_mode not in RANKING_MODES:
+        raise HTTPException(status_code=400, detail=f"rank_mode must be one of {list(RANKING_MODES)}")
+
+    async def events():
+        async for event in run_plan(req.goal, req.mode, strategy=req.strategy, search_mode=req.search_mode,
+                                    rank_mode=req.rank_mode, top_k=req.top_k, num_results=req.num_results):
+            if event["type"] == "done" and event["roadmap"]:
+                event["roadmap_id"] = await asyncio.to_thread(_remember_roadmap, event["roadmap"], req.goal,
+                                                              req.mode)
+            yield _sse(event.pop("type"), event)
+
+    return _sse_response(events())
+
+
+@app.on_event("startup")
+def start_background_jobs():
+    if ROADMAP_CATALOG_ENABLED:
+        start_catalog_refresher()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    stop_catalog_refresher()
+    await aclose_http_clients()
 
 
 @app.get("/api/search_courses")
-def search_courses_endpoint(topic: str):
-    """Search for courses related to the topic."""
-    return search_courses(topic)
+async def search_courses_endpoint(topic: List[str] = Query(...), mode: str | None = None):
+    """
+    Search for courses related to the topic. Repeat the `topic` parameter to search several
+    topics concurrently; the response is then a list of {topic, results, error} entries.
+    `mode` selects the search tier: "online", "local_first" or "local".
+    """
+    if mode is not None and mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(SEARCH_MODES)}")
+    key = fingerprint(topic, mode)
+    if len(topic) == 1:
+        return await _acoalesced(search_flight, key, lambda: async_search_courses(topic[0], mode=mode))
+    return await _acoalesced(search_flight, key, lambda: async_search_courses_batch(topic, mode=mode))
 
 
 class RankRequest(BaseModel):
     goal: str
     courses: List[Dict]
+    topic: str | None = None  # Defaults to the goal itself
+    mode: str | None = None   # "llm" or "local"
+    top_k: int | None = None  # Candidates sent to the LLM after local pre-ranking
 
 
 @app.post("/api/rank_courses")
-def rank_courses_endpoint(req: RankRequest):
+async def rank_courses_endpoint(req: RankRequest):
     """Rank a list of courses for the user's goal."""
-    return rank_courses(req.goal, req.goal, req.courses)
+    if req.mode is not None and req.mode not in RANKING_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(RANKING_MODES)}")
+    topic = req.topic or req.goal
+    key = fingerprint(req.goal, topic, req.mode, req.top_k,
+                      sorted(req.courses, key=lambda c: str(c.get("link", ""))))
+    return await _acoalesced(rank_flight, key, lambda: async_rank_courses(req.goal, topic, req.courses,
+                                                                          mode=req.mode, top_k=req.top_k))
 
 
-class FollowUpRequest(BaseModel):
-    roadmap: str
+class BatchRankRequest(BaseModel):
     goal: str
+    topics: Dict[str, List[Dict]]  # {topic: courses}
+    mode: str | None = None
+    top_k: int | None = None
+
+
+@app.post("/api/rank_courses_batch")
+async def rank_courses_batch_endpoint(req: BatchRankRequest):
+    """Rank the courses of several topics (e.g. every roadmap section) for one goal in one request."""
+    if req.mode is not None and req.mode not in RANKING_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(RANKING_MODES)}")
+    key = fingerprint(req.goal, req.mode, req.top_k,
+                      {t: sorted(c, key=lambda x: str(x.get("link", ""))) for t, c in req.topics.items()})
+    return await _acoalesced(rank_flight, key, lambda: async_rank_courses_batch(req.goal, req.topics, mode=req.mode,
+                                                                                top_k=req.top_k))
+
+
+@app.post("/api/rank_courses/stream")
+def rank_courses_stream_endpoint(req: RankRequest):
+    """
+    Rank courses and stream each ranked course as a Server-Sent Event ("course") as soon as
+    the model has finished it, followed by a final "done" event with the total count.
+    """
+    if req.mode is not None and req.mode not in RANKING_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {list(RANKING_MODES)}")
+    topic = req.topic or req.goal
+
+    def events():
+        count = 0
+        for course in stream_rank_courses(req.goal, topic, req.courses, mode=req.mode, top_k=req.top_k):
+            count += 1
+            yield _sse("course", course)
+        yield _sse("done", {"count": count})
+
+    return _sse_response(events())
+
+
+class FollowUpRequest(BaseModel):
+    roadmap_id: str | None = None  # From /api/generate_roadmap; preferred over resending the text
+    roadmap: str | None = None
+    goal: str | None = None  # Defaults to the goal the roadmap was generated for
     question: str
+    retrieval_mode: str | None = None  # "auto", "stuff", "local" or "dense"
 
 
 @app.post("/api/follow_up")
-def follow_up_endpoint(req: FollowUpRequest):
-    """Answer a follow-up question about the generated roadmap."""
-    answer = answer_follow_up_question(req.roadmap, req.goal, req.question)
-    return {"answer": answer}
+async def follow_up_endpoint(req: FollowUpRequest):
+    """
+    Answer a follow-up question about a roadmap, given by `roadmap_id` or as `roadmap` text.
+    The response carries the roadmap's id, so later questions can refer to it.
+    """
+    if req.retrieval_mode is not None and req.retrieval_mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"retrieval_mode must be one of {list(RETRIEVAL_MODES)}")
+    if req.roadmap_id is not None:
+        stored = await asyncio.to_thread(lambda: get_roadmap_store().get(req.roadmap_id))
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Unknown roadmap_id; send the roadmap text instead.")
+        roadmap_id, roadmap, goal = req.roadmap_id, stored["roadmap"], req.goal or stored["goal"]
+    elif req.roadmap:
+        roadmap_id = await asyncio.to_thread(_remember_roadmap, req.roadmap, req.goal or "")
+        roadmap, goal = req.roadmap, req.goal or ""
+    else:
+        raise HTTPException(status_code=400, detail="Either roadmap_id or roadmap is required.")
+
+    key = fingerprint(roadmap_id, goal, req.question, req.retrieval_mode)
+    answer = await _acoalesced(follow_up_flight, key,
+                               lambda: async_answer_follow_up_question(roadmap, goal, req.question,
+                                                                       req.retrieval_mode))
+    return {"answer": answer, "roadmap_id": roadmap_id}
+
+
+# Hit/miss counters every cache already keeps, exported as pathpilot_cache_lookups_total at /metrics
+metrics.register_cache("search", search_cache_stats, ("hits", "stale_hits", "misses"))
+metrics.register_cache("ranking", ranking_cache_stats, ("hits", "stale_hits", "misses"))
+metrics.register_cache("roadmap", roadmap_cache_stats, ("exact_hits", "semantic_hits", "misses"))
+metrics.register_cache("roadmap_catalog", roadmap_catalog_stats, ("exact_hits", "near_hits", "misses"))
+metrics.register_cache("roadmap_store", roadmap_store_stats, ("hits", "misses"))
+metrics.register_cache("follow_up_answers", answer_cache_stats, ("exact_hits", "semantic_hits", "misses"))
+metrics.register_cache("embeddings", embedding_cache_stats, ("hits", "misses"))
+metrics.register_cache("vector_stores", vector_store_stats, ("memory_hits", "disk_hits", "builds"))
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Stage latencies, token counts, errors and cache counters of this worker in Prometheus text format."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false).")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
+@app.get("/api/stats")
+def stats_endpoint():
+    """Report cache hit/miss, request coalescing and upstream limit/breaker counters for this worker."""
+    return {
+        "search_cache": search_cache_stats(),
+        "ranking_cache": ranking_cache_stats(),
+        "roadmap_cache": roadmap_cache_stats(),
+        "roadmap_catalog": roadmap_catalog_stats(),
+        "course_index": course_index_stats(),
+        "dedupe": dedupe_stats(),
+        "vector_stores": vector_store_stats(),
+        "embeddings": embedding_cache_stats(),
+        "follow_up_answers": answer_cache_stats(),
+        "roadmap_store": roadmap_store_stats(),
+        "upstreams": upstream_stats(),
+        "coalescing": {f.name: f.stats() for f in (roadmap_flight, search_flight, rank_flight, follow_up_flight)},
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Prometheus metrics of this worker process, served by the API at /metrics. With
+# METRICS_ENABLED=false every metric is a no-op, no callbacks are attached to LangChain runs and
+# prometheus_client is never imported.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+# Stage latencies range from sub-millisecond prompt builds to minute-long roadmap generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _NoopMetric:
+    """Stands in for every metric when metrics are disabled."""
+
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+
+_caches: Dict[str, Tuple[Callable[[], Dict], Tuple[str, ...]]] = {}
+
+if METRICS_ENABLED:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+    from prometheus_client.core import CounterMetricFamily
+
+    STAGE_SECONDS = Histogram(
+        "pathpilot_stage_seconds",
+        "Latency of one pipeline stage (prompt_build, llm_call, parse, embedding, faiss_build, http_search).",
+        ["component", "stage"],
+        buckets=LATENCY_BUCKETS,
+    )
+    LLM_TOKENS = Counter("pathpilot_llm_tokens", "Tokens sent to and received from the LLM, as reported by the model.",
+                         ["component", "direction"])
+    ERRORS = Counter("pathpilot_errors", "Failed operations by where they happened and exception type.",
+                     ["component", "type"])
+
+    class _CacheCollector:
+        """Reads the registered caches' own hit/miss counters at scrape time, so lookups pay nothing extra."""
+
+        def collect(self):
+            family = CounterMetricFamily("pathpilot_cache_lookups", "Cache lookups by cache and result.",
+                                         labels=["cache", "result"])
+            for name, (stats, results) in list(_caches.items()):
+                try:
+                    values = stats()
+                except Exception as e:
+                    print(f"🔴 Could not collect stats of the {name} cache: {e}")
+                    continue
+                for result in results:
+                    family.add_metric([name, result], values.get(result, 0))
+            yield family
+
+    REGISTRY.register(_CacheCollector())
+else:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    STAGE_SECONDS = LLM_TOKENS = ERRORS = _NoopMetric()
+
+
+class _StageTimer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+_NOOP_TIMER = nullcontext()
+
+
+def stage(component: str, name: str):
+    """Context manager recording the block's duration as stage `name` of `component`."""
+    if not METRICS_ENABLED:
+        return _NOOP_TIMER
+    return _StageTimer(STAGE_SECONDS.labels(component, name))
+
+
+def timed(component: str, name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Returns fn with every call recorded as stage `name` of `component`."""
+    if not METRICS_ENABLED:
+        return fn
+
+    def timed_fn(*args, **kwargs):
+        with stage(component, name):
+            return fn(*args, **kwargs)
+    return timed_fn
+
+
+def record_error(component: str, error: BaseException):
+    """Counts a failed operation of `component` by exception type."""
+    if METRICS_ENABLED:
+        ERRORS.labels(component, type(error).__name__).inc()
+
+
+def register_cache(name: str, stats: Callable[[], Dict], results: Iterable[str]):
+    """
+    Exposes a cache's hit/miss counters as pathpilot_cache_lookups_total{cache=name, result=...}.
+
+    Args:
+        name (str): Cache name used as the `cache` label.
+        stats (Callable[[], Dict]): The cache's stats function, called at scrape time.
+        results (Iterable[str]): Counter keys of `stats()` to export, e.g. ("hits", "misses").
+    """
+    if METRICS_ENABLED:
+        _caches[name] = (stats, tuple(results))
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    """Sums the input/output tokens the model reported for every generation of a call."""
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            input_tokens += usage.get("input_tokens", 0)
+            output_tokens += usage.get("output_tokens", 0)
+    return input_tokens, output_tokens
+
+
+class LangChainMetrics(BaseCallbackHandler):
+    """
+    Callback handler recording, for one component's chains, the latency of prompt formatting
+    (prompt_build), model calls (llm_call) and output parsing (parse), the token counts the model
+    reports, and model/parser errors. For streamed chains the parse stage spans the whole stream,
+    since the parser consumes chunks as the model writes them.
+    """
+
+    run_inline = True  # Recording is cheap; don't hop to an executor for async runs
+
+    def __init__(self, component: str):
+        self.component = component
+        self._started: Dict[UUID, Tuple[str, float]] = {}
+
+    def _start(self, run_id: UUID, name: str):
+        self._started[run_id] = (name, time.perf_counter())
+
+    def _end(self, run_id: UUID, error: BaseException = None):
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        name, start = started
+        STAGE_SECONDS.labels(self.component, name).observe(time.perf_counter() - start)
+        if error is not None:
+            record_error(self.component, error)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "llm_call")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts, *, run_id: UUID, **kwargs: Any):
+        self._start(run_id, "llm_call")
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+        input_tokens, output_tokens = _token_usage(response)
+        if input_tokens:
+            LLM_TOKENS.labels(self.component, "input").inc(input_tokens)
+        if output_tokens:
+            LLM_TOKENS.labels(self.component, "output").inc(output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs, *, run_id: UUID, **kwargs: Any):
+        run_type = kwargs.get("run_type")
+        if run_type == "prompt":
+            self._start(run_id, "prompt_build")
+        elif run_type == "parser":
+            self._start(run_id, "parse")
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id, error)
+
+
+_handlers: Dict[str, LangChainMetrics] = {}
+_handlers_lock = threading.Lock()
+
+
+def langchain_config(component: str, **config) -> Optional[Dict]:
+    """
+    Returns a LangChain run config (plus any extra `config` keys, e.g. max_concurrency) whose
+    callbacks record `component`'s stage latencies, tokens and errors. Without metrics this is
+    just `config`, or None, so runs carry no callbacks at all.
+    """
+    if not METRICS_ENABLED:
+        return config or None
+    handler = _handlers.get(component)
+    if handler is None:
+        with _handlers_lock:
+            handler = _handlers.setdefault(component, LangChainMetrics(component))
+    return {**config, "callbacks": [handler]}
+
+
+def render() -> bytes:
+    """Returns every metric in the Prometheus text exposition format."""
+    if not METRICS_ENABLED:
+        return b""
+    return generate_latest(REGISTRY)
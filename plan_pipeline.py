@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Dict, List
+
+from course_ranker_agent import async_rank_courses
+from course_search import async_search_courses
+from resilience import ServiceUnavailable
+from roadmap_agent import astream_roadmap
+from roadmap_catalog import get_roadmap_catalog
+from roadmap_parser import Section, parse_roadmap
+
+# Every stage has its own budget, so a slow ranker can never hold back the roadmap or the
+# searches of other sections. A ranking that times out falls back to the unranked search results.
+PLAN_ROADMAP_TIMEOUT = float(os.getenv("PLAN_ROADMAP_TIMEOUT", 90))
+PLAN_SEARCH_TIMEOUT = float(os.getenv("PLAN_SEARCH_TIMEOUT", 15))
+PLAN_RANK_TIMEOUT = float(os.getenv("PLAN_RANK_TIMEOUT", 30))
+PLAN_SECTION_CONCURRENCY = int(os.getenv("PLAN_SECTION_CONCURRENCY", 8))  # Sections searched/ranked at once
+
+_ROADMAP_FINISHED = object()  # Queue marker: the roadmap stage produced its last event
+
+
+async def _section_courses(goal: str, section: Section, search_mode: str, rank_mode: str, top_k: int,
+                           num_results: int, timings: Dict[str, float]) -> Dict:
+    """Searches and ranks the courses of one section, each within its own timeout."""
+    topic = section.title
+    event = {"type": "courses", "index": section.index, "topic": topic, "courses": [], "ranked": False,
+             "error": None}
+
+    start = time.perf_counter()
+    try:
+        courses = await asyncio.wait_for(async_search_courses(topic, num_results, mode=search_mode),
+                                         PLAN_SEARCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        event["error"] = f"Course search timed out after {PLAN_SEARCH_TIMEOUT:g}s."
+        return event
+    finally:
+        timings["search"] = max(timings.get("search", 0.0), time.perf_counter() - start)
+    if not courses:
+        return event
+
+    start = time.perf_counter()
+    try:
+        ranked = await asyncio.wait_for(async_rank_courses(goal, topic, courses, mode=rank_mode, top_k=top_k),
+                                        PLAN_RANK_TIMEOUT)
+    except asyncio.TimeoutError:
+        event["courses"] = courses
+        event["error"] = f"Ranking timed out after {PLAN_RANK_TIMEOUT:g}s; courses are unranked."
+        return event
+    finally:
+        timings["rank"] = max(timings.get("rank", 0.0), time.perf_counter() - start)
+    event["courses"], event["ranked"] = ranked, True
+    return event
+
+
+async def run_plan(goal: str, mode: str = None, strategy: str = None, search_mode: str = None,
+                   rank_mode: str = None, top_k: int = None, num_results: int = 10) -> AsyncIterator[Dict]:
+    """
+    Runs the whole goal → roadmap → per-section search → ranking pipeline and yields partial
+    results as they become available.
+
+    Sections are searched and ranked as soon as the roadmap stream has parsed them, concurrently
+    (at most PLAN_SECTION_CONCURRENCY at a time) and while the rest of the roadmap is still being
+    written, so the wall-clock time is close to the slowest stage rather than the sum of all
+    stages. Goals in the roadmap catalog are answered from their pre-ranked courses.
+
+    Args:
+        goal (str): The learning goal provided by the user.
+        mode (str): Roadmap mode, e.g. "Beginner → Expert".
+        strategy (str): Roadmap strategy, "single" or "parallel".
+        search_mode (str): Course search tier (see course_search.SEARCH_MODES).
+        rank_mode (str): "llm" or "local" (see course_ranker_agent.RANKING_MODES).
+        top_k (int): Candidates the ranking LLM sees after local pre-ranking.
+        num_results (int): Courses searched per section.
+
+    Yields:
+        Dict: Events in order of arrival:
+        - {"type": "section", "section": {...}} for every roadmap section, as soon as it is complete,
+        - {"type": "courses", "index", "topic", "courses", "ranked", "error"} for every learning section,
+        - {"type": "error", "stage": "roadmap", "detail": ...} if the roadmap stage fails or times out,
+        - {"type": "done", "roadmap", "cached", "catalog_match", "timings"} at the end.
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    semaphore = asyncio.Semaphore(PLAN_SECTION_CONCURRENCY)
+    tasks: List[asyncio.Task] = []
+    result = {"roadmap": "", "cached": False, "catalog_match": None}
+
+    try:
+        entry = await asyncio.to_thread(lambda: get_roadmap_catalog().lookup(goal, mode or ""))
+    except Exception as e:
+        print(f"🔴 Roadmap catalog lookup failed: {e}")
+        entry = None
+
+    async def section_courses(section: Section):
+        precomputed = (entry or {}).get("courses", {}).get(section.title)
+        if precomputed:
+            event = {"type": "courses", "index": section.index, "topic": section.title, "courses": precomputed,
+                     "ranked": True, "error": None}
+        else:
+            async with semaphore:
+                try:
+                    event = await _section_courses(goal, section, search_mode, rank_mode, top_k, num_results, timings)
+                except Exception as e:
+                    print(f"🔴 Finding courses for '{section.title}' failed: {e}")
+                    event = {"type": "courses", "index": section.index, "topic": section.title, "courses": [],
+                             "ranked": False, "error": "Course search failed."}
+        await queue.put(event)
+
+    def on_section(section: Section):
+        queue.put_nowait({"type": "section", "section": section.to_dict()})
+        if section.kind == "section":
+            tasks.append(asyncio.create_task(section_courses(section)))
+
+    async def roadmap_stage():
+        start = time.perf_counter()
+        try:
+            if entry is not None:
+                for section in parse_roadmap(entry["roadmap"]).sections:
+                    on_section(section)
+                result.update(roadmap=entry["roadmap"], cached=True, catalog_match=entry["match"])
+                return
+            events = astream_roadmap(goal, mode, strategy=strategy)
+            deadline = time.monotonic() + PLAN_ROADMAP_TIMEOUT
+            try:
+                while True:
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), max(deadline - time.monotonic(), 0))
+                    except StopAsyncIteration:
+                        break
+                    if event["type"] == "section":
+                        on_section(event["section"])
+                    elif event["type"] == "done":
+                        result.update(roadmap=event["roadmap"], cached=event["cached"])
+            finally:
+                await events.aclose()
+        except asyncio.TimeoutError:
+            await queue.put({"type": "error", "stage": "roadmap",
+                             "detail": f"Roadmap generation timed out after {PLAN_ROADMAP_TIMEOUT:g}s."})
+        except ServiceUnavailable as e:
+            await queue.put({"type": "error", "stage": "roadmap", "detail": str(e)})
+        except Exception as e:
+            print(f"🔴 Plan roadmap stage failed: {e}")
+            await queue.put({"type": "error", "stage": "roadmap", "detail": "Roadmap generation failed."})
+        finally:
+            timings["roadmap"] = time.perf_counter() - start
+            await queue.put(_ROADMAP_FINISHED)
+
+    producer = asyncio.create_task(roadmap_stage())
+    try:
+        roadmap_finished = False
+        pending_courses = 0
+        while not roadmap_finished or pending_courses:
+            event = await queue.get()
+            if event is _ROADMAP_FINISHED:
+                roadmap_finished = True
+            elif event["type"] == "section":
+                # Every learning section gets exactly one courses event
+                pending_courses += event["section"]["kind"] == "section"
+                if "first_section" not in timings:
+                    timings["first_section"] = time.perf_counter() - started
+                yield event
+            else:
+                pending_courses -= event["type"] == "courses"
+                yield event
+        timings["total"] = time.perf_counter() - started
+        yield {"type": "done", **result, "timings": {stage: round(t, 3) for stage, t in timings.items()}}
+    finally:
+        # The client went away or the plan is complete: stop whatever is still running
+        for task in [producer, *tasks]:
+            task.cancel()
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    A client-side token bucket rate limiter usable from both threads and asyncio tasks.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. Each request takes
+    one token; callers block (or await) until one is available.
+
+    Args:
+        rate (float): Tokens added per second. A rate of 0 or less disables limiting.
+        capacity (float): Maximum burst size. Defaults to `rate` (one second of burst).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Takes `tokens` from the bucket and returns how long the caller must wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Going negative reserves future tokens, so concurrent waiters queue up fairly
+            # instead of all waking at once and racing for the same refill.
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """
+        Blocks the calling thread until `tokens` are available. With a `timeout`, a wait longer
+        than that gives the tokens back and returns False right away instead of sleeping.
+        """
+        if self.rate <= 0:
+            return True
+        wait = self._reserve(tokens)
+        if timeout is not None and wait > timeout:
+            with self._lock:
+                self._tokens += tokens
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, tokens: float = 1):
+        """Awaits until `tokens` are available without blocking the event loop."""
+        if self.rate <= 0:
+            return
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,433 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple, Type
+
+from langchain_core.exceptions import OutputParserException
+
+import metrics
+
+# Upstream limits. Each upstream admits at most *_CONCURRENCY calls at once; up to
+# UPSTREAM_QUEUE_LIMIT more wait (at most UPSTREAM_QUEUE_TIMEOUT seconds) and anything beyond is
+# rejected immediately, so an overloaded server answers 429 in milliseconds instead of piling up.
+GEMINI_CHAT_CONCURRENCY = int(os.getenv("GEMINI_CHAT_CONCURRENCY", 32))
+GEMINI_EMBED_CONCURRENCY = int(os.getenv("GEMINI_EMBED_CONCURRENCY", 16))
+SERPER_CONCURRENCY = int(os.getenv("SERPER_CONCURRENCY", 16))
+UPSTREAM_QUEUE_LIMIT = int(os.getenv("UPSTREAM_QUEUE_LIMIT", 64))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 5))
+# Server-side limit of one async upstream call. Only a call cut off by this limit counts as an
+# upstream failure; a call cut off by the (client-adjustable) request deadline does not.
+UPSTREAM_CALL_TIMEOUT = float(os.getenv("UPSTREAM_CALL_TIMEOUT", 60))
+# Circuit breakers: an upstream that fails this many times in a row is skipped for
+# BREAKER_RESET_TIMEOUT seconds, then a single probe call decides whether it is healthy again.
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+# Default time budget of an HTTP request; clients may ask for less with an X-Request-Timeout header
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 120))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ServiceUnavailable(Exception):
+    """An upstream call was not made (or not finished) to protect the server. Maps to an HTTP error."""
+
+    status_code = 503
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(ServiceUnavailable):
+    """Every slot of the upstream is busy and its queue is full (or the wait for a slot timed out)."""
+
+    status_code = 429
+
+
+class CircuitOpen(ServiceUnavailable):
+    """The upstream failed repeatedly and is skipped until its circuit breaker lets a probe through."""
+
+    status_code = 503
+
+
+class DeadlineExceeded(ServiceUnavailable):
+    """The request's deadline passed before the upstream call could be made or finished."""
+
+    status_code = 504
+
+
+# --- Deadlines ----------------------------------------------------------------------------------
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+# Per-request flag set by fallbacks (see mark_degraded); a one-item list so tasks and threads share it
+_degraded: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_degraded", default=None)
+
+
+def mark_degraded():
+    """Flags the current request's response as served by a local fallback instead of the upstream."""
+    flag = _degraded.get()
+    if flag is not None:
+        flag[0] = True
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None outside a request."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Runs the block (and everything it starts: tasks, to_thread calls) under a deadline."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving every HTTP request a deadline of REQUEST_TIMEOUT seconds, or less when
+    the client sends `X-Request-Timeout: <seconds>`. Upstream calls made for the request wait for
+    a slot and run only within the time that is left. Responses that a local fallback produced
+    (see mark_degraded) get an `X-Degraded: true` header.
+    """
+
+    def __init__(self, app, default_timeout: float = None):
+        self.app = app
+        self.default_timeout = REQUEST_TIMEOUT if default_timeout is None else default_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timeout = self.default_timeout
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    timeout = min(timeout, max(float(value), 0.0))
+                except ValueError:
+                    pass
+                break
+        flag = [False]
+
+        async def send_marked(message):
+            if message["type"] == "http.response.start" and flag[0]:
+                message = {**message, "headers": [*message.get("headers", []), (b"x-degraded", b"true")]}
+            await send(message)
+
+        token = _degraded.set(flag)
+        try:
+            with deadline(timeout):
+                await self.app(scope, receive, send_marked)
+        finally:
+            _degraded.reset(token)
+
+
+# --- Bulkhead and circuit breaker ---------------------------------------------------------------
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted")
+
+    def __init__(self, event: threading.Event = None, loop: asyncio.AbstractEventLoop = None,
+                 future: asyncio.Future = None):
+        self.event, self.loop, self.future = event, loop, future
+        self.granted = False
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class Upstream:
+    """
+    Concurrency limit (bulkhead) plus circuit breaker for one external service.
+
+    Calls are admitted while fewer than `max_concurrency` are in flight; up to `max_queue` more
+    wait in FIFO order, for at most `queue_timeout` seconds or until the request's deadline, and
+    any further call is rejected at once with Overloaded. Threads and asyncio tasks share the
+    same slots, so the Streamlit app, background jobs and the API server are limited together.
+
+    After `failure_threshold` consecutive failures the breaker opens: calls fail immediately with
+    CircuitOpen for `reset_timeout` seconds, then one probe call is let through and its outcome
+    closes or re-opens the breaker. Exceptions in `ignore` (e.g. malformed model output) are not
+    counted as upstream failures, and neither are calls cut short by the caller's own deadline:
+    only errors the upstream returns and async calls exceeding `call_timeout` trip the breaker.
+
+    Args:
+        name (str): Name reported in errors and stats.
+        max_concurrency (int): Maximum calls in flight.
+        max_queue (int): Maximum calls waiting for a slot.
+        queue_timeout (float): Maximum seconds a call waits for a slot.
+        failure_threshold (int): Consecutive failures that open the breaker.
+        reset_timeout (float): Seconds the breaker stays open before a probe.
+        call_timeout (float): Maximum seconds an async call may take (see acall).
+        ignore (Tuple[Type[BaseException], ...]): Exceptions that are not upstream failures.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int = UPSTREAM_QUEUE_LIMIT,
+                 queue_timeout: float = UPSTREAM_QUEUE_TIMEOUT, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, call_timeout: float = UPSTREAM_CALL_TIMEOUT,
+                 ignore: Tuple[Type[BaseException], ...] = ()):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.call_timeout = call_timeout
+        self.ignore = ignore
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"calls": 0, "rejected": 0, "short_circuited": 0, "deadline_exceeded": 0,
+                       "timeouts": 0, "failures": 0, "opened": 0}
+
+    # Breaker -------------------------------------------------------------------------------------
+
+    def _check_breaker(self) -> bool:
+        """Raises CircuitOpen unless a call may go through; returns True for the half-open probe. Caller holds the lock."""
+        if self._state == CLOSED:
+            return False
+        wait = self._opened_at + self.reset_timeout - time.monotonic()
+        if self._state == OPEN and wait <= 0:
+            self._state = HALF_OPEN
+        if self._state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        self._stats["short_circuited"] += 1
+        raise CircuitOpen(f"{self.name} is temporarily unavailable.", retry_after=max(wait, 1.0))
+
+    def _record(self, ok: Optional[bool], probe: bool):
+        """Records a call's outcome: True (upstream healthy), False (upstream failure) or None (no verdict)."""
+        with self._lock:
+            if probe:
+                self._probing = False
+            if ok is None:
+                return
+            if ok:
+                self._failures = 0
+                self._state = CLOSED
+                return
+            self._stats["failures"] += 1
+            self._failures += 1
+            if probe or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._stats["opened"] += 1
+                    print(f"🔴 Circuit breaker for {self.name} opened after {self._failures} failure(s).")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def _outcome(self, error: BaseException) -> Optional[bool]:
+        """Breaker verdict of a call that raised `error` (see _record)."""
+        if isinstance(error, (ServiceUnavailable, asyncio.CancelledError, GeneratorExit)):
+            # Cut short by the caller (its deadline, a disconnect) or shed/short-circuited by a
+            # limit (e.g. another upstream's): says nothing about this upstream either way
+            return None
+        return not isinstance(error, Exception) or isinstance(error, self.ignore)
+
+    # Bulkhead ------------------------------------------------------------------------------------
+
+    def _wait_budget(self) -> float:
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            with self._lock:
+                self._stats["deadline_exceeded"] += 1
+            raise DeadlineExceeded(f"Request deadline passed before calling {self.name}.")
+        return self.queue_timeout if remaining is None else min(self.queue_timeout, remaining)
+
+    def _admit(self, waiter_factory: Callable[[], _Waiter]) -> Tuple[Optional[_Waiter], bool]:
+        """Takes a slot or joins the queue. Returns (waiter or None if admitted, is probe)."""
+        with self._lock:
+            self._stats["calls"] += 1
+            probe = self._check_breaker()
+            if self._in_flight < self.max_concurrency and not self._waiters:
+                self._in_flight += 1
+                return None, probe
+            if probe:
+                self._probing = False
+            if len(self._waiters) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise Overloaded(f"{self.name} is overloaded, please retry shortly.", retry_after=1.0)
+            waiter = waiter_factory()
+            self._waiters.append(waiter)
+            return waiter, False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Leaves the queue after a timeout; returns True if the slot was granted meanwhile (and is now held)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._stats["rejected"] += 1
+            return False
+
+    def _release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the slot straight to the oldest waiter
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                waiter.wake()
+            else:
+                self._in_flight -= 1
+
+    def _acquire(self) -> bool:
+        try:
+            budget = self._wait_budget()
+            waiter, probe = self._admit(lambda: _Waiter(event=threading.Event()))
+            if waiter is not None and not waiter.event.wait(budget) and not self._abandon(waiter):
+                raise Overloaded(f"Timed out waiting for {self.name}, please retry shortly.", retry_after=1.0)
+        except ServiceUnavailable as e:
+            metrics.record_error(self.name, e)
+            raise
+        return probe
+
+    async def _aacquire(self) -> bool:
+        try:
+            return await self._await_slot()
+        except ServiceUnavailable as e:
+            metrics.record_error(self.name, e)
+            raise
+
+    async def _await_slot(self) -> bool:
+        budget = self._wait_budget()
+        loop = asyncio.get_running_loop()
+        waiter, probe = self._admit(lambda: _Waiter(loop=loop, future=loop.create_future()))
+        if waiter is None:
+            return probe
+        try:
+            await asyncio.wait_for(waiter.future, budget)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise Overloaded(f"Timed out waiting for {self.name}, please retry shortly.", retry_after=1.0)
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self._release()
+            raise
+        return probe
+
+    # Public API ----------------------------------------------------------------------------------
+
+    def check(self):
+        """Raises CircuitOpen or Overloaded if a call made now would be rejected, without taking a slot."""
+        with self._lock:
+            if self._state == OPEN and self._opened_at + self.reset_timeout > time.monotonic():
+                raise CircuitOpen(f"{self.name} is temporarily unavailable.",
+                                  retry_after=max(self._opened_at + self.reset_timeout - time.monotonic(), 1.0))
+            if self._in_flight >= self.max_concurrency and len(self._waiters) >= self.max_queue:
+                raise Overloaded(f"{self.name} is overloaded, please retry shortly.", retry_after=1.0)
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Holds a slot for the block; an exception raised inside counts towards the breaker."""
+        probe = self._acquire()
+        try:
+            yield
+        except BaseException as e:
+            self._record(self._outcome(e), probe)
+            raise
+        else:
+            self._record(True, probe)
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """Async counterpart of slot."""
+        probe = await self._aacquire()
+        try:
+            yield
+        except BaseException as e:
+            self._record(self._outcome(e), probe)
+            raise
+        else:
+            self._record(True, probe)
+        finally:
+            self._release()
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) in a slot."""
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    async def acall(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        Awaits fn(*args, **kwargs) in a slot, for at most `call_timeout` seconds or until the request's
+        deadline, whichever comes first. Both raise DeadlineExceeded, but only the server-side
+        `call_timeout` counts as an upstream failure: a client that asks for a short deadline must
+        not be able to open the breaker for everyone else.
+        """
+        try:
+            async with self.aslot():
+                remaining = remaining_time()
+                if remaining is None or remaining >= self.call_timeout:
+                    # Raises TimeoutError, which aslot counts as a failure of the slow upstream
+                    return await asyncio.wait_for(fn(*args, **kwargs), self.call_timeout)
+                try:
+                    return await asyncio.wait_for(fn(*args, **kwargs), remaining)
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._stats["deadline_exceeded"] += 1
+                    error = DeadlineExceeded(f"{self.name} did not answer within the request deadline.")
+                    metrics.record_error(self.name, error)
+                    raise error from None
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            error = DeadlineExceeded(f"{self.name} did not answer within {self.call_timeout:g}s.")
+            metrics.record_error(self.name, error)
+            raise error from None
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Returns fn guarded by this upstream, for APIs that take a callable (e.g. an embed function)."""
+        def guarded(*args, **kwargs):
+            return self.call(fn, *args, **kwargs)
+        return guarded
+
+    def stream(self, start: Callable[[], Iterator]) -> Iterator:
+        """Iterates start() in a slot held until the stream ends."""
+        with self.slot():
+            yield from start()
+
+    async def astream(self, start: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Async counterpart of stream."""
+        async with self.aslot():
+            async for item in start():
+                yield item
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(state=self._state, in_flight=self._in_flight, queued=len(self._waiters),
+                         max_concurrency=self.max_concurrency, max_queue=self.max_queue)
+        return stats
+
+
+# Shared by every agent module, so all Gemini calls of the process count against one limit
+gemini_chat = Upstream("Gemini", GEMINI_CHAT_CONCURRENCY, ignore=(OutputParserException,))
+gemini_embeddings = Upstream("Gemini embeddings", GEMINI_EMBED_CONCURRENCY)
+serper = Upstream("Serper", SERPER_CONCURRENCY)
+UPSTREAMS = (gemini_chat, gemini_embeddings, serper)
+
+
+def upstream_stats() -> Dict[str, Dict]:
+    """Returns in-flight/queued counts, rejections and breaker state of every upstream."""
+    return {upstream.name: upstream.stats() for upstream in UPSTREAMS}
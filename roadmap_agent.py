@@ -1,7 +1,18 @@
+import asyncio
 import os
 from dotenv import load_dotenv
 from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.pydantic_v1 import BaseModel, Field
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+import metrics
+from roadmap_cache import SemanticRoadmapCache
+from resilience import gemini_chat, gemini_embeddings
+from roadmap_parser import SectionStream
+from sqlite_cache import default_cache_path
 
 # Load environment variables from .env file
 load_dotenv()
@@ -43,21 +54,403 @@ except FileNotFoundError:
 # Create a PromptTemplate instance from the loaded string
 prompt = PromptTemplate.from_template(prompt_template_str)
 
-def generate_roadmap(goal: str):
+# Roadmap styles offered to the user; the mode is passed to the prompt along with the goal
+ROADMAP_MODES = ("Beginner → Expert", "Job-Ready in 90 Days")
+
+# Generation strategies:
+#   "single"   - one long generation of the whole roadmap (latency grows with its length)
+#   "parallel" - a short skeleton call (section titles and times), then every section and the
+#                career guidance are expanded concurrently and assembled in the same format
+ROADMAP_STRATEGIES = ("single", "parallel")
+ROADMAP_STRATEGY = os.getenv("ROADMAP_STRATEGY", "single")
+ROADMAP_EXPAND_CONCURRENCY = int(os.getenv("ROADMAP_EXPAND_CONCURRENCY", 6))
+# Records prompt/LLM/parse latency, tokens and errors of the roadmap chains (see metrics)
+_METRICS_CONFIG = metrics.langchain_config("roadmap")
+
+
+class SkeletonSection(BaseModel):
+    title: str = Field(description="Short title of the section, without the 'Level N:' prefix.")
+    estimated_time: str = Field(description="Realistic time estimate for the section, e.g. '2-3 weeks'.")
+
+
+class RoadmapSkeleton(BaseModel):
+    sections: List[SkeletonSection] = Field(description="The roadmap's learning sections, in learning order.")
+    total_time: str = Field(description="Sum of the section estimates, e.g. '6-8 months'.")
+
+
+skeleton_parser = JsonOutputParser(pydantic_object=RoadmapSkeleton)
+
+skeleton_prompt = PromptTemplate(
+    template="""
+You are an expert AI career counselor and learning path generator named "PathPilot".
+Outline a learning roadmap for the user's goal. Return ONLY the outline: the learning sections
+(Levels) in the order they should be learned, each with a short title and a realistic time
+estimate, and the total estimated time. Do not describe the sections.
+Assume the user is a beginner unless specified otherwise.
+
+User's Learning Goal: {goal}
+
+{format_instructions}
+""",
+    input_variables=["goal"],
+    partial_variables={"format_instructions": skeleton_parser.get_format_instructions()},
+)
+
+section_prompt = PromptTemplate.from_template("""
+You are an expert AI career counselor and learning path generator named "PathPilot".
+You are writing one section of a learning roadmap for the user's goal: {goal}
+
+The full roadmap outline is:
+{outline}
+
+Write ONLY section {number}: "{title}" (estimated time: {estimated_time}). Stay within this
+section's scope; the other sections are written separately. Use exactly these bold labels,
+each followed by its content as Markdown bullet points:
+**Topics to Cover:**
+**Estimated Time:**
+**Key Tools/Technologies:**
+**Mini-Projects/Exercises:**
+**Resources/Learning Strategies:**
+
+Do not repeat the section title and do NOT use emojis.
+""")
+
+career_prompt = PromptTemplate.from_template("""
+You are an expert AI career counselor and learning path generator named "PathPilot".
+The user's learning goal is: {goal}
+
+Their learning roadmap covers:
+{outline}
+
+Write ONLY the career guidance that follows the roadmap, as Markdown bullet points covering:
+job roles related to the goal, tips for building a portfolio, networking strategies,
+continuous learning advice and important soft skills. Do not add a heading and do NOT use emojis.
+""")
+
+
+# Semantic roadmap cache: a goal that means the same as an earlier one ("become a backend
+# developer in Python" vs "python backend dev") reuses its roadmap instead of a new generation.
+ROADMAP_CACHE_ENABLED = os.getenv("ROADMAP_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+embeddings = GoogleGenerativeAIEmbeddings(
+    model="models/embedding-001",
+    google_api_key=os.getenv("GOOGLE_API_KEY")
+)
+
+roadmap_cache = SemanticRoadmapCache(
+    default_cache_path("roadmap_cache.sqlite3"),
+    embed=gemini_embeddings.wrap(metrics.timed("roadmap", "embedding", embeddings.embed_query)),
+    threshold=float(os.getenv("ROADMAP_CACHE_THRESHOLD", 0.92)),
+    max_entries=int(os.getenv("ROADMAP_CACHE_MAX_ENTRIES", 2000)),
+    max_age=float(os.getenv("ROADMAP_CACHE_MAX_AGE", 30 * 24 * 3600)),
+)
+
+
+def _generate_single(goal_text: str) -> str:
+    """Generates the whole roadmap in one LLM call."""
+    # Create a LangChain chain: PromptTemplate -> LLM
+    chain = prompt | llm
+    response = gemini_chat.call(chain.invoke, {"goal": goal_text}, config=_METRICS_CONFIG)
+    return response.content
+
+
+async def _agenerate_single(goal_text: str) -> str:
+    """Async counterpart of _generate_single."""
+    response = await gemini_chat.acall((prompt | llm).ainvoke, {"goal": goal_text}, config=_METRICS_CONFIG)
+    return response.content
+
+
+def _expansion_prompts(goal_text: str, sections: List[Dict]) -> Tuple[List[str], list]:
+    """Returns the heading and the expansion prompt of every skeleton section, plus the career guidance."""
+    outline = "\n".join(
+        f"Level {i}: {s.get('title', '')} ({s.get('estimated_time', '')})" for i, s in enumerate(sections, start=1)
+    )
+    headings = [
+        f"**Level {i}: {s.get('title', '')}** (Estimated Time: {s.get('estimated_time', '')})"
+        for i, s in enumerate(sections, start=1)
+    ]
+    prompts = [
+        section_prompt.invoke({"goal": goal_text, "outline": outline, "number": i,
+                               "title": s.get("title", ""), "estimated_time": s.get("estimated_time", "")},
+                              config=_METRICS_CONFIG)
+        for i, s in enumerate(sections, start=1)
+    ]
+    headings.append("**Career Guidance & Next Steps**")
+    prompts.append(career_prompt.invoke({"goal": goal_text, "outline": outline}, config=_METRICS_CONFIG))
+    return headings, prompts
+
+
+def _guarded_llm() -> RunnableLambda:
+    """The LLM with every call (sync or async) taking its own Gemini slot, so batched section expansions count
+    against GEMINI_CHAT_CONCURRENCY and the breaker call by call."""
+    def invoke(prompt_value, config: RunnableConfig):
+        return gemini_chat.call(llm.invoke, prompt_value, config=config)
+
+    async def ainvoke(prompt_value, config: RunnableConfig):
+        return await gemini_chat.acall(llm.ainvoke, prompt_value, config=config)
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+
+def _expand_parallel(goal_text: str, max_concurrency: int = None) -> Iterator[str]:
+    """
+    Generates a roadmap skeleton, expands its sections concurrently and yields the roadmap's
+    parts in order, in the format the single-call prompt produces ("Level N: ..." sections,
+    career guidance, total time). A part is yielded as soon as it and all earlier parts are done.
+    """
+    skeleton = gemini_chat.call((skeleton_prompt | llm | skeleton_parser).invoke, {"goal": goal_text},
+                                config=_METRICS_CONFIG)
+    sections = skeleton.get("sections") or []
+    if not sections:
+        # Nothing to fan out; fall back to the single call rather than return an empty roadmap
+        yield _generate_single(goal_text)
+        return
+
+    headings, prompts = _expansion_prompts(goal_text, sections)
+    # Section and career guidance expansions run as one batch, at most max_concurrency at a time;
+    # finished expansions are held back until every earlier part has been yielded
+    done: Dict[int, str] = {}
+    next_part = 0
+    config = metrics.langchain_config("roadmap", max_concurrency=max_concurrency or ROADMAP_EXPAND_CONCURRENCY)
+    for idx, response in _guarded_llm().batch_as_completed(prompts, config=config):
+        done[idx] = f"{headings[idx]}\n{response.content.strip()}"
+        while next_part in done:
+            yield done.pop(next_part)
+            next_part += 1
+    if skeleton.get("total_time"):
+        yield f"Total Estimated Time for Roadmap: {skeleton['total_time']}"
+
+
+def generate_roadmap(goal: str, mode: str = None, use_cache: bool = True, strategy: str = None):
     """
     Generates a learning roadmap based on the user's goal using the configured LLM.
 
+    Roadmaps are served from the semantic cache when an earlier goal of the same mode is
+    similar enough (ROADMAP_CACHE_THRESHOLD); cache errors never block generation.
+
     Args:
         goal (str): The learning goal provided by the user.
+        mode (str): Roadmap mode, e.g. "Beginner → Expert". Only roadmaps of the same mode are reused.
+        use_cache (bool): Whether to look up and store the roadmap in the semantic cache.
+        strategy (str): "single" or "parallel" (see ROADMAP_STRATEGIES). Defaults to ROADMAP_STRATEGY.
 
     Returns:
         str: The generated roadmap content from the LLM.
     """
-    # Create a LangChain chain: PromptTemplate -> LLM
-    chain = prompt | llm
-    
-    # Invoke the chain with the user's goal
-    response = chain.invoke({"goal": goal})
-    
-    # Return the content of the AI's response
-    return response.content
+    strategy = strategy or ROADMAP_STRATEGY
+    if strategy not in ROADMAP_STRATEGIES:
+        raise ValueError(f"Unknown roadmap strategy '{strategy}'. Expected one of {ROADMAP_STRATEGIES}.")
+    use_cache = use_cache and ROADMAP_CACHE_ENABLED
+    if use_cache:
+        try:
+            cached, _ = roadmap_cache.lookup(goal, mode or "")
+            if cached is not None:
+                return cached
+        except Exception as e:
+            print(f"🔴 Roadmap cache lookup failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+
+    # The prompts receive the goal together with its mode, as the roadmap prompt always has
+    goal_text = f"{goal} ({mode})" if mode else goal
+    if strategy == "parallel":
+        roadmap = "\n\n".join(_expand_parallel(goal_text))
+    else:
+        roadmap = _generate_single(goal_text)
+
+    if use_cache and roadmap:
+        try:
+            roadmap_cache.store(goal, mode or "", roadmap)
+        except Exception as e:
+            print(f"🔴 Roadmap cache store failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+
+    return roadmap
+
+
+async def _aexpand_parallel(goal_text: str, max_concurrency: int = None) -> AsyncIterator[str]:
+    """Async counterpart of _expand_parallel: yields the roadmap's parts in order as they complete."""
+    skeleton = await gemini_chat.acall((skeleton_prompt | llm | skeleton_parser).ainvoke, {"goal": goal_text},
+                                       config=_METRICS_CONFIG)
+    sections = skeleton.get("sections") or []
+    if not sections:
+        yield await _agenerate_single(goal_text)
+        return
+
+    headings, prompts = _expansion_prompts(goal_text, sections)
+    done: Dict[int, str] = {}
+    next_part = 0
+    config = metrics.langchain_config("roadmap", max_concurrency=max_concurrency or ROADMAP_EXPAND_CONCURRENCY)
+    async for idx, response in _guarded_llm().abatch_as_completed(prompts, config=config):
+        done[idx] = f"{headings[idx]}\n{response.content.strip()}"
+        while next_part in done:
+            yield done.pop(next_part)
+            next_part += 1
+    if skeleton.get("total_time"):
+        yield f"Total Estimated Time for Roadmap: {skeleton['total_time']}"
+
+
+async def async_generate_roadmap(goal: str, mode: str = None, use_cache: bool = True, strategy: str = None) -> str:
+    """
+    Async variant of generate_roadmap: the model is called with ainvoke, so FastAPI handlers can
+    await it without occupying a threadpool worker. Same arguments, cache and return value.
+
+    Cache lookups and stores may call the embedding API, so they run on a worker thread.
+    """
+    strategy = strategy or ROADMAP_STRATEGY
+    if strategy not in ROADMAP_STRATEGIES:
+        raise ValueError(f"Unknown roadmap strategy '{strategy}'. Expected one of {ROADMAP_STRATEGIES}.")
+    use_cache = use_cache and ROADMAP_CACHE_ENABLED
+    if use_cache:
+        try:
+            cached, _ = await asyncio.to_thread(roadmap_cache.lookup, goal, mode or "")
+            if cached is not None:
+                return cached
+        except Exception as e:
+            print(f"🔴 Roadmap cache lookup failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+
+    goal_text = f"{goal} ({mode})" if mode else goal
+    if strategy == "parallel":
+        roadmap = "\n\n".join([part async for part in _aexpand_parallel(goal_text)])
+    else:
+        roadmap = await _agenerate_single(goal_text)
+
+    if use_cache and roadmap:
+        try:
+            await asyncio.to_thread(roadmap_cache.store, goal, mode or "", roadmap)
+        except Exception as e:
+            print(f"🔴 Roadmap cache store failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+
+    return roadmap
+
+
+def stream_roadmap(goal: str, mode: str = None, use_cache: bool = True, strategy: str = None) -> Iterator[Dict]:
+    """
+    Streaming variant of generate_roadmap over the same prompt and LLM.
+
+    Yields events as the model writes:
+    - {"type": "token", "text": ...} for every chunk of generated text,
+    - {"type": "section", "section": Section} as soon as a section is complete (a
+      roadmap_parser.Section, numbered by its position in the roadmap),
+    - {"type": "done", "roadmap": ..., "cached": bool} with the full roadmap at the end.
+
+    A cached roadmap is replayed as its sections immediately, without token events. With the
+    "parallel" strategy each token event carries a whole expanded section, in roadmap order.
+
+    Args:
+        goal (str): The learning goal provided by the user.
+        mode (str): Roadmap mode, e.g. "Beginner → Expert".
+        use_cache (bool): Whether to look up and store the roadmap in the semantic cache.
+        strategy (str): "single" or "parallel" (see ROADMAP_STRATEGIES). Defaults to ROADMAP_STRATEGY.
+
+    Yields:
+        Dict: Token, section and done events, in that order of arrival.
+    """
+    strategy = strategy or ROADMAP_STRATEGY
+    if strategy not in ROADMAP_STRATEGIES:
+        raise ValueError(f"Unknown roadmap strategy '{strategy}'. Expected one of {ROADMAP_STRATEGIES}.")
+    use_cache = use_cache and ROADMAP_CACHE_ENABLED
+    sections = SectionStream()
+    if use_cache:
+        try:
+            cached, _ = roadmap_cache.lookup(goal, mode or "")
+        except Exception as e:
+            print(f"🔴 Roadmap cache lookup failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+            cached = None
+        if cached is not None:
+            for section in sections.feed(cached) + sections.finish():
+                yield {"type": "section", "section": section}
+            yield {"type": "done", "roadmap": cached, "cached": True}
+            return
+
+    goal_text = f"{goal} ({mode})" if mode else goal
+    if strategy == "parallel":
+        chunks = (f"\n\n{part}" if i else part for i, part in enumerate(_expand_parallel(goal_text)))
+    else:
+        stream = gemini_chat.stream(lambda: (prompt | llm).stream({"goal": goal_text}, config=_METRICS_CONFIG))
+        chunks = (chunk.content for chunk in stream)
+    parts = []
+    for text in chunks:
+        if not text:
+            continue
+        parts.append(text)
+        yield {"type": "token", "text": text}
+        for section in sections.feed(text):
+            yield {"type": "section", "section": section}
+    for section in sections.finish():
+        yield {"type": "section", "section": section}
+
+    roadmap = "".join(parts)
+    # Only a roadmap that streamed to the end is cached
+    if use_cache and roadmap:
+        try:
+            roadmap_cache.store(goal, mode or "", roadmap)
+        except Exception as e:
+            print(f"🔴 Roadmap cache store failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+    yield {"type": "done", "roadmap": roadmap, "cached": False}
+
+
+async def astream_roadmap(goal: str, mode: str = None, use_cache: bool = True,
+                          strategy: str = None) -> AsyncIterator[Dict]:
+    """
+    Async variant of stream_roadmap: yields the same token, section and done events, reading the
+    model with astream (or the async parallel expansion) instead of blocking a thread.
+    """
+    strategy = strategy or ROADMAP_STRATEGY
+    if strategy not in ROADMAP_STRATEGIES:
+        raise ValueError(f"Unknown roadmap strategy '{strategy}'. Expected one of {ROADMAP_STRATEGIES}.")
+    use_cache = use_cache and ROADMAP_CACHE_ENABLED
+    sections = SectionStream()
+    if use_cache:
+        try:
+            cached, _ = await asyncio.to_thread(roadmap_cache.lookup, goal, mode or "")
+        except Exception as e:
+            print(f"🔴 Roadmap cache lookup failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+            cached = None
+        if cached is not None:
+            for section in sections.feed(cached) + sections.finish():
+                yield {"type": "section", "section": section}
+            yield {"type": "done", "roadmap": cached, "cached": True}
+            return
+
+    goal_text = f"{goal} ({mode})" if mode else goal
+
+    async def chunks():
+        if strategy == "parallel":
+            first = True
+            async for part in _aexpand_parallel(goal_text):
+                yield part if first else f"\n\n{part}"
+                first = False
+        else:
+            stream = gemini_chat.astream(lambda: (prompt | llm).astream({"goal": goal_text}, config=_METRICS_CONFIG))
+            async for chunk in stream:
+                yield chunk.content
+
+    parts = []
+    async for text in chunks():
+        if not text:
+            continue
+        parts.append(text)
+        yield {"type": "token", "text": text}
+        for section in sections.feed(text):
+            yield {"type": "section", "section": section}
+    for section in sections.finish():
+        yield {"type": "section", "section": section}
+
+    roadmap = "".join(parts)
+    if use_cache and roadmap:
+        try:
+            await asyncio.to_thread(roadmap_cache.store, goal, mode or "", roadmap)
+        except Exception as e:
+            print(f"🔴 Roadmap cache store failed: {e}")
+            metrics.record_error("roadmap_cache", e)
+    yield {"type": "done", "roadmap": roadmap, "cached": False}
+
+
+def roadmap_cache_stats() -> Dict:
+    """Returns semantic roadmap cache counters and recent similarity scores for threshold tuning."""
+    return roadmap_cache.stats()
@@ -0,0 +1,223 @@
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from sqlite_cache import transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roadmap_cache (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    key         TEXT NOT NULL UNIQUE,
+    goal        TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    roadmap     TEXT NOT NULL,
+    embedding   BLOB NOT NULL,
+    created_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_roadmap_cache_lru ON roadmap_cache (accessed_at);
+"""
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+class SemanticRoadmapCache:
+    """
+    Caches generated roadmaps by the meaning of the goal rather than its exact wording.
+
+    Goals are embedded together with the roadmap mode and kept in an in-memory FAISS
+    inner-product index over normalized vectors (cosine similarity). A lookup first tries the
+    exact normalized goal, which needs no embedding call, then the nearest cached goal of the
+    same mode; it is a hit when the similarity reaches `threshold`.
+
+    Entries live in SQLite (with their vectors), so they survive restarts and are shared by
+    worker processes. Entries older than `max_age` or beyond `max_entries` (least recently
+    used first) are evicted.
+
+    Args:
+        path (str): SQLite file backing the cache.
+        embed (Callable[[str], list]): Function returning the embedding vector of a text.
+        threshold (float): Minimum cosine similarity (0..1) for a semantic hit.
+        max_entries (int): Maximum number of cached roadmaps.
+        max_age (float): Seconds after which a roadmap is evicted regardless of use.
+    """
+
+    SYNC_INTERVAL = 30.0  # Seconds between checks for entries added by other processes
+
+    def __init__(self, path: str, embed: Callable[[str], list], threshold: float = 0.92,
+                 max_entries: int = 2000, max_age: float = 30 * 24 * 3600):
+        self.path = path
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._index = None  # faiss.IndexIDMap, created once the embedding size is known
+        self._modes: Dict[int, str] = {}
+        self._last_row_id = 0
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._stats = {"lookups": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # Best similarity of recent semantic lookups and whether it was accepted, for threshold tuning
+        self._recent_scores = deque(maxlen=200)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    @staticmethod
+    def _key(goal: str, mode: str) -> str:
+        return f"{_normalize(mode)}|{_normalize(goal)}"
+
+    @staticmethod
+    def _text(goal: str, mode: str) -> str:
+        return f"{goal} ({mode})" if mode else goal
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embed(text), dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    def _add_to_index(self, row_id: int, mode: str, vector: np.ndarray):
+        """Adds one vector to the FAISS index. Caller holds the lock."""
+        if self._index is None:
+            self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+        self._index.add_with_ids(vector, np.array([row_id], dtype="int64"))
+        self._modes[row_id] = mode
+
+    def _remove_from_index(self, row_ids):
+        """Removes vectors from the FAISS index. Caller holds the lock."""
+        row_ids = [i for i in row_ids if i in self._modes]
+        if self._index is not None and row_ids:
+            self._index.remove_ids(np.array(row_ids, dtype="int64"))
+        for row_id in row_ids:
+            del self._modes[row_id]
+
+    def _sync(self):
+        """Loads entries written since the last sync (by this or another process) into the index."""
+        rows = self._conn().execute(
+            "SELECT id, mode, embedding FROM roadmap_cache WHERE id > ? ORDER BY id", (self._last_row_id,)
+        ).fetchall()
+        with self._lock:
+            for row_id, mode, blob in rows:
+                if row_id not in self._modes:
+                    self._add_to_index(row_id, mode, np.frombuffer(blob, dtype="float32").reshape(1, -1))
+                self._last_row_id = max(self._last_row_id, row_id)
+            self._last_sync = time.monotonic()
+
+    def _hit(self, row_id: int) -> Optional[str]:
+        """Returns a live entry's roadmap and records the access, or None if it was evicted meanwhile."""
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT roadmap, created_at FROM roadmap_cache WHERE id = ?", (row_id,)
+        ).fetchone()
+        if row is None or now - row[1] > self.max_age:
+            with self._lock:
+                self._remove_from_index([row_id])
+            return None
+        self._conn().execute(
+            "UPDATE roadmap_cache SET accessed_at = ?, hits = hits + 1 WHERE id = ?", (now, row_id)
+        )
+        return row[0]
+
+    def lookup(self, goal: str, mode: str = "") -> Tuple[Optional[str], float]:
+        """
+        Finds a cached roadmap for the goal and mode.
+
+        Returns:
+            Tuple[Optional[str], float]: The cached roadmap (or None on a miss) and the similarity
+            of the closest cached goal (1.0 for an exact match, 0.0 if nothing is cached).
+        """
+        self._count("lookups")
+        row = self._conn().execute(
+            "SELECT id FROM roadmap_cache WHERE key = ?", (self._key(goal, mode),)
+        ).fetchone()
+        if row is not None:
+            roadmap = self._hit(row[0])
+            if roadmap is not None:
+                self._count("exact_hits")
+                return roadmap, 1.0
+
+        if time.monotonic() - self._last_sync > self.SYNC_INTERVAL:
+            self._sync()
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0:
+                self._count("misses")
+                return None, 0.0
+
+        vector = self._vector(self._text(goal, mode))
+        with self._lock:
+            scores, ids = self._index.search(vector, min(10, self._index.ntotal))
+            # Only goals generated in the same mode are interchangeable
+            candidates = [(float(score), int(row_id)) for score, row_id in zip(scores[0], ids[0])
+                          if row_id != -1 and self._modes.get(int(row_id)) == _normalize(mode)]
+
+        best = candidates[0][0] if candidates else 0.0
+        accepted = best >= self.threshold
+        with self._lock:
+            self._recent_scores.append((round(best, 4), accepted))
+        if accepted:
+            roadmap = self._hit(candidates[0][1])
+            if roadmap is not None:
+                self._count("semantic_hits")
+                return roadmap, best
+        self._count("misses")
+        return None, best
+
+    def store(self, goal: str, mode: str, roadmap: str):
+        """Caches a generated roadmap and evicts old or least recently used entries."""
+        vector = self._vector(self._text(goal, mode))
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            # INSERT OR REPLACE gives a re-cached goal a new id, so its old vector must go
+            replaced = [r[0] for r in conn.execute(
+                "SELECT id FROM roadmap_cache WHERE key = ?", (self._key(goal, mode),)).fetchall()]
+            conn.execute(
+                "INSERT OR REPLACE INTO roadmap_cache (key, goal, mode, roadmap, embedding, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self._key(goal, mode), goal, _normalize(mode), roadmap, vector.tobytes(), now, now),
+            )
+            row_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            evicted = [r[0] for r in conn.execute(
+                "SELECT id FROM roadmap_cache WHERE created_at < ? UNION "
+                "SELECT id FROM (SELECT id FROM roadmap_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (now - self.max_age, self.max_entries),
+            ).fetchall()]
+            if evicted:
+                conn.executemany("DELETE FROM roadmap_cache WHERE id = ?", [(i,) for i in evicted])
+        with self._lock:
+            self._remove_from_index(evicted + replaced)
+            self._add_to_index(row_id, _normalize(mode), vector)
+            self._last_row_id = max(self._last_row_id, row_id)
+        self._count("stores")
+        self._count("evictions", len(evicted))
+
+    def stats(self) -> Dict:
+        """Returns hit/miss counters, the hit rate and recent best similarity scores."""
+        with self._lock:
+            stats = dict(self._stats)
+            recent = list(self._recent_scores)
+            stats["indexed"] = self._index.ntotal if self._index is not None else 0
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+        stats["threshold"] = self.threshold
+        stats["recent_similarities"] = [{"similarity": score, "hit": hit} for score, hit in recent[-50:]]
+        return stats
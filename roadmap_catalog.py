@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from course_index import tokenize
+from course_ranker_agent import rank_courses_batch
+from course_search import search_courses_batch
+from roadmap_agent import ROADMAP_MODES, generate_roadmap, roadmap_cache
+from roadmap_parser import parse_roadmap
+from sqlite_cache import default_cache_path, transaction
+
+# Load environment variables from .env file
+load_dotenv()
+
+ROADMAP_CATALOG_ENABLED = os.getenv("ROADMAP_CATALOG_ENABLED", "false").lower() in ("1", "true", "yes")
+ROADMAP_CATALOG_GOALS = os.getenv("ROADMAP_CATALOG_GOALS", "catalog_goals.txt")
+ROADMAP_CATALOG_REFRESH_INTERVAL = float(os.getenv("ROADMAP_CATALOG_REFRESH_INTERVAL", 3600))
+ROADMAP_CATALOG_MAX_AGE = float(os.getenv("ROADMAP_CATALOG_MAX_AGE", 7 * 24 * 3600))
+ROADMAP_CATALOG_NEAR_THRESHOLD = float(os.getenv("ROADMAP_CATALOG_NEAR_THRESHOLD", 0.8))
+ROADMAP_CATALOG_DELAY = float(os.getenv("ROADMAP_CATALOG_DELAY", 2))  # Pause between goals, to spread API usage
+# Seconds a refresh pass holds the lease; comfortably longer than one generation, renewed before each
+REFRESH_LEASE = 600.0
+
+# Words that only phrase a goal ("I want to become a ...") and do not change which roadmap fits
+_GOAL_FILLER = frozenset("i want wanna become would like get started need me my".split())
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roadmap_catalog (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    key          TEXT NOT NULL UNIQUE,
+    goal         TEXT NOT NULL,
+    mode         TEXT NOT NULL,
+    roadmap      TEXT NOT NULL,
+    courses      TEXT NOT NULL,
+    generated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS roadmap_catalog_lease (
+    name       TEXT PRIMARY KEY,
+    holder     TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+
+def _goal_terms(goal: str) -> frozenset:
+    return frozenset(t for t in tokenize(goal) if t not in _GOAL_FILLER)
+
+
+def load_catalog_goals(path: str = None) -> List[str]:
+    """Reads the goal list (one goal per line; blank lines and '#' comments are skipped)."""
+    path = path or ROADMAP_CATALOG_GOALS
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            lines = [line.split("#", 1)[0].strip() for line in file]
+    except FileNotFoundError:
+        print(f"🔴 Roadmap catalog goal list '{path}' not found.")
+        return []
+    goals, seen = [], set()
+    for line in lines:
+        if line and _normalize(line) not in seen:
+            seen.add(_normalize(line))
+            goals.append(line)
+    return goals
+
+
+class RoadmapCatalog:
+    """
+    Pre-generated roadmaps for popular goals, with their ranked courses per topic.
+
+    Entries are keyed by normalized goal and mode and persisted to SQLite, so every worker
+    process serves the same catalog. `lookup` accepts exact matches and near matches: goals
+    whose terms (stopwords and phrasing like "I want to become" removed) overlap the catalogued
+    goal's terms by at least `near_threshold` (Jaccard). Near matching is local and needs no
+    embedding or LLM call.
+
+    Args:
+        path (str): SQLite file backing the catalog.
+        near_threshold (float): Minimum term overlap (0..1) for a near match; 1 disables them.
+    """
+
+    SYNC_INTERVAL = 30.0  # Seconds between checks for entries written by other processes
+
+    def __init__(self, path: str, near_threshold: float = 0.8):
+        self.path = path
+        self.near_threshold = near_threshold
+        self._terms: Dict[str, tuple] = {}  # key -> (mode, goal terms)
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._holder = uuid.uuid4().hex
+        self._stats = {"lookups": 0, "exact_hits": 0, "near_hits": 0, "misses": 0}
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(goal: str, mode: str) -> str:
+        return f"{_normalize(mode)}|{_normalize(goal)}"
+
+    def _sync(self):
+        """Reloads the goal terms used for near matching (the catalog holds a few hundred entries)."""
+        rows = self._conn().execute("SELECT key, goal, mode FROM roadmap_catalog").fetchall()
+        with self._lock:
+            self._terms = {key: (mode, _goal_terms(goal)) for key, goal, mode in rows}
+            self._last_sync = time.monotonic()
+
+    def _load(self, key: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT goal, mode, roadmap, courses, generated_at FROM roadmap_catalog WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        goal, mode, roadmap, courses, generated_at = row
+        return {"goal": goal, "mode": mode, "roadmap": roadmap, "courses": json.loads(courses),
+                "generated_at": generated_at}
+
+    def get(self, goal: str, mode: str) -> Optional[Dict]:
+        """Returns the exact catalog entry for the goal and mode, or None."""
+        return self._load(self._key(goal, mode))
+
+    def lookup(self, goal: str, mode: str) -> Optional[Dict]:
+        """
+        Finds a catalogued roadmap for the goal and mode, exactly or as a near match.
+
+        Returns:
+            Optional[Dict]: The entry ('goal', 'mode', 'roadmap', 'courses' as {topic: ranked
+            courses}, 'generated_at' and 'match' = "exact" or "near"), or None.
+        """
+        with self._lock:
+            self._stats["lookups"] += 1
+        entry = self.get(goal, mode)
+        match = "exact"
+        if entry is None and self.near_threshold < 1:
+            if time.monotonic() - self._last_sync > self.SYNC_INTERVAL:
+                self._sync()
+            terms = _goal_terms(goal)
+            best_key, best = None, 0.0
+            with self._lock:
+                for key, (entry_mode, entry_terms) in self._terms.items():
+                    if entry_mode != _normalize(mode) or not terms or not entry_terms:
+                        continue
+                    similarity = len(terms & entry_terms) / len(terms | entry_terms)
+                    if similarity > best:
+                        best_key, best = key, similarity
+            if best_key is not None and best >= self.near_threshold:
+                entry = self._load(best_key)
+                match = "near"
+
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats[f"{match}_hits"] += 1
+        if entry is not None:
+            entry["match"] = match
+        return entry
+
+    def store(self, goal: str, mode: str, roadmap: str, courses: Dict[str, List[Dict]]):
+        """Adds or replaces the catalog entry for the goal and mode."""
+        key = self._key(goal, mode)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO roadmap_catalog (key, goal, mode, roadmap, courses, generated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, goal, _normalize(mode), roadmap, json.dumps(courses), time.time()),
+        )
+        with self._lock:
+            self._terms[key] = (_normalize(mode), _goal_terms(goal))
+
+    def claim_refresh(self, lease: float) -> bool:
+        """
+        Claims (or renews) the right to run a refresh pass for `lease` seconds. Only one worker
+        process refreshes the catalog at a time; the others keep serving it.
+        """
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.execute(
+                "INSERT OR IGNORE INTO roadmap_catalog_lease (name, holder, expires_at) VALUES ('refresh', '', 0)"
+            )
+            cursor = conn.execute(
+                "UPDATE roadmap_catalog_lease SET holder = ?, expires_at = ? "
+                "WHERE name = 'refresh' AND (expires_at < ? OR holder = ?)",
+                (self._holder, now + lease, now, self._holder),
+            )
+        return cursor.rowcount == 1
+
+    def release_refresh(self):
+        self._conn().execute(
+            "UPDATE roadmap_catalog_lease SET expires_at = 0 WHERE name = 'refresh' AND holder = ?",
+            (self._holder,),
+        )
+
+    def stats(self) -> Dict:
+        (entries,) = self._conn().execute("SELECT COUNT(*) FROM roadmap_catalog").fetchone()
+        with self._lock:
+            stats = dict(self._stats)
+        hits = stats["exact_hits"] + stats["near_hits"]
+        stats["hit_rate"] = hits / stats["lookups"] if stats["lookups"] else 0.0
+        stats["entries"] = entries
+        return stats
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_roadmap_catalog() -> RoadmapCatalog:
+    """Returns the process-wide roadmap catalog."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                path = os.getenv("ROADMAP_CATALOG_PATH") or default_cache_path("roadmap_catalog.sqlite3")
+                _catalog = RoadmapCatalog(path, near_threshold=ROADMAP_CATALOG_NEAR_THRESHOLD)
+    return _catalog
+
+
+def build_entry(goal: str, mode: str) -> Dict:
+    """
+    Generates a roadmap and precomputes ranked courses for the goal and every learning section.
+    The course searches and rankings also land in their own caches on the way.
+
+    Returns:
+        Dict: 'roadmap' (text) and 'courses' ({topic: ranked courses}).
+    """
+    roadmap = generate_roadmap(goal, mode, use_cache=False)
+    parsed = parse_roadmap(roadmap)
+    topics = [goal] + [section.title for section in parsed.learning_sections]
+    searches = search_courses_batch(topics, num_results=10)
+    found = {item["topic"]: item["results"] for item in searches if item["results"]}
+    ranked = rank_courses_batch(goal, found) if found else {}
+    return {"roadmap": roadmap, "courses": ranked}
+
+
+def refresh_catalog(goals: List[str] = None, modes=ROADMAP_MODES, max_age: float = None,
+                    stop_event: threading.Event = None) -> Dict[str, int]:
+    """
+    Generates catalog entries that are missing or older than `max_age`, one goal × mode at a time.
+
+    Does nothing if another process holds the refresh lease. New roadmaps are also stored in the
+    semantic roadmap cache, so paraphrased goals are served without a new generation.
+
+    Returns:
+        Dict[str, int]: Counts of 'generated', 'fresh' (skipped) and 'errors' entries.
+    """
+    catalog = get_roadmap_catalog()
+    goals = load_catalog_goals() if goals is None else goals
+    max_age = ROADMAP_CATALOG_MAX_AGE if max_age is None else max_age
+    counts = {"generated": 0, "fresh": 0, "errors": 0}
+    if not catalog.claim_refresh(REFRESH_LEASE):
+        return counts
+
+    try:
+        for goal in goals:
+            for mode in modes:
+                if stop_event is not None and stop_event.is_set():
+                    return counts
+                entry = catalog.get(goal, mode)
+                if entry is not None and time.time() - entry["generated_at"] < max_age:
+                    counts["fresh"] += 1
+                    continue
+                if not catalog.claim_refresh(REFRESH_LEASE):
+                    return counts  # Lease lost (e.g. this pass stalled); another process took over
+                try:
+                    built = build_entry(goal, mode)
+                    catalog.store(goal, mode, built["roadmap"], built["courses"])
+                    roadmap_cache.store(goal, mode, built["roadmap"])
+                    counts["generated"] += 1
+                except Exception as e:
+                    print(f"🔴 Failed to pre-generate roadmap for '{goal}' ({mode}): {e}")
+                    counts["errors"] += 1
+                if stop_event is None:
+                    time.sleep(ROADMAP_CATALOG_DELAY)
+                elif stop_event.wait(ROADMAP_CATALOG_DELAY):
+                    return counts
+    finally:
+        catalog.release_refresh()
+    return counts
+
+
+_refresher = None
+_refresher_stop = threading.Event()
+
+
+def start_catalog_refresher(interval: float = None) -> threading.Thread:
+    """Starts a daemon thread that refreshes the catalog now and then every `interval` seconds."""
+    global _refresher
+    interval = interval or ROADMAP_CATALOG_REFRESH_INTERVAL
+    if _refresher is not None and _refresher.is_alive():
+        return _refresher
+
+    def run():
+        while not _refresher_stop.is_set():
+            try:
+                counts = refresh_catalog(stop_event=_refresher_stop)
+                if counts["generated"] or counts["errors"]:
+                    print(f"Roadmap catalog refreshed: {counts}")
+            except Exception as e:
+                print(f"🔴 Roadmap catalog refresh failed: {e}")
+            _refresher_stop.wait(interval)
+
+    _refresher_stop.clear()
+    _refresher = threading.Thread(target=run, name="roadmap-catalog-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+def stop_catalog_refresher():
+    """Asks the refresher thread to stop after its current generation."""
+    _refresher_stop.set()
+
+
+def roadmap_catalog_stats() -> Dict:
+    return get_roadmap_catalog().stats()
+
+
+if __name__ == "__main__":
+    # For cron-style scheduling: python roadmap_catalog.py [--force]
+    parser = argparse.ArgumentParser(description="Pre-generate the roadmap catalog for popular goals.")
+    parser.add_argument("--goals", default=None, help="Goal list file (default: ROADMAP_CATALOG_GOALS).")
+    parser.add_argument("--force", action="store_true", help="Regenerate every entry, even fresh ones.")
+    args = parser.parse_args()
+    result = refresh_catalog(goals=load_catalog_goals(args.goals), max_age=0 if args.force else None)
+    print(f"Roadmap catalog: {result}")
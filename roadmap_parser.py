@@ -0,0 +1,265 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Heading of the career guidance section, however it is marked up: "**Career Guidance & Next
+# Steps:**", "**Career Guidance & Next Steps**:", "## Career Guidance and Next Steps", ...
+_CAREER_HEADING = r"Career Guidance\s*(?:&|and)\s*Next Steps"
+
+# A new section starts after a blank line with "Level N:" (or Phase/Module), the career
+# guidance heading or the total time line, each optionally as a Markdown heading or in bold.
+SECTION_BOUNDARY = re.compile(
+    r"\n(?:[ \t]*\n)+[ \t]*(?=(?:[#*]+\s*)?(?:(?:Level|Phase|Module)\s*\d+[:\-]|"
+    + _CAREER_HEADING + r"[*:\t ]*$|Total Estimated Time for Roadmap:))",
+    re.MULTILINE,
+)
+_CAREER = re.compile(_CAREER_HEADING, re.IGNORECASE)
+
+# Bold labels the roadmap prompt asks for in every section, in order, and the Section
+# attribute each one is parsed into.
+SECTION_FIELDS = {
+    "Topics to Cover": "topics",
+    "Estimated Time": "estimated_time",
+    "Key Tools/Technologies": "tools",
+    "Mini-Projects/Exercises": "projects",
+    "Resources/Learning Strategies": "resources",
+}
+
+_FIELD_LABEL = re.compile(r"\*\*(" + "|".join(re.escape(label) for label in SECTION_FIELDS) + r"):\*\*")
+# Markdown, emojis and inline time estimates are dropped from headings in one substitution
+_HEADING_NOISE = re.compile(
+    r"\(?\s*(?:Estimated Time|Total Time Estimate):.*"
+    r"|[\*#\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF"
+    r"\U00002702-\U000027B0\U000024C2-\U0001F251]",
+    re.UNICODE,
+)
+_LEVEL_PREFIX = re.compile(r"^(?:Level|Phase|Module)\s*\d+\s*[:\-]\s*", re.IGNORECASE)
+_TOTAL_TIME = re.compile(r"Total Estimated Time for Roadmap:\**\s*(.+)")
+_BOLD_ITALIC = re.compile(r"\*\*\*(.*?)\*\*\*")
+_BOLD = re.compile(r"\*\*(.*?)\*\*")
+_BULLET = re.compile(r"^\s*[*-]\s*(.*)", re.MULTILINE)
+
+PARSE_CACHE_SIZE = 128
+
+
+@dataclass(frozen=True)
+class Section:
+    """
+    One parsed roadmap section.
+
+    `kind` is "section" for learning sections (Level/Phase/Module), "intro" for text before the
+    first section ("Here is your roadmap..."), "career" for career guidance and "total" for the
+    total time estimate. The labelled components are only filled in for learning sections.
+    """
+
+    index: int
+    heading: str
+    kind: str
+    body: str
+    raw: str
+    topics: str = ""
+    estimated_time: str = ""
+    tools: str = ""
+    projects: str = ""
+    resources: str = ""
+
+    @property
+    def title(self) -> str:
+        """The heading without its "Level N:" prefix, e.g. "Python Basics"; usable as a search topic."""
+        return _LEVEL_PREFIX.sub("", self.heading).strip() or self.heading
+
+    @property
+    def fields(self) -> Dict[str, str]:
+        """The labelled components keyed by their label in the roadmap, e.g. "Topics to Cover"."""
+        return {label: getattr(self, attr) for label, attr in SECTION_FIELDS.items()}
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class Roadmap:
+    """A parsed roadmap. Instances are shared by the parse cache, so they are immutable."""
+
+    content_hash: str
+    sections: Tuple[Section, ...]
+    total_time: str = ""
+
+    @property
+    def learning_sections(self) -> List[Section]:
+        return [s for s in self.sections if s.kind == "section"]
+
+    @property
+    def intro(self) -> Optional[Section]:
+        return next((s for s in self.sections if s.kind == "intro"), None)
+
+    @property
+    def career_guidance(self) -> Optional[Section]:
+        return next((s for s in self.sections if s.kind == "career"), None)
+
+    def to_dict(self) -> Dict:
+        intro, career = self.intro, self.career_guidance
+        return {
+            "content_hash": self.content_hash,
+            "intro": intro.raw if intro else "",
+            "sections": [s.to_dict() for s in self.learning_sections],
+            "career_guidance": career.body if career else "",
+            "total_time": self.total_time,
+        }
+
+
+def split_sections(roadmap: str) -> List[str]:
+    """Splits a full roadmap into the raw text of its sections (empty sections are dropped)."""
+    return [s.strip() for s in SECTION_BOUNDARY.split(roadmap.strip()) if s.strip()]
+
+
+def parse_section(section_text: str, index: int = 0) -> Section:
+    """
+    Parses the raw text of one section in a single pass over its labels.
+
+    Args:
+        section_text (str): The section, starting with its heading line.
+        index (int): Position of the section in the roadmap.
+
+    Returns:
+        Section: The parsed section.
+    """
+    section_text = section_text.strip()
+    heading_line, _, body = section_text.partition("\n")
+    heading = _HEADING_NOISE.sub("", heading_line).strip().rstrip(":").strip() or "Roadmap Section"
+    body = body.strip()
+
+    if _CAREER.match(heading):
+        kind = "career"
+    elif "Total Estimated Time for Roadmap:" in section_text:
+        kind = "total"
+    elif index == 0 and not _LEVEL_PREFIX.match(heading) and not _FIELD_LABEL.search(body):
+        # A preamble without a section heading or labels: nothing to search courses for
+        kind = "intro"
+    else:
+        kind = "section"
+
+    components = {}
+    if kind == "section":
+        # Each label's value runs up to the next label; text before the first label is ignored
+        labels = list(_FIELD_LABEL.finditer(body))
+        for match, following in zip(labels, labels[1:] + [None]):
+            end = following.start() if following else len(body)
+            components[SECTION_FIELDS[match.group(1)]] = body[match.end():end].strip()
+
+    return Section(index=index, heading=heading, kind=kind, body=body, raw=section_text, **components)
+
+
+def content_hash(roadmap: str) -> str:
+    """Stable identifier of a roadmap's text."""
+    return hashlib.sha256(roadmap.encode("utf-8")).hexdigest()
+
+
+_cache: "OrderedDict[str, Roadmap]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_roadmap(roadmap: str) -> Roadmap:
+    """
+    Parses a full roadmap into its sections, career guidance and total time.
+
+    Results are memoized by content hash (the PARSE_CACHE_SIZE most recent roadmaps), so
+    Streamlit reruns and repeated API requests for the same roadmap do not parse it again.
+    """
+    key = content_hash(roadmap)
+    with _cache_lock:
+        parsed = _cache.get(key)
+        if parsed is not None:
+            _cache.move_to_end(key)
+            return parsed
+
+    sections = tuple(parse_section(text, idx) for idx, text in enumerate(split_sections(roadmap)))
+    total_time = ""
+    for section in sections:
+        if section.kind == "total":
+            match = _TOTAL_TIME.search(section.raw)
+            total_time = match.group(1).strip().strip("*").strip() if match else ""
+    parsed = Roadmap(content_hash=key, sections=sections, total_time=total_time)
+
+    with _cache_lock:
+        _cache[key] = parsed
+        while len(_cache) > PARSE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return parsed
+
+
+def format_special_body(body: str) -> str:
+    """Turns bold markup into <strong> tags and normalizes bullets, for HTML-rendered sections."""
+    body = _BOLD_ITALIC.sub(r"<strong>\1</strong>", body)
+    body = _BOLD.sub(r"<strong>\1</strong>", body)
+    return _BULLET.sub(r"- \1", body)
+
+
+class SectionStream:
+    """
+    Incrementally splits streamed roadmap text into sections.
+
+    Feed it text chunks as they arrive; a section is returned as soon as the next section's
+    heading shows it is complete. Only the unfinished section is kept and rescanned, so the
+    cost per chunk does not grow with the length of the roadmap.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._emitted = 0
+
+    def feed(self, chunk: str) -> List[Section]:
+        """Adds a chunk of streamed text and returns the sections it completed (possibly none)."""
+        self._pending += chunk
+        completed = []
+        # Keep the last boundary's heading in the pending text: it begins the next section
+        start = 0
+        for match in SECTION_BOUNDARY.finditer(self._pending):
+            completed.append(self._pending[start:match.start()])
+            start = match.end()
+        self._pending = self._pending[start:]
+        return self._parsed(completed)
+
+    def finish(self) -> List[Section]:
+        """Returns the final section once the stream has ended."""
+        remaining, self._pending = self._pending, ""
+        return self._parsed([remaining])
+
+    def _parsed(self, texts: List[str]) -> List[Section]:
+        sections = []
+        for text in texts:
+            if text.strip():
+                sections.append(parse_section(text, self._emitted))
+                self._emitted += 1
+        return sections
+
+
+if __name__ == "__main__":
+    # Quick self-check against the format the roadmap prompt produces
+    sample = """**Level 1: Python Fundamentals** (Estimated Time: 4 weeks)
+**Topics to Cover:** Variables, control flow, functions.
+**Estimated Time:** 4 weeks
+**Key Tools/Technologies:** Python 3, VS Code.
+**Mini-Projects/Exercises:** A CLI to-do list.
+**Resources/Learning Strategies:** Official tutorial, practice daily.
+
+**Career Guidance & Next Steps:**
+* Advice on job roles related to the goal: Junior Python Developer.
+* Tips for building a portfolio: Put three projects on GitHub.
+
+**Total Estimated Time for Roadmap:** 4 weeks"""
+    intro = "Here is your personalized roadmap to becoming a Python developer:"
+    parsed = parse_roadmap(intro + "\n\n" + sample)
+    assert [s.kind for s in parsed.sections] == ["intro", "section", "career", "total"], parsed.sections
+    assert parsed.to_dict()["intro"] == intro and len(parsed.learning_sections) == 1
+    for career_heading in ("**Career Guidance & Next Steps:**", "**Career Guidance & Next Steps**:",
+                           "## Career Guidance & Next Steps", "Career Guidance and Next Steps:"):
+        parsed = parse_roadmap(sample.replace("**Career Guidance & Next Steps:**", career_heading))
+        assert [s.kind for s in parsed.sections] == ["section", "career", "total"], parsed.sections
+        assert parsed.career_guidance.body.startswith("* Advice on job roles"), parsed.career_guidance
+        assert parsed.learning_sections[0].resources == "Official tutorial, practice daily."
+        assert parsed.total_time == "4 weeks"
+    print("roadmap_parser self-check passed.")
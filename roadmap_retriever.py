@@ -0,0 +1,139 @@
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, List, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from course_index import tokenize
+from roadmap_parser import parse_roadmap
+
+# Retrieval modes for follow-up questions:
+#   "stuff" - the whole roadmap is the context (no retrieval at all)
+#   "local" - section lookup plus BM25 over the roadmap's chunks, without any API call
+#   "dense" - FAISS similarity search over embedded chunks (one embedding call per question)
+#   "auto"  - "stuff" if the roadmap fits FOLLOW_UP_STUFF_TOKENS, "dense" if it exceeds
+#             FOLLOW_UP_DENSE_MIN_TOKENS, otherwise "local"
+RETRIEVAL_MODES = ("auto", "stuff", "local", "dense")
+FOLLOW_UP_RETRIEVAL_MODE = os.getenv("FOLLOW_UP_RETRIEVAL_MODE", "auto")
+FOLLOW_UP_STUFF_TOKENS = int(os.getenv("FOLLOW_UP_STUFF_TOKENS", 3000))
+FOLLOW_UP_DENSE_MIN_TOKENS = int(os.getenv("FOLLOW_UP_DENSE_MIN_TOKENS", 12000))
+
+# "Level 3", "phase 2", "section 4", "step 1", ...
+_SECTION_REF = re.compile(r"\b(?:level|phase|module|section|step)\s*(\d+)\b", re.IGNORECASE)
+_SECTION_NUMBER = re.compile(r"^(?:level|phase|module)\s*(\d+)", re.IGNORECASE)
+_CAREER_REF = re.compile(r"\b(career|jobs?|roles?|portfolio|network\w*|interviews?|soft skills?|salary)\b",
+                         re.IGNORECASE)
+_TOTAL_REF = re.compile(r"\b(total|overall|whole|entire)\b.*\b(time|duration|long)\b|\bhow long\b", re.IGNORECASE)
+
+_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), enough to pick a retrieval mode."""
+    return len(text) // 4 + 1
+
+
+def choose_mode(roadmap_text: str, mode: str = None) -> str:
+    """Resolves "auto" (or None) to the concrete retrieval mode for this roadmap."""
+    mode = mode or FOLLOW_UP_RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}'. Expected one of {RETRIEVAL_MODES}.")
+    if mode != "auto":
+        return mode
+    tokens = estimate_tokens(roadmap_text)
+    if tokens <= FOLLOW_UP_STUFF_TOKENS:
+        return "stuff"
+    if tokens > FOLLOW_UP_DENSE_MIN_TOKENS:
+        return "dense"
+    return "local"
+
+
+@lru_cache(maxsize=64)
+def _chunks(roadmap_text: str) -> Tuple[Tuple[str, str, Tuple[str, ...]], ...]:
+    """
+    Splits a roadmap into (section key, chunk text, terms) along its sections; sections longer
+    than a chunk are split further. The section key is "level:N", "career", "total" or "".
+    """
+    chunks = []
+    for section in parse_roadmap(roadmap_text).sections:
+        number = _SECTION_NUMBER.match(section.heading)
+        if number:
+            key = f"level:{int(number.group(1))}"
+        else:
+            key = section.kind if section.kind != "section" else ""
+        for text in _splitter.split_text(section.raw):
+            chunks.append((key, text, tuple(tokenize(text))))
+    return tuple(chunks)
+
+
+def _bm25(query_terms: List[str], docs: List[Tuple[str, ...]], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """BM25 score of every doc for the query (the roadmap's chunks are few, so no index is kept)."""
+    n_docs = len(docs)
+    avg_len = sum(len(d) for d in docs) / n_docs if n_docs else 0.0
+    df = Counter(term for doc in docs for term in set(doc))
+    scores = []
+    for doc in docs:
+        tf = Counter(doc)
+        score = 0.0
+        for term in set(query_terms):
+            if not tf[term]:
+                continue
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            norm = k1 * (1 - b + b * len(doc) / avg_len) if avg_len else k1
+            score += idf * tf[term] * (k1 + 1) / (tf[term] + norm)
+        scores.append(score)
+    return scores
+
+
+def local_context(roadmap_text: str, question: str, k: int = 3) -> List[str]:
+    """
+    Picks context chunks without embeddings. A question that names sections ("Level 3"), or
+    asks about careers or the overall duration, gets exactly those sections; any other question
+    gets the `k` best BM25 matches.
+    """
+    chunks = _chunks(roadmap_text)
+    wanted = {f"level:{int(n)}" for n in _SECTION_REF.findall(question)}
+    if _CAREER_REF.search(question):
+        wanted.add("career")
+    if _TOTAL_REF.search(question):
+        wanted.add("total")
+
+    selected = [i for i, (key, _, _) in enumerate(chunks) if key in wanted]
+    if not selected:
+        scores = _bm25(tokenize(question), [terms for _, _, terms in chunks])
+        ranked = sorted((i for i in range(len(chunks)) if scores[i] > 0), key=lambda i: scores[i], reverse=True)
+        selected = ranked[:k]
+    if not selected:
+        # Nothing matched at all; the start of the roadmap is the most general context
+        selected = list(range(min(k, len(chunks))))
+    # Keep roadmap order, so the model reads the sections as written
+    return [chunks[i][1] for i in sorted(selected)]
+
+
+def retrieve_context(roadmap_text: str, question: str, mode: str = None, k: int = 3,
+                     dense_search: Callable[[str, str, int], List[str]] = None) -> Tuple[str, str]:
+    """
+    Builds the context for answering a question about a roadmap.
+
+    Args:
+        roadmap_text (str): The full roadmap.
+        question (str): The user's question.
+        mode (str): One of RETRIEVAL_MODES; None uses FOLLOW_UP_RETRIEVAL_MODE.
+        k (int): Number of chunks to retrieve in "local" and "dense" modes.
+        dense_search (Callable): Function (roadmap_text, question, k) -> chunk texts, used in
+                                 "dense" mode.
+
+    Returns:
+        Tuple[str, str]: The context text and the mode that was actually used.
+    """
+    mode = choose_mode(roadmap_text, mode)
+    if mode == "stuff":
+        return roadmap_text, mode
+    if mode == "dense":
+        if dense_search is None:
+            raise ValueError("Dense retrieval needs a dense_search function.")
+        return "\n\n".join(dense_search(roadmap_text, question, k)), mode
+    return "\n\n".join(local_context(roadmap_text, question, k)), mode
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from roadmap_parser import content_hash
+from sqlite_cache import default_cache_path, transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roadmaps (
+    roadmap_id  TEXT PRIMARY KEY,
+    goal        TEXT NOT NULL,
+    mode        TEXT NOT NULL,
+    roadmap     TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_roadmaps_lru ON roadmaps (accessed_at);
+"""
+
+ROADMAP_STORE_MAX_ENTRIES = int(os.getenv("ROADMAP_STORE_MAX_ENTRIES", 20000))
+ROADMAP_STORE_MAX_AGE = float(os.getenv("ROADMAP_STORE_MAX_AGE", 30 * 24 * 3600))
+
+
+class RoadmapStore:
+    """
+    Roadmaps served by the API, addressed by the hash of their text (`roadmap_id`).
+
+    Clients refer to a roadmap by its id instead of uploading its text again. Everything derived
+    from a roadmap is keyed by the same hash: its parsed sections (roadmap_parser.parse_roadmap)
+    and its follow-up FAISS index (vector_store_manager), so a stored roadmap is only ever parsed
+    and indexed once per process. Entries live in SQLite, shared by worker processes; entries
+    older than `max_age` or beyond `max_entries` (least recently used first) are evicted.
+
+    Args:
+        path (str): SQLite file backing the store.
+        max_entries (int): Maximum number of stored roadmaps.
+        max_age (float): Seconds a roadmap is kept after it was last stored or read.
+    """
+
+    # Reads only bump accessed_at when it is older than this, so hot roadmaps don't turn reads into writes
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path: str, max_entries: int = 20000, max_age: float = 30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {"puts": 0, "hits": 0, "misses": 0, "evictions": 0}
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat: str, n: int = 1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def put(self, roadmap: str, goal: str = "", mode: str = "") -> str:
+        """Stores a roadmap (a no-op apart from its access time if it is already stored) and returns its id."""
+        roadmap_id = content_hash(roadmap)
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            # The first goal a roadmap was generated for is kept; the text is the same either way
+            conn.execute(
+                "INSERT INTO roadmaps (roadmap_id, goal, mode, roadmap, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (roadmap_id) DO UPDATE SET accessed_at = excluded.accessed_at",
+                (roadmap_id, goal or "", mode or "", roadmap, now, now),
+            )
+            evicted = conn.execute(
+                "DELETE FROM roadmaps WHERE accessed_at < ? OR roadmap_id IN "
+                "(SELECT roadmap_id FROM roadmaps ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (now - self.max_age, self.max_entries),
+            ).rowcount
+        self._count("puts")
+        self._count("evictions", evicted)
+        return roadmap_id
+
+    def get(self, roadmap_id: str) -> Optional[Dict]:
+        """Returns {'roadmap_id', 'goal', 'mode', 'roadmap'} for a stored roadmap, or None."""
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT goal, mode, roadmap, accessed_at FROM roadmaps WHERE roadmap_id = ?", (roadmap_id,)
+        ).fetchone()
+        if row is None or now - row[3] > self.max_age:
+            self._count("misses")
+            return None
+        if now - row[3] > self.TOUCH_INTERVAL:
+            self._conn().execute("UPDATE roadmaps SET accessed_at = ? WHERE roadmap_id = ?", (now, roadmap_id))
+        self._count("hits")
+        return {"roadmap_id": roadmap_id, "goal": row[0], "mode": row[1], "roadmap": row[2]}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        (stats["entries"],) = self._conn().execute("SELECT COUNT(*) FROM roadmaps").fetchone()
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_roadmap_store() -> RoadmapStore:
+    """Returns the process-wide roadmap store."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = os.getenv("ROADMAP_STORE_PATH") or default_cache_path("roadmap_store.sqlite3")
+                _store = RoadmapStore(path, max_entries=ROADMAP_STORE_MAX_ENTRIES, max_age=ROADMAP_STORE_MAX_AGE)
+    return _store
+
+
+def roadmap_store_stats() -> Dict:
+    """Returns put/hit/miss/eviction counters and the number of stored roadmaps."""
+    return get_roadmap_store().stats()
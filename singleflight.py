@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+
+def fingerprint(*parts: Any) -> str:
+    """
+    Builds a stable key for a request from its parts. Strings are lower-cased and
+    whitespace-collapsed, so "Python  Backend" and "python backend" coalesce.
+    """
+    def normalize(value):
+        if isinstance(value, str):
+            return " ".join(value.lower().split())
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    payload = json.dumps([normalize(p) for p in parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in flight, further callers
+    with the same key wait for it and share its result (or its exception) instead of starting
+    their own upstream call.
+
+    Works for threads (`do`, for sync FastAPI handlers) and for asyncio tasks (`ado`).
+
+    Args:
+        name (str): Name reported in stats.
+        timeout (float): Default seconds a caller waits for an in-flight call before giving up
+                         with TimeoutError. None waits forever.
+    """
+
+    def __init__(self, name: str, timeout: float = None):
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: float = None) -> Any:
+        """
+        Runs `fn()` unless an identical call is already in flight, in which case waits for it.
+
+        The first caller runs `fn` on its own thread. Followers wait at most `timeout` seconds
+        (default: the instance timeout) and then raise TimeoutError; the first caller's call
+        keeps running and still serves anyone else waiting on it.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                self._count("errors")
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout if timeout is not None else self.timeout):
+            self._count("timeouts")
+            raise TimeoutError(f"Timed out waiting for in-flight '{self.name}' call")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], timeout: float = None) -> Any:
+        """
+        Async counterpart of `do`: awaits `fn()` unless an identical call is already in flight.
+
+        The shared call runs as its own task, so a caller that times out or is cancelled does not
+        cancel the upstream call for the others.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            task = self._tasks.get(key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._tasks[key] = task
+                self._stats["executions"] += 1
+                task.add_done_callback(lambda t: self._finish_task(key, t))
+            else:
+                self._stats["coalesced"] += 1
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout if timeout is not None else self.timeout)
+        except asyncio.TimeoutError:
+            if task.done():
+                raise  # The upstream call itself timed out; propagate its error as-is
+            self._count("timeouts")
+            raise TimeoutError(f"Timed out waiting for in-flight '{self.name}' call")
+
+    def _finish_task(self, key: str, task: asyncio.Task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            if not task.cancelled() and task.exception() is not None:
+                self._stats["errors"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Returns call counters; `coalesced` is the number of upstream calls saved."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls) + len(self._tasks)
+        return stats
@@ -0,0 +1,246 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Default location for all on-disk caches. Relative paths are resolved against the
+# working directory, the same way roadmap_agent resolves 'prompts/'.
+CACHE_DIR = os.getenv("PATHPILOT_CACHE_DIR", ".cache")
+
+# Lookup states returned by SQLiteCache.lookup()
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace     TEXT NOT NULL,
+    key           TEXT NOT NULL,
+    value         TEXT NOT NULL,
+    created_at    REAL NOT NULL,
+    accessed_at   REAL NOT NULL,
+    refresh_until REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_lru ON cache_entries (namespace, accessed_at);
+"""
+
+
+def default_cache_path(filename: str = "pathpilot_cache.sqlite3") -> str:
+    """Returns the path of a file inside the shared cache directory, creating the directory if needed."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, filename)
+
+
+class SQLiteCache:
+    """
+    A small JSON key/value cache stored in SQLite with TTL expiry, stale-while-revalidate
+    and size-bounded LRU eviction.
+
+    The database runs in WAL mode and every thread gets its own connection, so a single
+    cache file can be shared by several threads and by several uvicorn worker processes.
+
+    Args:
+        path (str): Path of the SQLite database file.
+        namespace (str): Logical name of the cache. Several caches can share one file.
+        ttl (float): Seconds an entry is served as fresh.
+        stale_ttl (float): Extra seconds after `ttl` during which the entry is still served,
+                           flagged as stale so the caller can revalidate it in the background.
+        max_entries (int): Maximum number of entries kept in the namespace; the least recently
+                           used entries are evicted beyond that.
+    """
+
+    # Hits only bump accessed_at when it is older than this, so hot keys don't
+    # turn every read into a write.
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, path: str, namespace: str = "default", ttl: float = 86400,
+                 stale_ttl: float = 0, max_entries: int = 10000):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat: str, n: int = 1):
+        with self._stats_lock:
+            self._stats[stat] += n
+
+    def lookup(self, key: str) -> Tuple[Optional[Any], str]:
+        """
+        Looks up a key and reports how fresh it is.
+
+        Returns:
+            tuple: (value, state) where state is FRESH, STALE or MISS. The value is None on a miss.
+        """
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value, created_at, accessed_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None, MISS
+
+        value, created_at, accessed_at = row
+        age = now - created_at
+        if age > self.ttl + self.stale_ttl:
+            self._count("misses")
+            return None, MISS
+
+        if now - accessed_at > self.TOUCH_INTERVAL:
+            self._conn().execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+        if age > self.ttl:
+            self._count("stale_hits")
+            return json.loads(value), STALE
+        self._count("hits")
+        return json.loads(value), FRESH
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Returns the value for `key` if it is fresh or stale, otherwise `default`."""
+        value, state = self.lookup(key)
+        return default if state == MISS else value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Returns a {key: value} dict of every non-expired key in `keys`. Missing keys are left out."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        # Stay well below SQLite's host parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn().execute(
+                f"SELECT key, value, created_at FROM cache_entries "
+                f"WHERE namespace = ? AND key IN ({placeholders})",
+                (self.namespace, *batch),
+            ).fetchall()
+            for key, value, created_at in rows:
+                if now - created_at <= self.ttl + self.stale_ttl:
+                    found[key] = json.loads(value)
+        if found:
+            conn = self._conn()
+            with transaction(conn):
+                conn.executemany(
+                    "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    [(now, self.namespace, key) for key in found],
+                )
+        self._count("hits", len(found))
+        self._count("misses", len(keys) - len(found))
+        return found
+
+    def set(self, key: str, value: Any):
+        """Stores a JSON-serializable value, replacing any previous entry for `key`."""
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]):
+        """Stores several JSON-serializable values in a single transaction."""
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at, refresh_until) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                [(self.namespace, key, json.dumps(value), now, now) for key, value in items.items()],
+            )
+            self._evict(conn)
+        self._count("sets", len(items))
+
+    def delete(self, key: str):
+        self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+
+    def clear(self):
+        """Removes every entry in this cache's namespace."""
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def claim_refresh(self, key: str, lease: float = 30.0) -> bool:
+        """
+        Atomically claims the right to revalidate a stale entry.
+
+        Only one caller across all threads and processes gets True until the lease expires
+        or the entry is rewritten, which keeps a stale hot key from triggering a refresh storm.
+        """
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE cache_entries SET refresh_until = ? "
+            "WHERE namespace = ? AND key = ? AND refresh_until < ?",
+            (now + lease, self.namespace, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def _evict(self, conn: sqlite3.Connection):
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY accessed_at LIMIT ?)",
+                (self.namespace, self.namespace, overflow),
+            )
+            self._count("evictions", overflow)
+
+    def __len__(self) -> int:
+        (count,) = self._conn().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns this process's hit/miss counters plus the current number of entries."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["stale_hits"]) / lookups if lookups else 0.0
+        stats["entries"] = len(self)
+        return stats
+
+
+class transaction:
+    """BEGIN IMMEDIATE / COMMIT around a block on an autocommit connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def cache_key(*parts: Any) -> str:
+    """Builds a cache key from normalized parts: strings are lower-cased and whitespace-collapsed."""
+    normalized: List[str] = []
+    for part in parts:
+        if isinstance(part, str):
+            part = " ".join(part.lower().split())
+        normalized.append(str(part))
+    return "|".join(normalized)
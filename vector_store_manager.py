@@ -0,0 +1,147 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import metrics
+from roadmap_parser import content_hash
+from singleflight import SingleFlight
+
+
+class VectorStoreManager:
+    """
+    FAISS vector stores of roadmaps, keyed by a hash of the roadmap text.
+
+    A roadmap is split and embedded once: its index is saved under `directory/<hash>` with
+    FAISS save_local and loaded back from there by any process or after a restart. Loaded
+    indexes stay in memory, least recently used first out once they exceed `max_bytes`.
+    Concurrent requests for the same new roadmap build its index once.
+
+    Args:
+        directory (str): Directory holding one sub-directory per persisted index.
+        embeddings (Embeddings): Embedding model used to build and load indexes.
+        max_bytes (int): Approximate memory budget for loaded indexes (vectors plus chunk text).
+        max_disk_entries (int): Maximum number of persisted indexes; the oldest are deleted.
+        chunk_size (int): Characters per chunk when splitting a roadmap.
+        chunk_overlap (int): Characters shared by consecutive chunks.
+    """
+
+    def __init__(self, directory: str, embeddings: Embeddings, max_bytes: int = 64 * 1024 * 1024,
+                 max_disk_entries: int = 1000, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.max_bytes = max_bytes
+        self.max_disk_entries = max_disk_entries
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+            add_start_index=True,
+        )
+        self._stores: "OrderedDict[str, tuple]" = OrderedDict()  # hash -> (FAISS, size in bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("vector_store_build")
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "builds": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+    @staticmethod
+    def _size(store: FAISS) -> int:
+        """Approximate memory held by an index: float32 vectors plus the chunk texts."""
+        vectors = store.index.ntotal * store.index.d * 4
+        texts = sum(len(doc.page_content) for doc in store.docstore._dict.values())
+        return vectors + texts
+
+    def _remember(self, key: str, store: FAISS):
+        size = self._size(store)
+        with self._lock:
+            if key in self._stores:
+                return
+            self._stores[key] = (store, size)
+            self._bytes += size
+            # Keep at least the newest index, even if it alone exceeds the budget
+            while self._bytes > self.max_bytes and len(self._stores) > 1:
+                _, (_, evicted_size) = self._stores.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def _load_or_build(self, key: str, roadmap_text: str) -> FAISS:
+        path = os.path.join(self.directory, key)
+        if os.path.isdir(path):
+            try:
+                # Only indexes this manager saved itself are ever loaded from this directory
+                store = FAISS.load_local(path, self.embeddings, allow_dangerous_deserialization=True)
+                os.utime(path)  # Marks the index as recently used for disk pruning
+                self._count("disk_hits")
+                self._remember(key, store)
+                return store
+            except Exception as e:
+                print(f"🔴 Could not load vector store {key[:12]}, rebuilding it: {e}")
+
+        doc = Document(page_content=roadmap_text, metadata={"source": "roadmap"})
+        chunks = self.splitter.split_documents([doc])
+        # Includes embedding the chunks; embedding API time is also recorded on its own by CachedEmbeddings
+        with metrics.stage("vector_store", "faiss_build"):
+            store = FAISS.from_documents(chunks, self.embeddings)
+        self._count("builds")
+        self._remember(key, store)
+        try:
+            self._save(path, store)
+        except OSError as e:
+            print(f"🔴 Could not persist vector store {key[:12]}: {e}")
+        return store
+
+    def _save(self, path: str, store: FAISS):
+        # Save to a private directory first and rename it, so readers never see a half-written index
+        tmp = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}")
+        store.save_local(tmp)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # Another process saved the same roadmap first
+        self._prune_disk()
+
+    def _prune_disk(self):
+        entries = [e for e in os.scandir(self.directory) if e.is_dir() and not e.name.startswith(".")]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def get(self, roadmap_text: str) -> FAISS:
+        """
+        Returns the vector store for a roadmap, loading or building it only if it is not in memory.
+
+        Args:
+            roadmap_text (str): The full roadmap text.
+
+        Returns:
+            FAISS: The roadmap's vector store.
+        """
+        key = content_hash(roadmap_text)
+        with self._lock:
+            cached = self._stores.get(key)
+            if cached is not None:
+                self._stores.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return cached[0]
+        return self._flight.do(key, lambda: self._load_or_build(key, roadmap_text))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_memory"] = len(self._stores)
+            stats["bytes"] = self._bytes
+        return stats